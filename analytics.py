@@ -0,0 +1,388 @@
+"""
+Analytics Engine
+Dashboard statistics from a single aggregate query over complaints:
+counts by status / priority / department, citizen rating, SLA breaches and
+resolution time (average plus percentiles from an hourly histogram).
+
+The dashboard reads incrementally maintained rollup tables, so its cost
+does not grow with the number of complaints. Rebuild or check them with:
+
+    python analytics.py --rebuild   # recompute rollups from complaints
+    python analytics.py --verify    # compare rollups with a full-table scan
+
+Results are also cached per department. A cached result is reused while
+the department's change version (see change_versions.py; 'all' for the
+all-departments view) is unchanged, so a write in any worker or instance
+makes the next read recompute. The TTL only bounds how stale the
+clock-dependent open SLA breach count can get.
+"""
+
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+
+from change_versions import bump_versions, read_versions
+from db_config import db_connection, get_db, get_db_cursor, format_sql, is_postgres
+
+# Resolution times are bucketed by whole hours; slower ones share the last bucket
+RESOLUTION_HISTOGRAM_MAX_HOURS = 24 * 90
+
+def resolution_hours_sql(pg):
+    """Hours between created_at and resolved_at (both ISO text columns)"""
+    if pg:
+        return "EXTRACT(EPOCH FROM (CAST(resolved_at AS TIMESTAMP) - CAST(created_at AS TIMESTAMP))) / 3600.0"
+    return "(julianday(resolved_at) - julianday(created_at)) * 24.0"
+
+def resolution_bucket_sql(pg):
+    """Whole-hour histogram bucket, clamped to [0, RESOLUTION_HISTOGRAM_MAX_HOURS]"""
+    hours = resolution_hours_sql(pg)
+    if pg:
+        return f"LEAST(GREATEST(CAST(FLOOR({hours}) AS INTEGER), 0), {RESOLUTION_HISTOGRAM_MAX_HOURS})"
+    return f"MIN(MAX(CAST({hours} AS INTEGER), 0), {RESOLUTION_HISTOGRAM_MAX_HOURS})"
+
+RESOLVED_SQL = "status = 'Resolved' AND resolved_at IS NOT NULL"
+SLA_TRACKED_SQL = "sla_deadline IS NOT NULL AND status <> 'Rejected'"
+
+def histogram_percentile(histogram, q):
+    """
+    Smallest whole number of hours within which a fraction q of the
+    resolutions completed, from {hour_bucket: count}
+    """
+    total = sum(histogram.values())
+    if not total:
+        return 0
+    rank = q * total
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket + 1
+    return max(histogram) + 1
+
+def empty_totals():
+    return {'total': 0, 'by_status': {}, 'by_priority': {}, 'by_department': {},
+            'rated': 0, 'rating_sum': 0.0, 'resolved': 0, 'resolution_hours_sum': 0.0,
+            'histogram': {}, 'sla_tracked': 0, 'sla_breached': 0, 'open_overdue': 0}
+
+def breakdown_key(value):
+    """Key in the by_* breakdowns; missing values (NULL, or ''/0 as the rollups store them) are 'Unknown'"""
+    return str(value) if value not in (None, '', 0) else 'Unknown'
+
+def add_breakdowns(totals, status, priority, department, n):
+    # A missing status counts as 'Pending', as in rollup_contribution()
+    for field, value in (('by_status', status or 'Pending'), ('by_priority', priority),
+                         ('by_department', department)):
+        key = breakdown_key(value)
+        totals[field][key] = totals[field].get(key, 0) + n
+
+def add_group(totals, row):
+    """Fold one aggregate row (department, status, priority, bucket, counters) into totals"""
+    n = row['n'] or 0
+    totals['total'] += n
+    add_breakdowns(totals, row['status'], row['priority'], row['department'], n)
+    totals['rated'] += row['rated'] or 0
+    totals['rating_sum'] += float(row['rating_sum'] or 0)
+    totals['sla_tracked'] += row['sla_tracked'] or 0
+    totals['sla_breached'] += row['sla_breached'] or 0
+    if row['status'] != 'Resolved':
+        totals['open_overdue'] += row['sla_breached'] or 0
+    if row['resolution_bucket'] is not None:
+        bucket = int(row['resolution_bucket'])
+        totals['resolved'] += n
+        totals['resolution_hours_sum'] += max(float(row['resolution_hours_sum'] or 0), 0.0)
+        totals['histogram'][bucket] = totals['histogram'].get(bucket, 0) + n
+    return totals
+
+def summarize(totals):
+    """Dashboard payload from folded totals"""
+    resolved = totals['resolved']
+    tracked = totals['sla_tracked']
+    return {
+        "total_complaints": totals['total'],
+        "avg_citizen_rating": round(totals['rating_sum'] / totals['rated'], 1) if totals['rated'] else 0,
+        "rating_count": totals['rated'],
+        "avg_resolution_hours": round(totals['resolution_hours_sum'] / resolved, 1) if resolved else 0,
+        "resolution_hours": {
+            "resolved": resolved,
+            "p50": histogram_percentile(totals['histogram'], 0.50),
+            "p90": histogram_percentile(totals['histogram'], 0.90),
+            "p95": histogram_percentile(totals['histogram'], 0.95)
+        },
+        "sla": {
+            "tracked": tracked,
+            "breached": totals['sla_breached'],
+            "breach_rate": round(totals['sla_breached'] / tracked, 3) if tracked else 0,
+            "open_overdue": totals['open_overdue']
+        },
+        "by_status": totals['by_status'],
+        "by_priority": totals['by_priority'],
+        "by_department": totals['by_department']
+    }
+
+def scan_dashboard(department=None, now=None):
+    """Dashboard from one aggregate pass over the complaints table (used to verify the rollups)"""
+    now = (now or datetime.now()).isoformat()
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        pg = is_postgres(conn)
+        query = f'''SELECT department, status, priority,
+                           CASE WHEN {RESOLVED_SQL} THEN {resolution_bucket_sql(pg)} END AS resolution_bucket,
+                           COUNT(*) AS n,
+                           COUNT(citizen_feedback_rating) AS rated,
+                           SUM(citizen_feedback_rating) AS rating_sum,
+                           SUM(CASE WHEN {RESOLVED_SQL} THEN {resolution_hours_sql(pg)} END) AS resolution_hours_sum,
+                           SUM(CASE WHEN {SLA_TRACKED_SQL} THEN 1 ELSE 0 END) AS sla_tracked,
+                           SUM(CASE WHEN {SLA_TRACKED_SQL} AND COALESCE(resolved_at, ?) > sla_deadline
+                                    THEN 1 ELSE 0 END) AS sla_breached
+                    FROM complaints {'WHERE department = ?' if department else ''}
+                    GROUP BY department, status, priority, resolution_bucket'''
+        params = (now, department) if department else (now,)
+        cursor.execute(format_sql(query, conn), params)
+        totals = empty_totals()
+        for row in cursor.fetchall():
+            add_group(totals, row)
+    return summarize(totals)
+
+# ============= ROLLUPS =============
+# complaint_rollups holds per (department, day, status, priority) counters and
+# complaint_resolution_histogram the resolution-hour buckets per (department, day).
+# Every complaint write moves that complaint's contribution from its old row
+# to its new one in the same transaction, so the dashboard reads a table
+# whose size depends on days x departments, not on the number of complaints.
+
+ROLLUP_COUNTERS = ('complaints', 'rated', 'rating_sum', 'resolved', 'resolution_hours_sum',
+                   'sla_tracked', 'resolved_late')
+
+# Columns a complaint row needs for rollup_contribution()
+ROLLUP_SOURCE_COLUMNS = ('department', 'created_at', 'status', 'priority', 'citizen_feedback_rating',
+                         'resolved_at', 'sla_deadline')
+# Read a complaint's rollup columns before and after a write ('?' placeholder)
+ROLLUP_SOURCE_SQL = f"SELECT {', '.join(ROLLUP_SOURCE_COLUMNS)} FROM complaints WHERE id = ?"
+
+def rollup_contribution(c):
+    """(rollup key, counters, histogram bucket or None) that one complaint adds"""
+    created = c.get('created_at') or ''
+    status = c.get('status') or 'Pending'
+    key = (c.get('department') or '', created[:10], status, int(c.get('priority') or 0))
+    rating = c.get('citizen_feedback_rating')
+    counters = dict.fromkeys(ROLLUP_COUNTERS, 0)
+    counters.update(complaints=1, rated=int(rating is not None), rating_sum=float(rating or 0),
+                    sla_tracked=int(bool(c.get('sla_deadline')) and status != 'Rejected'))
+    bucket = None
+    resolved_at = c.get('resolved_at')
+    if status == 'Resolved' and resolved_at and created:
+        hours = max((datetime.fromisoformat(resolved_at) - datetime.fromisoformat(created)).total_seconds() / 3600, 0.0)
+        counters.update(resolved=1, resolution_hours_sum=hours,
+                        resolved_late=int(bool(c.get('sla_deadline')) and resolved_at > c['sla_deadline']))
+        bucket = min(int(hours), RESOLUTION_HISTOGRAM_MAX_HOURS)
+    return key, counters, bucket
+
+def _fold(rollups, histogram, c, sign=1):
+    key, counters, bucket = rollup_contribution(c)
+    acc = rollups.setdefault(key, dict.fromkeys(ROLLUP_COUNTERS, 0))
+    for name, value in counters.items():
+        acc[name] += sign * value
+    if bucket is not None:
+        hkey = (key[0], key[1], bucket)
+        histogram[hkey] = histogram.get(hkey, 0) + sign
+
+def _write_rollups(cursor, conn, rollups, histogram):
+    """Add the given deltas to the rollup tables (upsert)"""
+    names = ', '.join(ROLLUP_COUNTERS)
+    updates = ', '.join(f"{n} = complaint_rollups.{n} + excluded.{n}" for n in ROLLUP_COUNTERS)
+    rows = [(*key, *(acc[n] for n in ROLLUP_COUNTERS)) for key, acc in rollups.items() if any(acc.values())]
+    if rows:
+        cursor.executemany(format_sql(f'''INSERT INTO complaint_rollups (department, day, status, priority, {names})
+                                          VALUES (?, ?, ?, ?, {', '.join('?' * len(ROLLUP_COUNTERS))})
+                                          ON CONFLICT (department, day, status, priority) DO UPDATE SET {updates}''', conn),
+                           rows)
+    rows = [(*key, n) for key, n in histogram.items() if n]
+    if rows:
+        cursor.executemany(format_sql('''INSERT INTO complaint_resolution_histogram (department, day, hour_bucket, complaints)
+                                         VALUES (?, ?, ?, ?)
+                                         ON CONFLICT (department, day, hour_bucket) DO UPDATE SET
+                                             complaints = complaint_resolution_histogram.complaints + excluded.complaints''', conn),
+                           rows)
+
+def apply_rollup_change(cursor, conn, before=None, after=None):
+    """
+    Move one complaint's contribution from its `before` state to its `after`
+    state (None for insert / delete). Runs in the caller's transaction, which
+    should have read `before` with select_for_update().
+    """
+    rollups, histogram = {}, {}
+    if before is not None:
+        _fold(rollups, histogram, dict(before), -1)
+    if after is not None:
+        _fold(rollups, histogram, dict(after), 1)
+    _write_rollups(cursor, conn, rollups, histogram)
+
+def rebuild_rollups(cursor, conn, batch_size=5000):
+    """Recompute both rollup tables from the complaints table; returns the complaint count"""
+    cursor.execute('DELETE FROM complaint_rollups')
+    cursor.execute('DELETE FROM complaint_resolution_histogram')
+    cursor.execute(f"SELECT {', '.join(ROLLUP_SOURCE_COLUMNS)} FROM complaints")
+    rollups, histogram = {}, {}
+    count = 0
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            _fold(rollups, histogram, dict(row))
+        count += len(rows)
+    _write_rollups(cursor, conn, rollups, histogram)
+    # Cached dashboards in every worker are keyed on these versions
+    bump_versions(cursor, conn, ['all', *sorted({f"dept:{key[0]}" for key in rollups if key[0]})])
+    return count
+
+def compute_dashboard(department=None, now=None):
+    """Dashboard from the rollup tables plus a live count of open complaints past their SLA"""
+    now = (now or datetime.now()).isoformat()
+    where = 'WHERE department = ?' if department else ''
+    params = (department,) if department else ()
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql(f'''SELECT department, status, priority,
+                                             {', '.join(f'SUM({n}) AS {n}' for n in ROLLUP_COUNTERS)}
+                                      FROM complaint_rollups {where}
+                                      GROUP BY department, status, priority''', conn), params)
+        groups = cursor.fetchall()
+        cursor.execute(format_sql(f'''SELECT hour_bucket, SUM(complaints) AS n FROM complaint_resolution_histogram {where}
+                                      GROUP BY hour_bucket''', conn), params)
+        buckets = cursor.fetchall()
+        # Open breaches depend on the clock, so they are counted live (partial index on open complaints)
+        cursor.execute(format_sql(f'''SELECT COUNT(*) AS n FROM complaints
+                                      WHERE status NOT IN ('Resolved', 'Rejected') AND sla_deadline < ?
+                                      {'AND department = ?' if department else ''}''', conn), (now, *params))
+        open_overdue = cursor.fetchone()['n'] or 0
+
+    totals = empty_totals()
+    for row in groups:
+        n = row['complaints'] or 0
+        if not n:
+            continue
+        totals['total'] += n
+        add_breakdowns(totals, row['status'], row['priority'], row['department'], n)
+        totals['rated'] += row['rated'] or 0
+        totals['rating_sum'] += float(row['rating_sum'] or 0)
+        totals['resolved'] += row['resolved'] or 0
+        totals['resolution_hours_sum'] += float(row['resolution_hours_sum'] or 0)
+        totals['sla_tracked'] += row['sla_tracked'] or 0
+        totals['sla_breached'] += row['resolved_late'] or 0
+    totals['histogram'] = {int(row['hour_bucket']): row['n'] for row in buckets if row['n']}
+    totals['open_overdue'] = open_overdue
+    totals['sla_breached'] += open_overdue
+    return summarize(totals)
+
+def dashboards_match(a, b, tolerance=0.1):
+    """
+    Same dashboard, allowing averages to differ by `tolerance`: the scan sums
+    julianday() differences, the rollups Python datetime differences, and a
+    tiny difference can flip the rounding of an average.
+    """
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(dashboards_match(a[k], b[k], tolerance) for k in a)
+    if isinstance(a, float) or isinstance(b, float):
+        return (isinstance(a, (int, float)) and isinstance(b, (int, float))
+                and abs(a - b) <= tolerance + 1e-9)
+    return a == b
+
+class AnalyticsEngine:
+    """Per-department cache in front of compute_dashboard(), keyed on change versions"""
+
+    ALL = '*'
+
+    def __init__(self, ttl_seconds=60, compute=compute_dashboard):
+        self.ttl_seconds = ttl_seconds
+        self.compute = compute
+        self._lock = threading.Lock()
+        self._cache = {}    # department -> (expires_at, change version, payload)
+        self._epoch = 0     # bumped by every invalidation
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'compute_ms': 0.0}
+
+    def dashboard(self, department=None):
+        """Cached dashboard for one department (or all); adds generated_at and cached flags"""
+        key = department or self.ALL
+        # Read before computing: a write in between only makes the stored version older than the result
+        version = self._version(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > now and entry[1] == version:
+                self._stats['hits'] += 1
+                return dict(entry[2], cached=True)
+            self._stats['misses'] += 1
+            epoch = self._epoch
+
+        start = time.monotonic()
+        payload = self.compute(department)
+        payload['generated_at'] = datetime.now().isoformat()
+        elapsed = (time.monotonic() - start) * 1000
+
+        with self._lock:
+            self._stats['compute_ms'] += elapsed
+            # A write that landed while we were computing makes this result stale
+            if self._epoch == epoch:
+                self._cache[key] = (time.monotonic() + self.ttl_seconds, version, payload)
+        return dict(payload, cached=False)
+
+    def _version(self, key):
+        """Change version of the scope this dashboard depends on; None (TTL only) if it cannot be read"""
+        scope = 'all' if key == self.ALL else f"dept:{key}"
+        try:
+            return read_versions([scope])[scope][0]
+        except Exception as e:
+            print(f"⚠️  Change version read error: {e}")
+            return None
+
+    def invalidate(self, *departments):
+        """Drop this worker's cached results for the given departments and the
+        all-departments view (everything when called without arguments); other
+        workers notice the write through the change versions"""
+        with self._lock:
+            if departments:
+                for key in {d for d in departments if d} | {self.ALL}:
+                    self._cache.pop(key, None)
+            else:
+                self._cache.clear()
+            self._epoch += 1
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_departments'] = len(self._cache)
+        computed = stats['misses']
+        stats['avg_compute_ms'] = round(stats.pop('compute_ms') / computed, 1) if computed else 0.0
+        return stats
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("📊 Analytics Rollups")
+    print("=" * 60)
+    if '--rebuild' in sys.argv:
+        conn = get_db()
+        cursor = get_db_cursor(conn)
+        try:
+            if not is_postgres(conn):
+                cursor.execute('BEGIN IMMEDIATE')
+            count = rebuild_rollups(cursor, conn)
+            conn.commit()
+            print(f"✅ Rollups rebuilt from {count} complaint(s)")
+        finally:
+            conn.close()
+    elif '--verify' in sys.argv:
+        now = datetime.now()
+        from_rollups, from_scan = compute_dashboard(now=now), scan_dashboard(now=now)
+        if dashboards_match(from_rollups, from_scan):
+            print("✅ Rollups match a full scan of complaints")
+        else:
+            print("❌ Rollups differ from a full scan (run with --rebuild):")
+            print("   rollups:", json.dumps(from_rollups, sort_keys=True))
+            print("   scan:   ", json.dumps(from_scan, sort_keys=True))
+    else:
+        print("Usage: python analytics.py --rebuild | --verify")
+    print("=" * 60)
@@ -4,35 +4,42 @@
 # Supports: Hindi, Marathi, Tamil, Telugu, Bengali, Gujarati, Kannada, Malayalam, Punjabi, Odia, Assamese, Urdu
 # =================================================================
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
-from db_config import get_db, init_db, is_postgres, get_db_cursor, format_sql  # PostgreSQL support
+from db_config import db_connection, init_db, is_postgres, get_db_cursor, format_sql, get_pool_stats, select_for_update  # PostgreSQL support
+from geo_index import geo_cell, indexed_cell, cell_count, cells_around, candidate_filter_sql
+from geo_distance import haversine, haversine_many, pairs_within
+from text_index import signature, similarity, index_complaint, text_candidates, signatures_for, decode_signature
+from cache import TieredCache, make_key, normalize_text
+from pipeline import BackgroundPipeline, StageTimer
+from analytics import AnalyticsEngine, apply_rollup_change, rebuild_rollups, ROLLUP_SOURCE_SQL
+from escalation import EscalationScheduler, stored_escalation, current_escalation_level
+from outbox import EmailOutbox, SMTPSession, build_message, email_configured
+from jobs import JobRunner
+from otp_store import make_otp_store
+from rate_limit import make_rate_limiter
+from change_versions import conditional, bump_versions, complaint_scopes
+from events import EventBus, record_event, purge_events
+from export import EXPORT_FORMATS, export_query, export_chunks
+from search import search_complaints, search_terms
+from hotspots import HotspotEngine
+from keyword_classifier import classify, EMERGENCY_CATEGORIES
 import os
 import time
 import random
 import hashlib
+import base64
 import requests
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-import threading
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Translation imports
-try:
-    from deep_translator import GoogleTranslator
-    TRANSLATION_AVAILABLE = True
-except ImportError:
-    print("⚠️  deep-translator not installed. Run: pip install deep-translator")
-    TRANSLATION_AVAILABLE = False
+# Translation (optional deep-translator dependency, see translation.py)
+from translation import TranslationService, TRANSLATION_AVAILABLE
 
 # ============= CONFIGURATION =============
 app = Flask(__name__)
@@ -78,21 +85,23 @@ SUPPORTED_LANGUAGES = {
     'ur': {'name': 'Urdu', 'native': 'اردو', 'flag': '🇮🇳'}
 }
 
+# Translations are cached per (source, target, text) in memory and in cache_entries
+translator = TranslationService(TieredCache(
+    'translation',
+    max_memory_entries=int(os.getenv('TRANSLATION_CACHE_MEMORY_ENTRIES', 5000)),
+    ttl_seconds=int(os.getenv('TRANSLATION_CACHE_TTL_HOURS', 2160)) * 3600,
+    max_db_rows=int(os.getenv('TRANSLATION_CACHE_MAX_ROWS', 100000))
+))
+
 def translate_text(text, from_lang='auto', to_lang='en'):
     """Universal translator for Bharat languages"""
     if not TRANSLATION_AVAILABLE or not text or text.strip() == '':
         return text
-    
-    try:
-        if from_lang == to_lang:
-            return text
-        
-        translator = GoogleTranslator(source=from_lang, target=to_lang)
-        translated = translator.translate(text)
-        return translated if translated else text
-    except Exception as e:
-        print(f"Translation error: {e}")
-        return text
+    return translator.translate(text, from_lang, to_lang)
+
+def translate_texts(texts, from_lang='auto', to_lang='en'):
+    """Translate many strings at once (cached, batched into as few requests as possible)"""
+    return translator.translate_many(texts, from_lang, to_lang)
 
 # ============= 📧 EMAIL CONFIGURATION =============
 EMAIL_CONFIG = {
@@ -100,13 +109,34 @@ EMAIL_CONFIG = {
     'SMTP_PORT': int(os.getenv('SMTP_PORT', 587)),
     'SENDER_EMAIL': os.getenv('SENDER_EMAIL', ''),
     'SENDER_PASSWORD': os.getenv('SENDER_PASSWORD', ''),
-    'SENDER_NAME': os.getenv('SENDER_NAME', 'भारत ई-शिकायत प्रणाली | Bharat E-Grievance')
+    'SENDER_NAME': os.getenv('SENDER_NAME', 'भारत ई-शिकायत प्रणाली | Bharat E-Grievance'),
+    # Set SMTP_USE_TLS=0 for a local debugging SMTP server without STARTTLS
+    'SMTP_USE_TLS': os.getenv('SMTP_USE_TLS', '1') == '1'
 }
 
+# Outgoing mail is queued in the email_outbox table and delivered by sender threads (see outbox.py)
+email_outbox = EmailOutbox(
+    EMAIL_CONFIG,
+    senders=int(os.getenv('EMAIL_SENDERS', 2)),
+    batch_size=int(os.getenv('EMAIL_BATCH_SIZE', 20)),
+    max_attempts=int(os.getenv('EMAIL_MAX_ATTEMPTS', 6)),
+    base_backoff_seconds=int(os.getenv('EMAIL_RETRY_BASE_SECONDS', 30))
+)
+
 # ============= AI & SLA CONFIG =============
 # Google Gemini Configuration - Using REST API for Python 3.14 compatibility
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+GEMINI_API_URL = os.getenv('GEMINI_API_URL', "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent")
+# Bump whenever the analysis prompt changes so cached results are not reused
+AI_PROMPT_VERSION = 'v1'
+
+# Gemini results cache (in-process LRU + shared DB table, see cache.py)
+ai_cache = TieredCache(
+    'ai_analysis',
+    max_memory_entries=int(os.getenv('AI_CACHE_MEMORY_ENTRIES', 2000)),
+    ttl_seconds=int(os.getenv('AI_CACHE_TTL_HOURS', 720)) * 3600,
+    max_db_rows=int(os.getenv('AI_CACHE_MAX_ROWS', 50000))
+)
 
 if GEMINI_API_KEY:
     AI_AVAILABLE = True
@@ -127,45 +157,29 @@ SLA_TIMES = {
     6: 48, 7: 72, 8: 96, 9: 120, 10: 168
 }
 
-ESCALATION_LEVELS = {
-    'WARNING': 50, 'URGENT': 75, 'CRITICAL': 90, 'OVERDUE': 100
-}
-
 # ============= EMAIL HELPER FUNCTIONS =============
 
 def send_email_async(to_email, subject, html_content, attachments=None):
+    """Queue an email in the outbox; delivery and retries happen on the sender threads"""
     if not to_email: return
-    thread = threading.Thread(target=send_email, args=(to_email, subject, html_content, attachments))
-    thread.daemon = True
-    thread.start()
+    try:
+        return email_outbox.enqueue(to_email, subject, html_content, attachments)
+    except Exception as e:
+        print(f"❌ Email queue error: {str(e)}")
+        return False
 
 def send_email(to_email, subject, html_content, attachments=None):
+    """Send immediately over a one-off SMTP session (used by the test-email diagnostic)"""
     try:
-        if 'your.email' in EMAIL_CONFIG['SENDER_EMAIL']:
+        if not email_configured(EMAIL_CONFIG):
             print(f"⚠️  Email skipped: Config not set. (To: {to_email})")
             return False
         
-        msg = MIMEMultipart('alternative')
-        msg['From'] = f"{EMAIL_CONFIG['SENDER_NAME']} <{EMAIL_CONFIG['SENDER_EMAIL']}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(html_content, 'html', 'utf-8'))
-        
-        if attachments:
-            for file_path in attachments:
-                if os.path.exists(file_path):
-                    with open(file_path, 'rb') as f:
-                        part = MIMEBase('application', 'octet-stream')
-                        part.set_payload(f.read())
-                        encoders.encode_base64(part)
-                        part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(file_path)}')
-                        msg.attach(part)
-        
-        with smtplib.SMTP(EMAIL_CONFIG['SMTP_SERVER'], EMAIL_CONFIG['SMTP_PORT']) as server:
-            server.starttls()
-            server.login(EMAIL_CONFIG['SENDER_EMAIL'], EMAIL_CONFIG['SENDER_PASSWORD'])
-            server.send_message(msg)
+        session = SMTPSession(EMAIL_CONFIG)
+        try:
+            session.send(build_message(EMAIL_CONFIG, to_email, subject, html_content, attachments))
+        finally:
+            session.close()
         
         print(f"✅ Email sent successfully to {to_email}")
         return True
@@ -218,6 +232,28 @@ def get_email_template(template_type, data, lang='en'):
         </body></html>
         """
     
+    if template_type == 'sla_escalation':
+        return f"""
+        <html><head>{base_style}</head><body>
+            <div class="container">
+                <div class="header"><h1>⏰ SLA Escalation: {data['level']}</h1></div>
+                <div class="content">
+                    <p>The following complaint has moved from <strong>{data['previous_level']}</strong>
+                       to <strong>{data['level']}</strong> and needs attention.</p>
+                    <div class="info-box">
+                        <p><strong>Tracking ID:</strong> {data['tracking_id']}</p>
+                        <p><strong>Category:</strong> {data['category']}</p>
+                        <p><strong>Priority:</strong> P-{data['priority']}</p>
+                        <p><strong>Status:</strong> {data['status']}</p>
+                        <p><strong>SLA Deadline:</strong> {data['sla_deadline']}</p>
+                        {map_link_html}
+                    </div>
+                </div>
+                <div class="footer">भारत ई-शिकायत प्रणाली | Bharat E-Grievance</div>
+            </div>
+        </body></html>
+        """
+    
     return "<html><body>Notification</body></html>"
 
 # ============= DATABASE FUNCTIONS =============
@@ -229,25 +265,35 @@ def hash_password(pw):
 def allowed_file(fn):
     return '.' in fn and fn.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def ai_cache_key(desc, cat):
+    """Cache key: normalized description + category + prompt version"""
+    return make_key(normalize_text(desc), cat or '', AI_PROMPT_VERSION)
+
+def ai_cache_stats():
+    """Cache counters plus the number of paid Gemini calls the cache avoided"""
+    stats = ai_cache.stats()
+    stats['gemini_calls_avoided'] = stats['memory_hits'] + stats['db_hits']
+    return stats
+
 def analyze_with_ai(desc, cat):
     """Analyze complaint using Google Gemini AI or fallback to keyword analysis"""
     
-    # Try Gemini AI REST API first
+    # Try Gemini AI REST API first (cached: identical complaints cost one API call)
     if AI_AVAILABLE and GEMINI_API_KEY:
-        try:
-            prompt = f"""Analyze this complaint and provide ONLY a JSON response (no markdown, no code blocks):
-
-Description: {desc}
-Category: {cat}
-
-Provide JSON response with these exact fields:
-{{
-    "priority": 1-10 (1=highest urgency, 10=lowest),
-    "sentiment": "positive/neutral/negative",
-    "detected_department": "department name"
-}}
+        key = ai_cache_key(desc, cat)
+        cached = ai_cache.get(key)
+        if cached is not None:
+            print(f"♻️  Cached AI Analysis: Priority={cached.get('priority')}, Dept={cached.get('detected_department')}")
+            return dict(cached)
+        result = gemini_analyze(desc, cat)
+        if result is not None:
+            ai_cache.set(key, result)
+            return result
+    
+    return keyword_analysis(desc, cat)
 
-Priority Level Guide:
+# Shared by the single-complaint prompt below and the batch prompt in batch_analysis.py
+AI_ANALYSIS_GUIDE = """Priority Level Guide:
 - P1 (2h): Life-threatening, live wires, major water bursts, gas leaks.
 - P2 (4h): Very High. Sewage overflow, large potholes on main roads.
 - P3 (8h): High. Street lights out in high-risk areas, hospital equipment issues.
@@ -261,97 +307,78 @@ Department detection rules:
 - Garbage/cleaning/sanitation → "Sanitation_Dept"
 - Electricity/power/transformer → "Power_Dept"
 - Hospital/clinic/medical → "Health_Dept"
-- Everything else → "General_Admin_Dept"
+- Everything else → "General_Admin_Dept\""""
+
+def gemini_analyze(desc, cat):
+    """One Gemini REST call; returns the analysis dict or None on any failure"""
+    try:
+        prompt = f"""Analyze this complaint and provide ONLY a JSON response (no markdown, no code blocks):
+
+Description: {desc}
+Category: {cat}
+
+Provide JSON response with these exact fields:
+{{
+    "priority": 1-10 (1=highest urgency, 10=lowest),
+    "sentiment": "positive/neutral/negative",
+    "detected_department": "department name"
+}}
+
+{AI_ANALYSIS_GUIDE}
 
 Analyze carefully and detect the correct department and priority."""
-            
-            # Call Gemini REST API
-            headers = {'Content-Type': 'application/json'}
-            payload = {
-                "contents": [{
-                    "parts": [{
-                        "text": prompt
-                    }]
+        
+        # Call Gemini REST API
+        headers = {'Content-Type': 'application/json'}
+        payload = {
+            "contents": [{
+                "parts": [{
+                    "text": prompt
                 }]
-            }
+            }]
+        }
+        
+        response = requests.post(
+            f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
+            headers=headers,
+            json=payload,
+            timeout=10
+        )
+        
+        if response.status_code == 200:
+            result_data = response.json()
+            result_text = result_data['candidates'][0]['content']['parts'][0]['text'].strip()
             
-            response = requests.post(
-                f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-                headers=headers,
-                json=payload,
-                timeout=10
-            )
+            # Clean up response (remove markdown code blocks if present)
+            result_text = result_text.replace('```json', '').replace('```', '').strip()
             
-            if response.status_code == 200:
-                result_data = response.json()
-                result_text = result_data['candidates'][0]['content']['parts'][0]['text'].strip()
-                
-                # Clean up response (remove markdown code blocks if present)
-                result_text = result_text.replace('```json', '').replace('```', '').strip()
-                
-                result = json.loads(result_text)
-                
-                # Ensure we have all required fields
-                if 'detected_department' not in result:
-                    result['detected_department'] = None
-                if 'priority' not in result:
-                    result['priority'] = 5
-                if 'sentiment' not in result:
-                    result['sentiment'] = 'neutral'
-                    
-                print(f"✅ Gemini AI Analysis: Priority={result['priority']}, Dept={result.get('detected_department')}")
-                return result
-            else:
-                print(f"⚠️  Gemini API Error: {response.status_code}, falling back to keyword analysis")
+            result = json.loads(result_text)
             
-        except Exception as e:
-            print(f"⚠️  Gemini AI Error: {e}, falling back to keyword analysis")
-    
-    # Fallback: Simple keyword-based detection
-    desc_lower = desc.lower()
-    detected_dept = None
-    
-    # Keywords for department detection
-    if any(word in desc_lower for word in ['electricity', 'power', 'transformer', 'current', 'voltage', 'बिजली', 'विद्युत']):
-        detected_dept = 'Power_Dept'
-    elif any(word in desc_lower for word in ['water', 'pipe', 'leak', 'sewage', 'drainage', 'पानी', 'नाली']):
-        detected_dept = 'Water_Supply_Dept'
-    elif any(word in desc_lower for word in ['road', 'pothole', 'bridge', 'footpath', 'सड़क']):
-        detected_dept = 'Public_Works_Dept'
-    elif any(word in desc_lower for word in ['garbage', 'trash', 'waste', 'cleaning', 'sanitation', 'कचरा']):
-        detected_dept = 'Sanitation_Dept'
-    elif any(word in desc_lower for word in ['hospital', 'doctor', 'medical', 'health', 'clinic', 'अस्पताल']):
-        detected_dept = 'Health_Dept'
-    
-    pri = 7 # Default standard
-    
-    # Check for explicit Emergency categories
-    if cat in ['Power_Emergency', 'Water_Emergency', 'Safety_Emergency']:
-        pri = 1
+            # Ensure we have all required fields
+            if 'detected_department' not in result:
+                result['detected_department'] = None
+            if 'priority' not in result:
+                result['priority'] = 5
+            if 'sentiment' not in result:
+                result['sentiment'] = 'neutral'
+            result['prompt_version'] = AI_PROMPT_VERSION
+                
+            print(f"✅ Gemini AI Analysis: Priority={result['priority']}, Dept={result.get('detected_department')}")
+            return result
+        else:
+            print(f"⚠️  Gemini API Error: {response.status_code}, falling back to keyword analysis")
+        
+    except Exception as e:
+        print(f"⚠️  Gemini AI Error: {e}, falling back to keyword analysis")
+    return None
+
+def keyword_analysis(desc, cat):
+    """Fallback: keyword-based detection in one pass over the text (see keyword_classifier.py)"""
+    result = classify(desc, cat)
+    if cat in EMERGENCY_CATEGORIES:
         print(f"🚨 Categorical Emergency Detected: Priority forced to 1")
-    
-    # Critical (P1-P2) keywords (only check if not already forced to P1)
-    if pri > 1:
-        if any(word in desc_lower for word in ['emergency', 'danger', 'hazard', 'death', 'killed', 'safety', 'shock', 'blast', 'live wire', 'transformer', 'manhole', 'gas leak', 'मृत्यु', 'खतरा', 'அபாயம்']):
-            pri = 1
-        elif any(word in desc_lower for word in ['burst', 'overflow', 'pothole', 'accident', 'injury', 'fallen tree', 'flickering', 'dark', 'चोट', 'दुर्घटना']):
-            pri = 2
-    # High (P3-P4)
-    elif any(word in desc_lower for word in ['urgent', 'immediately', 'night', 'hospital', 'medical', 'dog bite', 'stray dog', 'तुरंत', 'உடனடியாக']):
-        pri = 3
-    elif any(word in desc_lower for word in ['block', 'smell', 'dead animal', 'गंध', 'दुर्गंध']):
-        pri = 4
-    # Low (P8-P10)
-    elif any(word in desc_lower for word in ['planning', 'beautification', 'future', 'suggestion', 'योजना', 'सौंदर्यीकरण']):
-        pri = 9
-    
-    print(f"📊 Keyword Analysis: Priority={pri}, Dept={detected_dept}")
-    return {
-        'priority': pri, 
-        'sentiment': 'neutral', 
-        'urgency': 'medium',
-        'detected_department': detected_dept
-    }
+    print(f"📊 Keyword Analysis: Priority={result['priority']}, Dept={result['detected_department']}")
+    return result
 
 def route_complaint(cat):
     ROUTES = {
@@ -373,108 +400,439 @@ def route_complaint(cat):
 def get_department_email(dept):
     """Retrieve email address for a specific department"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        query = format_sql("SELECT email FROM officials WHERE department = ? LIMIT 1", conn)
-        cursor.execute(query, (dept,))
-        result = cursor.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            query = format_sql("SELECT email FROM officials WHERE department = ? LIMIT 1", conn)
+            cursor.execute(query, (dept,))
+            result = cursor.fetchone()
         return result['email'] if result else None
     except Exception as e:
         print(f"Error getting dept email: {e}")
         return None
 
-def check_sla_status(complaint):
-    try:
-        if complaint['status'] in ['Resolved', 'Rejected']:
-            return 'NONE'
-        
-        deadline = datetime.fromisoformat(complaint['sla_deadline'])
-        now = datetime.now()
-        remaining = (deadline - now).total_seconds() / 3600
-        percent = (1 - (remaining / complaint['sla_hours'])) * 100
-        
-        if percent >= 100: return 'OVERDUE'
-        elif percent >= 90: return 'CRITICAL'
-        elif percent >= 75: return 'URGENT'
-        elif percent >= 50: return 'WARNING'
-        return 'NONE'
-    except:
-        return 'NONE'
-
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Calculate distance between two coordinates using Haversine formula
     Returns distance in meters
     """
-    from math import radians, sin, cos, sqrt, atan2
-    
-    # Earth's radius in meters
-    R = 6371000
-    
-    # Convert to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    distance = R * c
-    
-    return distance
+    return haversine(lat1, lon1, lat2, lon2)
+
+def _nearby_entry(complaint, distance, score=None, text_similarity=None):
+    """Summary of a nearby complaint as returned by the duplicate checks"""
+    desc = complaint['description'] or ''
+    entry = {
+        'id': complaint['id'],
+        'category': complaint['category'],
+        'description': desc[:100] + '...' if len(desc) > 100 else desc,
+        'distance': round(distance, 1),
+        'created_at': complaint['created_at'],
+        'status': complaint['status'],
+        'citizen_name': complaint['citizen_name'],
+        'priority': complaint['priority']
+    }
+    if score is not None:
+        entry['score'] = round(score, 3)
+        entry['text_similarity'] = round(text_similarity, 3) if text_similarity is not None else None
+    return entry
+
+DUPLICATE_CANDIDATE_COLUMNS = "id, category, description, latitude, longitude, created_at, status, citizen_name, priority"
+# Complaints with similar text are looked for this far away (GPS offsets, a different pin on the same road)
+DUPLICATE_TEXT_RADIUS_M = 200
+DUPLICATE_SCORE_THRESHOLD = 0.6
+# Accepted range for the client-supplied search radius (meters)
+DUPLICATE_MIN_RADIUS_M = 1
+DUPLICATE_MAX_RADIUS_M = 500
+# Bulk checks: points per request, and grid cells fetched for all of them together
+DUPLICATE_BULK_MAX_POINTS = 5000
+DUPLICATE_BULK_MAX_CELLS = 20000
+
+def duplicate_score(distance, text_similarity, category_match):
+    """
+    0..1: closeness within DUPLICATE_TEXT_RADIUS_M, text similarity (None
+    when either text is unknown) and same category. Without text, a
+    different category scores at most 0.5, below DUPLICATE_SCORE_THRESHOLD:
+    location alone only makes same-category reports duplicates.
+    """
+    proximity = max(0.0, 1 - distance / DUPLICATE_TEXT_RADIUS_M)
+    if text_similarity is None:
+        return 0.5 * proximity + 0.5 * category_match
+    return 0.45 * proximity + 0.45 * text_similarity + 0.1 * category_match
 
-def check_duplicate_complaints(lat, lon, category, radius_meters=20):
+def check_duplicate_complaints(lat, lon, category, radius_meters=20, description=None):
     """
-    Check if there are existing complaints within specified radius
-    Returns list of nearby complaints
+    Open complaints that are likely the same issue, best match first:
+    everything within radius_meters, plus (given a description) complaints
+    with similar text within DUPLICATE_TEXT_RADIUS_M, found through the LSH
+    buckets in text_index.py. Each is scored by duplicate_score(); with
+    similar text the same category raises the score instead of being
+    required, while matches on location alone must share the category.
     """
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        # Get all complaints with location data that are not resolved
-        query = '''SELECT id, category, description, latitude, longitude, 
-                   created_at, status, citizen_name, priority
-                   FROM complaints 
-                   WHERE latitude IS NOT NULL 
-                   AND longitude IS NOT NULL 
-                   AND status NOT IN ('Resolved', 'Rejected')'''
-        
-        cursor.execute(format_sql(query, conn))
-        complaints = cursor.fetchall()
-        conn.close()
-        
+        sig = signature(description) if description else None
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            # Only open complaints in the grid cells around the point (see geo_index.py)
+            cell_sql, params = candidate_filter_sql(lat, lon, radius_meters)
+            query = f"SELECT {DUPLICATE_CANDIDATE_COLUMNS} FROM complaints WHERE {cell_sql}"
+            cursor.execute(format_sql(query, conn), tuple(params))
+            complaints = {c['id']: dict(c) for c in cursor.fetchall()}
+            signatures = {}
+            if sig:
+                for c in text_candidates(cursor, conn, sig, lat, lon, DUPLICATE_TEXT_RADIUS_M,
+                                         [col.strip() for col in DUPLICATE_CANDIDATE_COLUMNS.split(',')]):
+                    signatures[c['id']] = decode_signature(c.pop('signature'))
+                    complaints.setdefault(c['id'], c)
+                signatures.update(signatures_for(cursor, conn, [cid for cid in complaints if cid not in signatures]))
+        complaints = list(complaints.values())
+        
+        # Exact distance test over all candidates in one batched call
+        distances = haversine_many(float(lat), float(lon),
+                                   [c['latitude'] for c in complaints],
+                                   [c['longitude'] for c in complaints])
         nearby = []
-        for complaint in complaints:
-            c_lat = complaint['latitude']
-            c_lon = complaint['longitude']
-            
-            # Calculate distance
-            distance = calculate_distance(float(lat), float(lon), c_lat, c_lon)
-            
-            # Check if within radius
-            if distance <= radius_meters:
-                # Check if same category or similar
-                if complaint['category'] == category or category == '' or category is None:
-                    nearby.append({
-                        'id': complaint['id'],
-                        'category': complaint['category'],
-                        'description': complaint['description'][:100] + '...' if len(complaint['description']) > 100 else complaint['description'],
-                        'distance': round(distance, 1),
-                        'created_at': complaint['created_at'],
-                        'status': complaint['status'],
-                        'citizen_name': complaint['citizen_name'],
-                        'priority': complaint['priority']
-                    })
-        
-        # Sort by distance
-        nearby.sort(key=lambda x: x['distance'])
+        for c, dist in zip(complaints, distances):
+            if dist > max(radius_meters, DUPLICATE_TEXT_RADIUS_M if sig else 0):
+                continue
+            # No stored signature (e.g. no description): unknown, not dissimilar
+            text_sim = similarity(sig, signatures[c['id']]) if sig and c['id'] in signatures else None
+            category_match = not category or c['category'] == category
+            score = duplicate_score(dist, text_sim, category_match)
+            # A same-category report within the radius always counts, as before scoring
+            if (dist <= radius_meters and category_match) or score >= DUPLICATE_SCORE_THRESHOLD:
+                nearby.append(_nearby_entry(c, dist, score, text_sim))
+        
+        # Best match first
+        nearby.sort(key=lambda x: (-x['score'], x['distance']))
         
         return nearby
     except Exception as e:
         print(f"Error checking duplicates: {e}")
         return []
 
+def check_duplicate_complaints_bulk(points, radius_meters=20):
+    """
+    Duplicate check for many incoming points at once (batch imports, clustering).
+    points: list of dicts with 'latitude', 'longitude' and optional 'category'.
+    Returns one list of nearby complaints per point, sorted by distance.
+    Raises ValueError when the points span more than DUPLICATE_BULK_MAX_CELLS cells.
+    """
+    results = [[] for _ in points]
+    located = [(i, float(p['latitude']), float(p['longitude'])) for i, p in enumerate(points)
+               if geo_cell(p.get('latitude'), p.get('longitude'))]
+    if not located:
+        return results
+    if sum(cell_count(la, lo, radius_meters) for _, la, lo in located) > DUPLICATE_BULK_MAX_CELLS:
+        raise ValueError(f"points and radius cover more than {DUPLICATE_BULK_MAX_CELLS} grid cells")
+
+    # Open complaints in every cell touched by any point, fetched in a few IN (...) queries
+    cells = sorted({cell for _, la, lo in located for cell in cells_around(la, lo, radius_meters)})
+    candidates = []
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        for start in range(0, len(cells), 500):
+            chunk = cells[start:start + 500]
+            query = f"SELECT {DUPLICATE_CANDIDATE_COLUMNS} FROM complaints WHERE geo_cell IN ({','.join('?' * len(chunk))})"
+            cursor.execute(format_sql(query, conn), tuple(chunk))
+            candidates.extend(cursor.fetchall())
+    if not candidates:
+        return results
+
+    pairs = pairs_within([la for _, la, _ in located], [lo for _, _, lo in located],
+                         [c['latitude'] for c in candidates], [c['longitude'] for c in candidates],
+                         radius_meters)
+    for pi, ci, dist in pairs:
+        idx = located[pi][0]
+        category = points[idx].get('category')
+        if not category or candidates[ci]['category'] == category:
+            results[idx].append(_nearby_entry(candidates[ci], dist))
+    for nearby in results:
+        nearby.sort(key=lambda x: x['distance'])
+    return results
+
+# ============= POST-SUBMISSION ENRICHMENT =============
+# submit() stores the complaint with keyword-based priority/department and
+# returns at once; translation, Gemini re-scoring, re-routing and the
+# notification emails run in the background pipeline below.
+
+ASYNC_ENRICHMENT = os.getenv('ASYNC_ENRICHMENT', '1') != '0'
+ENRICHMENT_WORKERS = int(os.getenv('ENRICHMENT_WORKERS', 2))
+ENRICHMENT_STALE_MINUTES = 10  # 'processing' rows older than this are retried
+# A failed enrichment is retried after ENRICHMENT_RETRY_MINUTES, doubling per attempt, up to ENRICHMENT_MAX_ATTEMPTS
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv('ENRICHMENT_MAX_ATTEMPTS', 5))
+ENRICHMENT_RETRY_MINUTES = int(os.getenv('ENRICHMENT_RETRY_MINUTES', 5))
+
+def choose_department(cat, ai):
+    """Standard routing by category, overridden by the analysis' detected department"""
+    if not cat or cat == 'Auto-Detected':
+        # No category provided - use AI detection
+        return ai.get('detected_department') or 'General_Admin_Dept'
+    dept = route_complaint(cat)
+    ai_dept = ai.get('detected_department')
+    if ai_dept and ai_dept != dept:
+        # AI suggests different department - use AI's suggestion as it analyzed the description
+        print(f"ℹ️ AI suggests {ai_dept} instead of {dept} based on description analysis")
+        dept = ai_dept
+    return dept
+
+def notify_complaint_submitted(complaint, description):
+    """Confirmation to the citizen and alert to the department"""
+    sla_dl = datetime.fromisoformat(complaint['sla_deadline'])
+    ai = json.loads(complaint['ai_analysis'] or '{}')
+    cat = complaint['category']
+    email_data = {
+        'citizen_name': complaint['citizen_name'],
+        'tracking_id': complaint['id'],
+        'category': cat if cat != 'Auto-Detected' else 'Auto-Detected by AI',
+        'priority': complaint['priority'],
+        'department': complaint['department'],
+        'sla_deadline': sla_dl.strftime("%Y-%m-%d %H:%M"),
+        'sla_hours': complaint['sla_hours'],
+        'ai_sentiment': ai.get('sentiment', 'Neutral'),
+        'latitude': complaint['latitude'],
+        'longitude': complaint['longitude']
+    }
+    
+    send_email_async(complaint['citizen_email'], f"Complaint Registered - {complaint['id']}", 
+                    get_email_template('complaint_submitted', email_data, complaint['citizen_language'] or 'en'))
+    
+    dept_email = get_department_email(complaint['department'])
+    if dept_email:
+        email_data['description'] = description
+        send_email_async(dept_email, f"🔔 New Complaint - {complaint['id']}", 
+                       get_email_template('complaint_submitted', email_data, 'en'))
+
+def enrich_complaint(tid):
+    """
+    Translate, AI re-score, re-route and notify for one submitted complaint.
+    The row is claimed first so only one worker enriches it. Returns the
+    final complaint dict, or None if another worker already claimed it.
+    """
+    timer = StageTimer()
+    started = datetime.now()
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql('''UPDATE complaints SET enrichment_status='processing', enrichment_updated_at=?,
+                                         enrichment_attempts=COALESCE(enrichment_attempts, 0) + 1
+                                     WHERE id=? AND enrichment_status='pending\'''', conn), (started.isoformat(), tid))
+        claimed = cursor.rowcount == 1
+        conn.commit()
+        if not claimed:
+            return None
+        cursor.execute(format_sql('SELECT * FROM complaints WHERE id=?', conn), (tid,))
+        c = dict(cursor.fetchone())
+
+    try:
+        lang = c['citizen_language'] or 'en'
+        original = c['description_original'] or c['description'] or ''
+        cat = c['category']
+        
+        with timer.stage('translate'):
+            translated = translate_text(original, lang, 'en') if lang != 'en' else original
+        with timer.stage('analyze'):
+            ai = analyze_with_ai(translated, '' if cat == 'Auto-Detected' else cat)
+        
+        pri = ai.get('priority', 5)
+        dept = choose_department(cat, ai)
+        sla_h = SLA_TIMES.get(pri, 24)
+        sla_dl = datetime.fromisoformat(c['created_at']) + timedelta(hours=sla_h)
+        esc_level, esc_next = stored_escalation(c.get('escalation_level'), 'Pending', sla_dl, sla_h)
+        
+        with timer.stage('persist'):
+            with db_connection() as conn:
+                cursor = get_db_cursor(conn)
+                before = select_for_update(cursor, conn, ROLLUP_SOURCE_SQL, (tid,))
+                # Re-route only while no official has acted on the complaint yet
+                cursor.execute(format_sql('''UPDATE complaints SET priority=?, department=?, assigned_to=?,
+                                             sla_hours=?, sla_deadline=?, escalation_level=?, next_escalation_at=?
+                                             WHERE id=? AND status='Pending' AND COALESCE(transfer_count, 0)=0''', conn),
+                               (pri, dept, f"{dept}_Manager", sla_h, sla_dl.isoformat(), esc_level, esc_next, tid))
+                rerouted = cursor.rowcount == 1
+                if rerouted:
+                    cursor.execute(format_sql(ROLLUP_SOURCE_SQL, conn), (tid,))
+                    apply_rollup_change(cursor, conn, before, cursor.fetchone())
+                    record_event(cursor, conn, 'updated', dict(c, priority=pri, department=dept, sla_deadline=sla_dl.isoformat(),
+                                                               escalation_level=esc_level), previous_department=c['department'])
+                persisted_at = datetime.now().isoformat()
+                cursor.execute(format_sql('''UPDATE complaints SET description=?, description_translated=?, ai_analysis=?,
+                                             enrichment_status='done', enrichment_updated_at=?, updated_at=? WHERE id=?''', conn),
+                               (translated, translated, json.dumps(ai), persisted_at, persisted_at, tid))
+                bump_versions(cursor, conn, complaint_scopes(c, dept))
+                conn.commit()
+    except Exception:
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            failed_at = datetime.now().isoformat()
+            cursor.execute(format_sql("UPDATE complaints SET enrichment_status='failed', enrichment_updated_at=?, updated_at=? WHERE id=?", conn),
+                           (failed_at, failed_at, tid))
+            bump_versions(cursor, conn, complaint_scopes(c))
+            conn.commit()
+        raise
+
+    # Saved as 'done' from here on: a failure below must not send the complaint back for re-enrichment
+    if rerouted:
+        event_bus.notify()
+    c.update(description=translated, description_translated=translated, ai_analysis=json.dumps(ai))
+    if rerouted:
+        analytics_engine.invalidate(c['department'], dept)
+        escalation_scheduler.schedule(tid, esc_next)
+        c.update(priority=pri, department=dept, assigned_to=f"{dept}_Manager",
+                 sla_hours=sla_h, sla_deadline=sla_dl.isoformat())
+
+    with timer.stage('notify'):
+        try:
+            notify_complaint_submitted(c, translated)
+        except Exception as e:
+            print(f"❌ Notification error for {tid}: {e}")
+
+    timings = timer.finish()
+    timings['queue_wait_ms'] = round((started - datetime.fromisoformat(c['created_at'])).total_seconds() * 1000, 1)
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql('UPDATE complaints SET pipeline_timings=?, updated_at=? WHERE id=?', conn),
+                       (json.dumps(timings), datetime.now().isoformat(), tid))
+        bump_versions(cursor, conn, complaint_scopes(c))
+        conn.commit()
+    enrichment_pipeline.record_timings(timings)
+    print(f"✨ Enriched {tid}: Priority={c['priority']}, Dept={c['department']} ({timings['total_ms']} ms)")
+    return c
+
+def unfinished_enrichments():
+    """Complaints a recycled worker left pending (or stuck mid-enrichment)"""
+    stale = (datetime.now() - timedelta(minutes=ENRICHMENT_STALE_MINUTES)).isoformat()
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql('''UPDATE complaints SET enrichment_status='pending'
+                                     WHERE enrichment_status='processing' AND enrichment_updated_at < ?''', conn), (stale,))
+        conn.commit()
+        cursor.execute(format_sql('''SELECT id FROM complaints WHERE enrichment_status='pending'
+                                     ORDER BY created_at LIMIT 1000''', conn))
+        return [row['id'] for row in cursor.fetchall()]
+
+def failed_enrichments_due():
+    """Failed complaints whose backoff has passed, set back to 'pending' (at most 1000 per call)"""
+    now = datetime.now()
+    clauses, params = [], []
+    for attempts in range(1, ENRICHMENT_MAX_ATTEMPTS):
+        # Rows that failed before attempts were counted have 0 and wait like a first failure
+        clauses.append(f"(COALESCE(enrichment_attempts, 0) {'<=' if attempts == 1 else '='} ? AND enrichment_updated_at < ?)")
+        wait = timedelta(minutes=ENRICHMENT_RETRY_MINUTES * 2 ** (attempts - 1))
+        params += [attempts, (now - wait).isoformat()]
+    if not clauses:
+        return []
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql(f'''SELECT id FROM complaints WHERE enrichment_status='failed' AND ({' OR '.join(clauses)})
+                                      ORDER BY created_at LIMIT 1000''', conn), tuple(params))
+        ids = [row['id'] for row in cursor.fetchall()]
+        if ids:
+            cursor.execute(format_sql(f'''UPDATE complaints SET enrichment_status='pending'
+                                          WHERE enrichment_status='failed' AND id IN ({','.join('?' * len(ids))})''', conn),
+                           tuple(ids))
+            conn.commit()
+    return ids
+
+enrichment_pipeline = BackgroundPipeline('enrichment', enrich_complaint, workers=ENRICHMENT_WORKERS,
+                                         recover=unfinished_enrichments)
+
+# ============= BATCH RE-ANALYSIS =============
+# python batch_analysis.py re-scores existing complaints with many complaints
+# per Gemini request and writes the results back through apply_reanalysis().
+
+def apply_reanalysis(analyses):
+    """
+    Write one batch of re-analysis results back in a single transaction:
+    ai_analysis for every complaint, and priority/department/SLA for those
+    no official has acted on yet (the same rule as enrichment).
+    analyses: {complaint id: analysis dict}. Returns how many were re-routed.
+    """
+    if not analyses:
+        return 0
+    ids = list(analyses)
+    now = datetime.now().isoformat()
+    rerouted, scopes = [], []
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql(f"SELECT * FROM complaints WHERE id IN ({','.join('?' * len(ids))})", conn), tuple(ids))
+        complaints = {row['id']: dict(row) for row in cursor.fetchall()}
+        for cid, c in complaints.items():
+            ai = analyses[cid]
+            pri = ai.get('priority', 5)
+            dept = choose_department(c['category'], ai)
+            if c['status'] == 'Pending' and not c['transfer_count'] and (pri, dept) != (c['priority'], c['department']):
+                sla_h = SLA_TIMES.get(pri, 24)
+                sla_dl = datetime.fromisoformat(c['created_at']) + timedelta(hours=sla_h)
+                esc_level, esc_next = stored_escalation(c['escalation_level'], 'Pending', sla_dl, sla_h)
+                before = select_for_update(cursor, conn, ROLLUP_SOURCE_SQL, (cid,))
+                cursor.execute(format_sql('''UPDATE complaints SET priority=?, department=?, assigned_to=?,
+                                             sla_hours=?, sla_deadline=?, escalation_level=?, next_escalation_at=?
+                                             WHERE id=? AND status='Pending' AND COALESCE(transfer_count, 0)=0''', conn),
+                               (pri, dept, f"{dept}_Manager", sla_h, sla_dl.isoformat(), esc_level, esc_next, cid))
+                if cursor.rowcount == 1:
+                    cursor.execute(format_sql(ROLLUP_SOURCE_SQL, conn), (cid,))
+                    apply_rollup_change(cursor, conn, before, cursor.fetchone())
+                    record_event(cursor, conn, 'updated', dict(c, priority=pri, department=dept, sla_deadline=sla_dl.isoformat(),
+                                                               escalation_level=esc_level), previous_department=c['department'])
+                    rerouted.append((cid, c['department'], dept, esc_next))
+            scopes.extend(scope for scope in complaint_scopes(c, dept) if scope not in scopes)
+        cursor.executemany(format_sql('UPDATE complaints SET ai_analysis=?, updated_at=? WHERE id=?', conn),
+                           [(json.dumps(analyses[cid]), now, cid) for cid in complaints])
+        bump_versions(cursor, conn, scopes)
+        conn.commit()
+    if rerouted:
+        event_bus.notify()
+        analytics_engine.invalidate(*{d for _, old, new, _ in rerouted for d in (old, new)})
+        for cid, _, _, esc_next in rerouted:
+            escalation_scheduler.schedule(cid, esc_next)
+    return len(rerouted)
+
+# ============= SLA ESCALATION =============
+# complaints.escalation_level is advanced by the scheduler in escalation.py
+# when a threshold in ESCALATION_LEVELS is crossed; each transition is
+# notified to the department once.
+
+ESCALATION_SCHEDULER = os.getenv('ESCALATION_SCHEDULER', '1') != '0'
+ESCALATION_NOTIFY = os.getenv('ESCALATION_NOTIFY', '1') != '0'
+
+def notify_escalation(complaint, previous_level, level):
+    """Alert the owning department when a complaint reaches a higher escalation level"""
+    print(f"⏰ {complaint['id']} escalated {previous_level} → {level} ({complaint['department']})")
+    if not ESCALATION_NOTIFY:
+        return
+    dept_email = get_department_email(complaint['department'])
+    if not dept_email:
+        return
+    data = {
+        'tracking_id': complaint['id'],
+        'category': complaint['category'],
+        'priority': complaint['priority'],
+        'status': complaint['status'],
+        'sla_deadline': datetime.fromisoformat(complaint['sla_deadline']).strftime("%Y-%m-%d %H:%M"),
+        'previous_level': previous_level,
+        'level': level,
+        'latitude': complaint['latitude'],
+        'longitude': complaint['longitude']
+    }
+    send_email_async(dept_email, f"⏰ {level}: Complaint {complaint['id']}", get_email_template('sla_escalation', data))
+
+escalation_scheduler = EscalationScheduler(on_escalate=notify_escalation)
+
+# ============= LIVE COMPLAINT EVENTS =============
+# Complaint writes append to complaint_events; /api/events streams them to
+# official dashboards over Server-Sent Events (see events.py).
+
+EVENT_STREAM_SECONDS = int(os.getenv('EVENT_STREAM_SECONDS', 300))
+# Streams per worker; keep it below GUNICORN_THREADS so API requests still get a thread
+EVENT_STREAM_MAX = int(os.getenv('EVENT_STREAM_MAX', max(1, int(os.getenv('GUNICORN_THREADS', 16)) // 2)))
+EVENT_STREAM_RETRY_SECONDS = 15
+event_bus = EventBus(poll_seconds=float(os.getenv('EVENT_POLL_SECONDS', 1)), max_streams=EVENT_STREAM_MAX)
+
+# ============= HOTSPOTS =============
+# Clusters of nearby open complaints per department and category, kept up to
+# date by the hotspot_clustering job and served precomputed (see hotspots.py).
+
+hotspot_engine = HotspotEngine(eps_meters=float(os.getenv('HOTSPOT_EPS_METERS', 150)),
+                               min_complaints=int(os.getenv('HOTSPOT_MIN_COMPLAINTS', 3)))
+
 # ============= OTP & AUTHENTICATION HELPERS =============
 
 def generate_otp():
@@ -488,46 +846,28 @@ def generate_tracking_id():
     random_part = str(random.randint(1000, 9999))
     return f"GRV-{date_part}-{random_part}"
 
+# OTPs live in the otps table by default; OTP_STORE=memory for a single-process deployment (see otp_store.py)
+OTP_TTL_SECONDS = 300
+otp_store = make_otp_store(os.getenv('OTP_STORE', 'database'), ttl_seconds=OTP_TTL_SECONDS)
+
+# Token-bucket limits on unauthenticated endpoints that trigger expensive work (see rate_limit.py)
+rate_limiter = make_rate_limiter(os.getenv('RATE_LIMIT_BACKEND', 'database'),
+                                 enabled=os.getenv('RATE_LIMIT_ENABLED', '1') != '0',
+                                 proxy_hops=int(os.getenv('RATE_LIMIT_PROXY_HOPS', 1)))
+
 def store_otp(phone, otp_code, purpose='signin'):
-    """Store OTP in database with expiration"""
+    """Store OTP with expiration"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        expiry = (datetime.now() + timedelta(minutes=5)).isoformat()
-        
-        query = format_sql("INSERT INTO otps (phone, otp_code, purpose, created_at, expires_at) VALUES (?, ?, ?, ?, ?)", conn)
-        cursor.execute(query, (phone, otp_code, purpose, datetime.now().isoformat(), expiry))
-        conn.commit()
-        conn.close()
+        otp_store.put(phone, otp_code, purpose)
         return True
     except Exception as e:
         print(f"Error storing OTP: {e}")
         return False
 
 def validate_otp(phone, otp_code):
-    """Validate OTP and mark as used"""
+    """Validate OTP and consume it (a code works once)"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        now = datetime.now().isoformat()
-        
-        # Find valid, unused OTP
-        query = format_sql('''SELECT * FROM otps 
-                             WHERE phone=? AND otp_code=? AND used=? AND expires_at > ?
-                             ORDER BY created_at DESC LIMIT 1''')
-        cursor.execute(query, (phone, otp_code, 0, now))
-        otp = cursor.fetchone()
-        
-        if otp:
-            # Mark as used
-            upd_q = format_sql('UPDATE otps SET used=? WHERE id=?')
-            cursor.execute(upd_q, (1, otp['id']))
-            conn.commit()
-            conn.close()
-            return True
-        
-        conn.close()
-        return False
+        return otp_store.consume(phone, otp_code)
     except Exception as e:
         print(f"Error validating OTP: {e}")
         return False
@@ -566,17 +906,16 @@ def send_otp_email(to_email, otp_code, phone, purpose='signin'):
     </html>
     """
     
-    return send_email(to_email, f"🔐 Your OTP Code - {otp_code}", html_content)
+    return send_email_async(to_email, f"🔐 Your OTP Code - {otp_code}", html_content)
 
 def get_citizen_by_phone(phone):
     """Retrieve citizen details by phone number"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        query = format_sql("SELECT * FROM citizens WHERE phone = ?")
-        cursor.execute(query, (phone,))
-        citizen = cursor.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            query = format_sql("SELECT * FROM citizens WHERE phone = ?")
+            cursor.execute(query, (phone,))
+            citizen = cursor.fetchone()
         return dict(citizen) if citizen else None
     except Exception as e:
         print(f"Error fetching citizen: {e}")
@@ -585,13 +924,12 @@ def get_citizen_by_phone(phone):
 def create_citizen(phone, name=None, email=None, address=None):
     """Create new citizen record"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        now = datetime.now().isoformat()
-        query = format_sql("INSERT INTO citizens (phone, name, email, address, created_at, last_login) VALUES (?, ?, ?, ?, ?, ?)")
-        cursor.execute(query, (phone, name, email, address, now, now))
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            now = datetime.now().isoformat()
+            query = format_sql("INSERT INTO citizens (phone, name, email, address, created_at, last_login) VALUES (?, ?, ?, ?, ?, ?)")
+            cursor.execute(query, (phone, name, email, address, now, now))
+            conn.commit()
         return True
     except Exception as e:
         print(f"Error creating citizen: {e}")
@@ -600,20 +938,107 @@ def create_citizen(phone, name=None, email=None, address=None):
 def update_citizen_login(phone):
     """Update last login time for citizen"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        now = datetime.now().isoformat()
-        query = format_sql("UPDATE citizens SET last_login = ? WHERE phone = ?", conn)
-        cursor.execute(query, (now, phone))
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            now = datetime.now().isoformat()
+            query = format_sql("UPDATE citizens SET last_login = ? WHERE phone = ?", conn)
+            cursor.execute(query, (now, phone))
+            conn.commit()
         return True
     except Exception as e:
         print(f"Error updating login: {e}")
         return False
 
+# ============= BACKGROUND JOBS =============
+# Maintenance jobs run on exactly one worker across the cluster (see jobs.py).
+# Trigger a one-off job with: python jobs.py --trigger rollup_rebuild
+
+JOBS_ENABLED = os.getenv('JOBS_ENABLED', '1') != '0'
+job_runner = JobRunner(tick_seconds=int(os.getenv('JOB_TICK_SECONDS', 5)))
+
+@job_runner.periodic('otp_purge', every_seconds=600)
+def purge_otps():
+    """Bulk-delete expired OTPs (used ones are deleted when consumed)"""
+    removed = otp_store.purge()
+    print(f"🧹 Purged {removed} expired OTP(s)")
+
+@job_runner.periodic('rate_limit_prune', every_seconds=3600)
+def prune_rate_limits():
+    """Drop idle (long since refilled) buckets"""
+    rate_limiter.buckets.prune()
+
+@job_runner.periodic('cache_prune', every_seconds=6 * 3600)
+def prune_caches():
+    ai_cache.prune()
+    translator.cache.prune()
+
+@job_runner.periodic('email_outbox_purge', every_seconds=24 * 3600)
+def purge_email_outbox():
+    removed = email_outbox.purge(keep_days=int(os.getenv('EMAIL_OUTBOX_KEEP_DAYS', 30)))
+    print(f"🧹 Purged {removed} delivered email(s) from the outbox")
+
+@job_runner.periodic('sla_escalation_sweep', every_seconds=600)
+def sweep_escalations():
+    """Catch up on crossings no scheduler thread applied (e.g. all workers were down)"""
+    cutoff = (datetime.now() - timedelta(minutes=5)).isoformat()
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql('''SELECT id FROM complaints WHERE next_escalation_at IS NOT NULL
+                                     AND next_escalation_at <= ? ORDER BY next_escalation_at LIMIT 1000''', conn),
+                       (cutoff,))
+        overdue = [row['id'] for row in cursor.fetchall()]
+    for cid in overdue:
+        escalation_scheduler.advance(cid)
+
+@job_runner.periodic('enrichment_retry', every_seconds=300)
+def retry_failed_enrichments():
+    """Re-queue failed enrichments whose backoff has passed (see failed_enrichments_due)"""
+    ids = failed_enrichments_due()
+    queued = sum(1 for tid in ids if enrichment_pipeline.submit(tid))
+    if ids:
+        print(f"♻️  Re-queued {queued} of {len(ids)} failed enrichment(s)")
+
+@job_runner.periodic('event_log_purge', every_seconds=3600)
+def purge_event_log():
+    purge_events(keep_hours=int(os.getenv('EVENT_LOG_RETENTION_HOURS', 72)))
+
+@job_runner.periodic('hotspot_clustering', every_seconds=int(os.getenv('HOTSPOT_INTERVAL_SECONDS', 300)))
+def update_hotspots():
+    """Cluster complaints submitted, closed or re-routed since the last run"""
+    result = hotspot_engine.run()
+    if result['added'] or result['removed']:
+        print(f"🗺️  Hotspots: +{result['added']} / -{result['removed']} complaint(s) in {result['groups']} group(s) ({result['ms']} ms)")
+
+@job_runner.one_off('hotspot_rebuild')
+def rebuild_hotspots():
+    """Recluster every open complaint (e.g. after changing HOTSPOT_EPS_METERS)"""
+    result = hotspot_engine.run(full=True)
+    print(f"✅ Hotspots rebuilt from {result['added']} open complaint(s)")
+
+@job_runner.one_off('rollup_rebuild')
+def rebuild_analytics_rollups():
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        if not is_postgres(conn):
+            cursor.execute('BEGIN IMMEDIATE')  # no complaint writes between the scan and the rewrite
+        count = rebuild_rollups(cursor, conn)
+        conn.commit()
+    analytics_engine.invalidate()
+    print(f"✅ Rollups rebuilt from {count} complaint(s)")
+
 # ============= API ROUTES =============
 
+@app.before_request
+def start_background_workers():
+    # Per-process, idempotent: also re-queues enrichment left unfinished by a recycled worker
+    if ASYNC_ENRICHMENT:
+        enrichment_pipeline.start()
+    email_outbox.start()
+    if ESCALATION_SCHEDULER:
+        escalation_scheduler.start()
+    if JOBS_ENABLED:
+        job_runner.start()
+
 @app.route('/')
 @app.route('/index.html')
 def home():
@@ -632,17 +1057,28 @@ def get_languages():
     return jsonify({"success": True, "languages": SUPPORTED_LANGUAGES, 
                     "translation_available": TRANSLATION_AVAILABLE}), 200
 
+MAX_TRANSLATE_BATCH = 200
+
 @app.route('/api/translate', methods=['POST'])
 def translate():
+    """Translate one string ("text") or a list of strings ("texts") in a single call"""
     data = request.json
     text = data.get('text', '')
+    texts = data.get('texts')
     from_lang = data.get('from', 'auto')
     to_lang = data.get('to', 'en')
     
     if not TRANSLATION_AVAILABLE:
         return jsonify({"success": False, "message": "Translation not available"}), 400
     
-    translated = translate_text(text, from_lang, to_lang)
+    if texts is not None:
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return jsonify({"success": False, "message": "texts must be a list of strings"}), 400
+        if len(texts) > MAX_TRANSLATE_BATCH:
+            return jsonify({"success": False, "message": f"At most {MAX_TRANSLATE_BATCH} texts per request"}), 400
+        translated = translate_texts(texts, from_lang, to_lang)
+    else:
+        translated = translate_text(text, from_lang, to_lang)
     
     return jsonify({
         "success": True, 
@@ -663,18 +1099,17 @@ def check_citizen_exists():
         if not identifier:
             return jsonify({"success": False, "message": "Identifier required"}), 400
             
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        # Search by phone
-        query_phone = format_sql('SELECT * FROM citizens WHERE phone=?')
-        citizen = cursor.execute(query_phone, (identifier,)).fetchone()
-        
-        # If not found and identifier looks like email, search by email
-        if not citizen and '@' in identifier:
-            query_email = format_sql('SELECT * FROM citizens WHERE email=?')
-            citizen = cursor.execute(query_email, (identifier,)).fetchone()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            # Search by phone
+            query_phone = format_sql('SELECT * FROM citizens WHERE phone=?')
+            citizen = cursor.execute(query_phone, (identifier,)).fetchone()
+            
+            # If not found and identifier looks like email, search by email
+            if not citizen and '@' in identifier:
+                query_email = format_sql('SELECT * FROM citizens WHERE email=?')
+                citizen = cursor.execute(query_email, (identifier,)).fetchone()
             
-        conn.close()
         
         if citizen:
             c = dict(citizen)
@@ -695,6 +1130,8 @@ def check_citizen_exists():
         return jsonify({"success": False, "message": str(e)}), 500
 
 @app.route('/api/citizen/send-otp', methods=['POST'])
+@rate_limiter.limit('send_otp', per_ip=os.getenv('RATE_LIMIT_SEND_OTP_IP', '10/10m'),
+                   per_phone=os.getenv('RATE_LIMIT_SEND_OTP_PHONE', '3/10m'))
 def citizen_send_otp():
     """Send OTP to citizen's phone (via email)"""
     try:
@@ -712,14 +1149,13 @@ def citizen_send_otp():
         if not store_otp(phone, otp_code, purpose):
             return jsonify({"success": False, "message": "Failed to generate OTP"}), 500
         
-        # Send real email in BACKGROUND to prevent UI hang
-        import threading
-        threading.Thread(target=send_otp_email, args=(email, otp_code, phone, purpose)).start()
+        # Queued in the outbox; the sender threads deliver it without holding up the request
+        send_otp_email(email, otp_code, phone, purpose)
         
         return jsonify({
             "success": True, 
             "message": f"OTP 123456 sent to {email}",
-            "expires_in": 300
+            "expires_in": OTP_TTL_SECONDS
         }), 200
             
     except Exception as e:
@@ -727,6 +1163,8 @@ def citizen_send_otp():
         return jsonify({"success": False, "message": str(e)}), 500
 
 @app.route('/api/citizen/verify-otp', methods=['POST'])
+@rate_limiter.limit('verify_otp', per_ip=os.getenv('RATE_LIMIT_VERIFY_OTP_IP', '30/10m'),
+                   per_phone=os.getenv('RATE_LIMIT_VERIFY_OTP_PHONE', '5/10m'))
 def citizen_verify_otp():
     """Verify OTP for sign in"""
     try:
@@ -804,6 +1242,7 @@ def citizen_signup():
 # Duplicate removed - using version at line 586
 
 @app.route('/api/citizen/complaints', methods=['GET'])
+@conditional(lambda: [f"citizen:{request.args['phone']}"] if request.args.get('phone') else None)
 def get_citizen_complaints():
     """Get all complaints for a citizen by phone number"""
     try:
@@ -811,19 +1250,18 @@ def get_citizen_complaints():
         if not phone:
             return jsonify({"success": False, "message": "Phone required"}), 400
             
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        query = format_sql("SELECT * FROM complaints WHERE citizen_phone = ? ORDER BY created_at DESC")
-        cursor.execute(query, (phone,))
-        complaints = cursor.fetchall()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            query = format_sql("SELECT * FROM complaints WHERE citizen_phone = ? ORDER BY created_at DESC")
+            cursor.execute(query, (phone,))
+            complaints = cursor.fetchall()
         
         # Format results
         results = []
         for c in complaints:
             d = dict(c)
-            d['escalation_level'] = check_sla_status(d)
+            d['escalation_level'] = current_escalation_level(d)
             results.append(d)
-        conn.close()
         return jsonify({"success": True, "complaints": results}), 200
     except Exception as e:
         print(f"Error fetching complaints: {e}")
@@ -840,28 +1278,27 @@ def verify():
     
     if name and email and phone:
         try:
-            conn = get_db()
-            cursor = get_db_cursor(conn)
-            # Register or update the citizen in our new system table
-            now = datetime.now().isoformat()
-            if is_postgres():
-                query = '''
-                    INSERT INTO citizens (phone, name, email, created_at, last_login)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT(phone) DO UPDATE SET
-                        name = EXCLUDED.name,
-                        email = EXCLUDED.email,
-                        last_login = EXCLUDED.last_login
-                '''
-                cursor.execute(query, (phone, name, email, now, now))
-            else:
-                query = '''
-                    INSERT OR REPLACE INTO citizens (phone, name, email, created_at, last_login)
-                    VALUES (?, ?, ?, ?, ?)
-                '''
-                cursor.execute(query, (phone, name, email, now, now))
-            conn.commit()
-            conn.close()
+            with db_connection() as conn:
+                cursor = get_db_cursor(conn)
+                # Register or update the citizen in our new system table
+                now = datetime.now().isoformat()
+                if is_postgres(conn):
+                    query = '''
+                        INSERT INTO citizens (phone, name, email, created_at, last_login)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT(phone) DO UPDATE SET
+                            name = EXCLUDED.name,
+                            email = EXCLUDED.email,
+                            last_login = EXCLUDED.last_login
+                    '''
+                    cursor.execute(query, (phone, name, email, now, now))
+                else:
+                    query = '''
+                        INSERT OR REPLACE INTO citizens (phone, name, email, created_at, last_login)
+                        VALUES (?, ?, ?, ?, ?)
+                    '''
+                    cursor.execute(query, (phone, name, email, now, now))
+                conn.commit()
             return jsonify({"success": True}), 200
         except Exception as e:
             print(f"Verify save error: {e}")
@@ -871,6 +1308,7 @@ def verify():
 
 
 @app.route('/api/check_duplicates', methods=['POST'])
+@rate_limiter.limit('check_duplicates', per_ip=os.getenv('RATE_LIMIT_CHECK_DUPLICATES_IP', '30/1m'))
 def check_duplicates():
     """
     Check for duplicate complaints near the selected location
@@ -881,12 +1319,15 @@ def check_duplicates():
         lon = float(data.get('longitude'))
         category = data.get('category', '')
         radius = int(data.get('radius', 20))  # Default 20 meters
+        description = (data.get('description') or '').strip()
         
         if not lat or not lon:
             return jsonify({"success": False, "message": "Location required"}), 400
+        if not DUPLICATE_MIN_RADIUS_M <= radius <= DUPLICATE_MAX_RADIUS_M:
+            return jsonify({"success": False, "message": f"radius must be between {DUPLICATE_MIN_RADIUS_M} and {DUPLICATE_MAX_RADIUS_M} meters"}), 400
         
-        # Check for nearby complaints
-        nearby_complaints = check_duplicate_complaints(lat, lon, category, radius)
+        # Check for nearby complaints (and similarly worded ones a little further away)
+        nearby_complaints = check_duplicate_complaints(lat, lon, category, radius, description)
         
         return jsonify({
             "success": True,
@@ -900,7 +1341,37 @@ def check_duplicates():
         print(f"Duplicate check error: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
 
+@app.route('/api/check_duplicates/bulk', methods=['POST'])
+@rate_limiter.limit('check_duplicates_bulk', per_ip=os.getenv('RATE_LIMIT_CHECK_DUPLICATES_BULK_IP', '10/10m'))
+def check_duplicates_bulk():
+    """
+    Duplicate check for a batch of locations:
+    {"points": [{"latitude", "longitude", "category"}...], "radius": 20}
+    """
+    try:
+        data = request.json or {}
+        points = data.get('points') or []
+        radius = int(data.get('radius', 20))
+        if len(points) > DUPLICATE_BULK_MAX_POINTS:
+            return jsonify({"success": False, "message": f"At most {DUPLICATE_BULK_MAX_POINTS} points per request"}), 400
+        if not DUPLICATE_MIN_RADIUS_M <= radius <= DUPLICATE_MAX_RADIUS_M:
+            return jsonify({"success": False, "message": f"radius must be between {DUPLICATE_MIN_RADIUS_M} and {DUPLICATE_MAX_RADIUS_M} meters"}), 400
+        
+        results = check_duplicate_complaints_bulk(points, radius)
+        return jsonify({
+            "success": True,
+            "radius_checked": radius,
+            "results": [{"count": len(r), "nearby_complaints": r[:5]} for r in results]
+        }), 200
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        print(f"Bulk duplicate check error: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
 @app.route('/api/submit_complaint', methods=['POST'])
+@rate_limiter.limit('submit_complaint', per_ip=os.getenv('RATE_LIMIT_SUBMIT_IP', '10/10m'),
+                   per_phone=os.getenv('RATE_LIMIT_SUBMIT_PHONE', '5/1h'), phone_field='citizen_phone')
 def submit():
     try:
         d = request.form
@@ -909,33 +1380,21 @@ def submit():
         citizen_lang = d.get('citizen_language', 'en')
         
         desc_original = desc
-        desc_translated = translate_text(desc, citizen_lang, 'en') if citizen_lang != 'en' else desc
         
         lat = d.get('latitude')
         lon = d.get('longitude')
         loc_addr = d.get('location_address', d.get('citizen_address', ''))
         
-        # Get AI analysis (includes department detection)
-        ai = analyze_with_ai(desc_translated, cat)
+        # Immediate keyword-based scoring; translation and Gemini re-scoring run in enrich_complaint()
+        ai = keyword_analysis(desc, cat)
         pri = ai.get('priority', 5)
+        dept = choose_department(cat, ai)
         
-        # Use AI-detected department if category is empty or if AI suggests a better department
-        if not cat or cat == '':
-            # No category provided - use AI detection
-            dept = ai.get('detected_department', 'General_Admin_Dept')
-            print(f"⚠️ No category provided. AI detected department: {dept}")
-        else:
-            # Category provided - use standard routing but check AI suggestion
-            dept = route_complaint(cat)
-            ai_dept = ai.get('detected_department')
-            if ai_dept and ai_dept != dept:
-                # AI suggests different department - use AI's suggestion as it analyzed the description
-                print(f"ℹ️ AI suggests {ai_dept} instead of {dept} based on description analysis")
-                dept = ai_dept
-        
+        now = datetime.now()
         sla_h = SLA_TIMES.get(pri, 24)
-        sla_dl = datetime.now() + timedelta(hours=sla_h)
+        sla_dl = now + timedelta(hours=sla_h)
         tid = generate_tracking_id()  # Use new standardized format
+        esc_level, esc_next = stored_escalation('NONE', 'Pending', sla_dl, sla_h, now)
         
         media = None
         if 'media_upload' in request.files:
@@ -945,47 +1404,50 @@ def submit():
                 media = f"{tid}_{fn}"
                 f.save(os.path.join(app.config['UPLOAD_FOLDER'], media))
         
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        
-        sql = """INSERT INTO complaints 
-            (id, citizen_name, citizen_email, citizen_phone, citizen_address, 
-             latitude, longitude, location_address,
-             category, description, description_original, description_translated,
-             media_path, priority, department, assigned_to, 
-             created_at, sla_hours, sla_deadline, ai_analysis, citizen_language)
-            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
             
-        cursor.execute(format_sql(sql, conn),
-            (tid, d['citizen_name'], d['citizen_email'], d['citizen_phone'], d['citizen_address'],
-             lat, lon, loc_addr,
-             cat if cat else 'Auto-Detected', desc_translated, desc_original, desc_translated, 
-             media, pri, dept, f"{dept}_Manager", 
-             datetime.now().isoformat(), sla_h, sla_dl.isoformat(), json.dumps(ai), citizen_lang))
-        conn.commit()
-        conn.close()
-        
-        email_data = {
-            'citizen_name': d['citizen_name'],
-            'tracking_id': tid,
-            'category': cat if cat else 'Auto-Detected by AI',
-            'priority': pri,
-            'department': dept,
-            'sla_deadline': sla_dl.strftime("%Y-%m-%d %H:%M"),
-            'sla_hours': sla_h,
-            'ai_sentiment': ai.get('sentiment', 'Neutral'),
-            'latitude': lat,
-            'longitude': lon
-        }
-        
-        send_email_async(d['citizen_email'], f"Complaint Registered - {tid}", 
-                        get_email_template('complaint_submitted', email_data, citizen_lang))
-        
-        dept_email = get_department_email(dept)
-        if dept_email:
-            email_data['description'] = desc_translated
-            send_email_async(dept_email, f"🔔 New Complaint - {tid}", 
-                           get_email_template('complaint_submitted', email_data, 'en'))
+            sql = """INSERT INTO complaints 
+                (id, citizen_name, citizen_email, citizen_phone, citizen_address, 
+                 latitude, longitude, location_address,
+                 category, description, description_original, description_translated,
+                 media_path, priority, department, assigned_to, 
+                 created_at, sla_hours, sla_deadline, ai_analysis, citizen_language, geo_cell,
+                 enrichment_status, enrichment_updated_at, escalation_level, next_escalation_at, updated_at)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+                
+            cursor.execute(format_sql(sql, conn),
+                (tid, d['citizen_name'], d['citizen_email'], d['citizen_phone'], d['citizen_address'],
+                 lat, lon, loc_addr,
+                 cat if cat else 'Auto-Detected', desc_original, desc_original,
+                 desc_original if citizen_lang == 'en' else None,
+                 media, pri, dept, f"{dept}_Manager", 
+                 now.isoformat(), sla_h, sla_dl.isoformat(), json.dumps(ai), citizen_lang,
+                 geo_cell(lat, lon), 'pending', now.isoformat(), esc_level, esc_next, now.isoformat()))
+            index_complaint(cursor, conn, {'id': tid, 'description_original': desc_original,
+                                           'latitude': lat, 'longitude': lon, 'geo_cell': geo_cell(lat, lon)})
+            apply_rollup_change(cursor, conn, after={
+                'department': dept, 'created_at': now.isoformat(), 'status': 'Pending',
+                'priority': pri, 'sla_deadline': sla_dl.isoformat()})
+            bump_versions(cursor, conn, complaint_scopes({'id': tid, 'department': dept, 'citizen_phone': d['citizen_phone']}))
+            record_event(cursor, conn, 'created', {
+                'id': tid, 'category': cat if cat else 'Auto-Detected', 'priority': pri, 'status': 'Pending',
+                'department': dept, 'escalation_level': esc_level, 'latitude': lat, 'longitude': lon,
+                'media_path': media, 'created_at': now.isoformat(), 'sla_deadline': sla_dl.isoformat()})
+            conn.commit()
+        event_bus.notify()
+        analytics_engine.invalidate(dept)
+        escalation_scheduler.schedule(tid, esc_next)
+        
+        enrichment = 'pending'
+        if not (ASYNC_ENRICHMENT and enrichment_pipeline.submit(tid)):
+            # Synchronous mode (or queue full): enrich before responding
+            enriched = enrich_complaint(tid)
+            if enriched:
+                enrichment = 'done'
+                pri, dept, sla_h = enriched['priority'], enriched['department'], enriched['sla_hours']
+                sla_dl = datetime.fromisoformat(enriched['sla_deadline'])
+                ai = json.loads(enriched['ai_analysis'])
 
         return jsonify({
             "success": True, 
@@ -995,9 +1457,10 @@ def submit():
             "sla_hours": sla_h, 
             "sla_deadline": sla_dl.strftime("%Y-%m-%d %H:%M"), 
             "ai_sentiment": ai.get('sentiment','Neutral'),
-            "translation_done": citizen_lang != 'en',
+            "translation_done": citizen_lang != 'en' and enrichment == 'done',
             "detected_language": citizen_lang,
-            "ai_routed": not cat or cat == ''
+            "ai_routed": not cat or cat == '',
+            "enrichment": enrichment
         }), 200
     except Exception as e:
         print(e)
@@ -1015,12 +1478,11 @@ def official_login():
             return jsonify({"success": False, "message": "Username and password required"}), 400
             
         print(f"🔑 Login attempt for user: {u}")
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        query = format_sql("SELECT * FROM officials WHERE LOWER(username) = LOWER(?)", conn)
-        cursor.execute(query, (u,))
-        off = cursor.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            query = format_sql("SELECT * FROM officials WHERE LOWER(username) = LOWER(?)", conn)
+            cursor.execute(query, (u,))
+            off = cursor.fetchone()
         
         if off:
             print(f"✅ Found official: {off['username']}")
@@ -1069,27 +1531,25 @@ def db_status():
         from db_config import get_db_info
         info = get_db_info()
         
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        
-        # Robust count fetching
-        def get_count(table):
-            cursor.execute(format_sql(f"SELECT COUNT(*) FROM {table}", conn))
-            row = cursor.fetchone()
-            if not row: return 0
-            if isinstance(row, (list, tuple)): return row[0]
-            if hasattr(row, 'values'): return list(row.values())[0]
-            try: return row[0]
-            except: return 0
-
-        official_count = get_count("officials")
-        complaint_count = get_count("complaints")
-        
-        # Check if admin specifically exists
-        cursor.execute(format_sql("SELECT username FROM officials WHERE username = ?", conn), ('admin@gov.in',))
-        admin_exists = cursor.fetchone() is not None
-        
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            
+            # Robust count fetching
+            def get_count(table):
+                cursor.execute(format_sql(f"SELECT COUNT(*) FROM {table}", conn))
+                row = cursor.fetchone()
+                if not row: return 0
+                if isinstance(row, (list, tuple)): return row[0]
+                if hasattr(row, 'values'): return list(row.values())[0]
+                try: return row[0]
+                except: return 0
+
+            official_count = get_count("officials")
+            complaint_count = get_count("complaints")
+            
+            # Check if admin specifically exists
+            cursor.execute(format_sql("SELECT username FROM officials WHERE username = ?", conn), ('admin@gov.in',))
+            admin_exists = cursor.fetchone() is not None
         
         return jsonify({
             "success": True,
@@ -1097,6 +1557,7 @@ def db_status():
             "officials_count": official_count,
             "complaints_count": complaint_count,
             "admin_ready": admin_exists,
+            "db_pool": get_pool_stats(),
             "version": VERSION,
             "timestamp": datetime.now().isoformat()
         }), 200
@@ -1108,6 +1569,26 @@ def db_status():
             "traceback": traceback.format_exc()
         }), 500
 
+@app.route('/api/debug/metrics')
+def metrics():
+    """Runtime counters for monitoring (connection pool, caches)"""
+    return jsonify({
+        "success": True,
+        "db_pool": get_pool_stats(),
+        "ai_cache": ai_cache_stats(),
+        "enrichment_pipeline": enrichment_pipeline.stats(),
+        "email_outbox": email_outbox.stats(),
+        "translation": translator.stats(),
+        "analytics": analytics_engine.stats(),
+        "escalation": escalation_scheduler.stats(),
+        "jobs": job_runner.stats(),
+        "otp_store": otp_store.stats(),
+        "rate_limits": rate_limiter.stats(),
+        "events": event_bus.stats(),
+        "hotspots": hotspot_engine.stats(),
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
 @app.route('/api/debug/force-seed')
 def force_seed():
     """Manually trigger database seeding and return results/errors"""
@@ -1142,44 +1623,388 @@ def force_seed():
             "results": results
         }), 500
 
-@app.route('/api/complaints')
-def get_all_complaints():
-    dept = request.args.get('department')
-    
-    conn = get_db()
-    cursor = get_db_cursor(conn)
-    q = "SELECT * FROM complaints WHERE 1=1"
-    p = []
-    if dept: 
-        q += " AND department=?"; p.append(dept)
-    
-    q += " ORDER BY created_at DESC"
-    
-    cursor.execute(format_sql(q, conn), tuple(p))
-    rows = cursor.fetchall()
-    conn.close()
-    
-    res = []
-    for r in rows:
-        d = dict(r)
-        d['escalation_level'] = check_sla_status(d)
+# Columns callers may request via /api/complaints?fields=
+COMPLAINT_COLUMNS = (
+    'id', 'citizen_name', 'citizen_email', 'citizen_phone', 'citizen_address', 'category',
+    'description', 'media_path', 'latitude', 'longitude', 'location_address', 'priority',
+    'department', 'assigned_to', 'status', 'created_at', 'resolved_at', 'sla_hours',
+    'sla_deadline', 'resolution_summary', 'resolution_proof', 'citizen_feedback_rating',
+    'citizen_feedback_comments', 'ai_analysis', 'citizen_language', 'description_original',
+    'description_translated', 'rejection_reason', 'transfer_count', 'enrichment_status',
+    'pipeline_timings', 'escalation_level', 'next_escalation_at', 'updated_at'
+)
+# Large text columns left out of paginated listings unless asked for explicitly
+COMPLAINT_BLOB_COLUMNS = ('ai_analysis', 'description_original', 'description_translated')
+COMPLAINT_COMPUTED_FIELDS = ('description_display',)
+COMPLAINTS_PAGE_SIZE = 50
+COMPLAINTS_MAX_PAGE_SIZE = 500
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_MAX_OFFSET = 1000
+
+def encode_cursor(created_at, cid):
+    """Opaque keyset cursor for (created_at, id)"""
+    raw = json.dumps([created_at, cid]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    created_at, cid = json.loads(raw)
+    return created_at, cid
+
+def format_complaint(row, fields=None):
+    """Row -> API dict with computed fields; `fields` limits the output keys"""
+    d = dict(row)
+    if fields is None or 'escalation_level' in fields:
+        d['escalation_level'] = current_escalation_level(d)
+    if fields is None or 'description_display' in fields:
+        d['description_display'] = d.get('description_translated') or d.get('description', '')
+    if fields is None:
         # Ensure frontend expected fields are present
-        d['description_display'] = d.get('description_translated', d.get('description', ''))
         d['description_original'] = d.get('description_original', d.get('description', ''))
-        res.append(d)
-    
-    return jsonify({"success": True, "complaints": res}), 200
+        return d
+    return {k: d.get(k) for k in fields}
+
+def listing_fields(fields_arg):
+    """
+    (fields, columns) for a listing's ?fields= value: the requested fields
+    (default: everything except the large text columns) and the columns
+    format_complaint needs to produce them. Unknown fields raise KeyError.
+    """
+    if fields_arg:
+        fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+        unknown = [f for f in fields if f not in COMPLAINT_COLUMNS and f not in COMPLAINT_COMPUTED_FIELDS]
+        if unknown:
+            raise KeyError(', '.join(unknown))
+    else:
+        fields = [c for c in COMPLAINT_COLUMNS if c not in COMPLAINT_BLOB_COLUMNS] + list(COMPLAINT_COMPUTED_FIELDS)
+    columns = {'id', 'created_at'} | {f for f in fields if f in COMPLAINT_COLUMNS}
+    if 'escalation_level' in fields:
+        columns |= {'status', 'sla_deadline', 'sla_hours', 'next_escalation_at'}
+    if 'description_display' in fields:
+        columns |= {'description', 'description_translated'}
+    return fields, columns
+
+@app.route('/api/complaints')
+@conditional(lambda: [f"dept:{request.args['department']}"] if request.args.get('department') else ['all'])
+def get_all_complaints():
+    """
+    List complaints, newest first.
+    Paginated by default: ?limit=&cursor= (keyset on created_at, id), with
+    ?fields=a,b,c projection and ?status=, ?priority=, ?escalation= filters
+    (comma separated). ?all=1 returns the legacy unpaginated full rows.
+    """
+    try:
+        args = request.args
+        dept = args.get('department')
+        legacy = args.get('all', '').lower() in ('1', 'true', 'yes')
+
+        where, p = ["1=1"], []
+        if dept:
+            where.append("department=?"); p.append(dept)
+        if args.get('status'):
+            statuses = [s.strip() for s in args['status'].split(',') if s.strip()]
+            where.append(f"status IN ({','.join('?' * len(statuses))})"); p.extend(statuses)
+        if args.get('priority'):
+            priorities = [int(x) for x in args['priority'].split(',') if x.strip()]
+            where.append(f"priority IN ({','.join('?' * len(priorities))})"); p.extend(priorities)
+        if args.get('escalation'):
+            levels = [x.strip().upper() for x in args['escalation'].split(',') if x.strip()]
+            where.append(f"COALESCE(escalation_level, 'NONE') IN ({','.join('?' * len(levels))})"); p.extend(levels)
+
+        if legacy:
+            with db_connection() as conn:
+                cursor = get_db_cursor(conn)
+                q = f"SELECT * FROM complaints WHERE {' AND '.join(where)} ORDER BY created_at DESC"
+                cursor.execute(format_sql(q, conn), tuple(p))
+                rows = cursor.fetchall()
+            return jsonify({"success": True, "complaints": [format_complaint(r) for r in rows]}), 200
+
+        # Projection: requested fields, or everything except the large text columns
+        try:
+            fields, columns = listing_fields(args.get('fields'))
+        except KeyError as e:
+            return jsonify({"success": False, "message": f"Unknown fields: {e.args[0]}"}), 400
+
+        limit = min(max(int(args.get('limit', COMPLAINTS_PAGE_SIZE)), 1), COMPLAINTS_MAX_PAGE_SIZE)
+        if args.get('cursor'):
+            try:
+                c_created, c_id = decode_cursor(args['cursor'])
+            except Exception:
+                return jsonify({"success": False, "message": "Invalid cursor"}), 400
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            p.extend([c_created, c_created, c_id])
+
+        q = (f"SELECT {', '.join(sorted(columns))} FROM complaints WHERE {' AND '.join(where)} "
+             f"ORDER BY created_at DESC, id DESC LIMIT ?")
+        p.append(limit + 1)
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql(q, conn), tuple(p))
+            rows = [dict(r) for r in cursor.fetchall()]
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id']) if has_more else None
+        return jsonify({
+            "success": True,
+            "complaints": [format_complaint(r, fields) for r in rows],
+            "next_cursor": next_cursor,
+            "has_more": has_more,
+            "limit": limit
+        }), 200
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        print(f"Error listing complaints: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route('/api/complaints/search')
+@conditional(lambda: [f"dept:{request.args['department']}"] if request.args.get('department') else ['all'])
+def search_complaints_route():
+    """
+    Ranked full-text search: ?q= over the description (translated and
+    original), location and citizen name, with ?department= and ?status=
+    filters, ?fields= projection and ?limit=&offset= pagination.
+    """
+    try:
+        args = request.args
+        if not search_terms(args.get('q', '')):
+            return jsonify({"success": False, "message": "q is required"}), 400
+        try:
+            fields, columns = listing_fields(args.get('fields'))
+        except KeyError as e:
+            return jsonify({"success": False, "message": f"Unknown fields: {e.args[0]}"}), 400
+        statuses = [s.strip() for s in args.get('status', '').split(',') if s.strip()]
+        limit = min(max(int(args.get('limit', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+        offset = min(max(int(args.get('offset', 0)), 0), SEARCH_MAX_OFFSET)
+
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            rows = search_complaints(cursor, conn, args['q'], sorted(columns), department=args.get('department'),
+                                     statuses=statuses, limit=limit + 1, offset=offset)
+
+        has_more = len(rows) > limit and offset + limit <= SEARCH_MAX_OFFSET
+        rows = rows[:limit]
+        results = []
+        for r in rows:
+            result = format_complaint(r, fields)
+            result['rank'] = float(r['rank'])
+            results.append(result)
+        return jsonify({
+            "success": True,
+            "complaints": results,
+            "next_offset": offset + limit if has_more else None,
+            "has_more": has_more,
+            "limit": limit
+        }), 200
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        print(f"Error searching complaints: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+# A slower transaction can still commit a row with an earlier updated_at than rows
+# already returned, so a sync's final cursor stays this many seconds behind now
+SYNC_SETTLE_SECONDS = 5
+
+@app.route('/api/complaints/sync')
+def sync_complaints():
+    """
+    Delta sync for clients keeping a local copy: complaints changed since
+    ?since= (the next_cursor of the previous call; omit for the initial
+    full sync), optionally for one ?department= and ?status= list, oldest
+    change first. Complaints that left the filter (transferred away, moved
+    to another status) come back as tombstones, and each returned
+    complaint's transfer history is included. Repeat while has_more.
+    """
+    try:
+        args = request.args
+        dept = args.get('department')
+        statuses = [s.strip() for s in args.get('status', '').split(',') if s.strip()]
+        limit = min(max(int(args.get('limit', COMPLAINTS_MAX_PAGE_SIZE)), 1), COMPLAINTS_MAX_PAGE_SIZE)
+        since = None
+        if args.get('since'):
+            try:
+                since = tuple(decode_cursor(args['since']))
+            except Exception:
+                return jsonify({"success": False, "message": "Invalid cursor"}), 400
+
+        where, p = ["1=1"], []
+        if since:
+            # Changes only; rows no longer matching the filter become tombstones
+            if dept:
+                where.append("(department=? OR id IN (SELECT complaint_id FROM complaint_transfers WHERE from_department=?))")
+                p.extend([dept, dept])
+            where.append("(updated_at > ? OR (updated_at = ? AND id > ?))")
+            p.extend([since[0], since[0], since[1]])
+        else:
+            if dept:
+                where.append("department=?"); p.append(dept)
+            if statuses:
+                where.append(f"status IN ({','.join('?' * len(statuses))})"); p.extend(statuses)
+
+        fields = [c for c in COMPLAINT_COLUMNS if c not in COMPLAINT_BLOB_COLUMNS] + list(COMPLAINT_COMPUTED_FIELDS)
+        columns = {c for c in COMPLAINT_COLUMNS if c not in COMPLAINT_BLOB_COLUMNS} | {'description_translated'}
+        q = (f"SELECT {', '.join(sorted(columns))} FROM complaints WHERE {' AND '.join(where)} "
+             f"ORDER BY updated_at, id LIMIT ?")
+        p.append(limit + 1)
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql(q, conn), tuple(p))
+            rows = [dict(r) for r in cursor.fetchall()]
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            transfers = []
+            if rows:
+                # Full history of the returned complaints (a handful of rows each)
+                ids = [r['id'] for r in rows]
+                cursor.execute(format_sql(f'''SELECT * FROM complaint_transfers WHERE complaint_id IN ({','.join('?' * len(ids))})
+                                              ORDER BY transferred_at''', conn), tuple(ids))
+                transfers = [dict(t) for t in cursor.fetchall()]
+
+        changes, tombstones = [], []
+        for r in rows:
+            if (dept and r['department'] != dept) or (statuses and r['status'] not in statuses):
+                tombstones.append({'id': r['id'], 'department': r['department'], 'status': r['status'],
+                                   'updated_at': r['updated_at']})
+            else:
+                changes.append(format_complaint(r, fields))
+
+        last = (rows[-1]['updated_at'], rows[-1]['id']) if rows else (since or ('', ''))
+        if not has_more:
+            settle = (datetime.now() - timedelta(seconds=SYNC_SETTLE_SECONDS)).isoformat()
+            if last[0] > settle:
+                # Re-sent next time (clients upsert by id) rather than risk skipping a late commit
+                last = max(since or ('', ''), (settle, ''))
+        return jsonify({
+            "success": True,
+            "changes": changes,
+            "tombstones": tombstones,
+            "transfers": transfers,
+            "next_cursor": encode_cursor(*last),
+            "has_more": has_more
+        }), 200
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        print(f"Sync error: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route('/api/export/complaints')
+@rate_limiter.limit('export', per_ip=os.getenv('RATE_LIMIT_EXPORT_IP', '30/1h'))
+def export_complaints():
+    """
+    Stream complaints as NDJSON (default) or CSV (?format=csv), filtered by
+    ?department=, ?status= (comma separated) and ?from=/?to= dates on
+    created_at, with an optional ?fields= projection. Rows are fetched and
+    sent a batch at a time (see export.py), so memory stays flat.
+    """
+    args = request.args
+    fmt = args.get('format', 'ndjson').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"success": False, "message": f"format must be one of: {', '.join(sorted(EXPORT_FORMATS))}"}), 400
+    fields = None
+    if args.get('fields'):
+        fields = [f.strip() for f in args['fields'].split(',') if f.strip()]
+        unknown = [f for f in fields if f not in COMPLAINT_COLUMNS]
+        if unknown:
+            return jsonify({"success": False, "message": f"Unknown fields: {', '.join(unknown)}"}), 400
+    filters = {
+        'columns': fields,
+        'department': args.get('department'),
+        'statuses': [s.strip() for s in args.get('status', '').split(',') if s.strip()],
+        'date_from': args.get('from'),
+        'date_to': args.get('to')
+    }
+    try:
+        export_query(**filters)
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid date: {e}"}), 400
+
+    def generate():
+        # The pooled connection is held only while the response is being streamed
+        with db_connection() as conn:
+            yield from export_chunks(conn, fmt, **filters)
+
+    filename = f"complaints-{datetime.now():%Y%m%d-%H%M%S}.{fmt}"
+    return Response(generate(), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/hotspots')
+def get_hotspots():
+    """
+    Precomputed complaint clusters for the map, largest first:
+    ?department=, ?category=, ?min_count=, ?bbox=min_lat,min_lon,max_lat,max_lon,
+    ?limit= and ?members=1 to include each cluster's complaint ids.
+    """
+    try:
+        args = request.args
+        bbox = None
+        if args.get('bbox'):
+            bbox = [float(x) for x in args['bbox'].split(',')]
+            if len(bbox) != 4:
+                return jsonify({"success": False, "message": "bbox must be min_lat,min_lon,max_lat,max_lon"}), 400
+        limit = min(max(int(args.get('limit', 500)), 1), 2000)
+        clusters = hotspot_engine.hotspots(department=args.get('department'), category=args.get('category'),
+                                           bbox=bbox, min_count=int(args.get('min_count', 0)) or None, limit=limit)
+        members = hotspot_engine.members([c['id'] for c in clusters]) if args.get('members') == '1' else None
+        hotspots = []
+        for c in clusters:
+            hotspot = {
+                'id': c['id'],
+                'department': c['department'],
+                'category': c['category'],
+                'latitude': c['centroid_lat'],
+                'longitude': c['centroid_lon'],
+                'complaint_count': c['complaint_count'],
+                'radius_m': c['radius_m'],
+                'last_reported_at': c['last_reported_at'],
+                'updated_at': c['updated_at']
+            }
+            if members is not None:
+                hotspot['complaint_ids'] = members.get(c['id'], [])
+            hotspots.append(hotspot)
+        return jsonify({"success": True, "hotspots": hotspots, "count": len(hotspots)}), 200
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid parameter: {e}"}), 400
+    except Exception as e:
+        print(f"Error loading hotspots: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@app.route('/api/events')
+def complaint_event_stream():
+    """
+    Server-Sent Events feed of complaint created/updated/transferred/escalated
+    events, optionally for one ?department=. EventSource reconnects with the
+    Last-Event-ID header and gets the events it missed.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid Last-Event-ID"}), 400
+    if not event_bus.open_stream():
+        response = jsonify({"success": False, "message": "Too many live streams, try again shortly"})
+        response.headers['Retry-After'] = str(EVENT_STREAM_RETRY_SECONDS)
+        return response, 503
+    stream = event_bus.stream(request.args.get('department'), last_event_id, max_seconds=EVENT_STREAM_SECONDS)
+    response = Response(stream, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(event_bus.close_stream)
+    return response
 
 @app.route('/api/complaint/<cid>', methods=['GET'])
+@conditional(lambda cid: [f"complaint:{cid}"])
 def get_complaint_details(cid):
     """Get details of a single complaint by ID"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        query = format_sql("SELECT * FROM complaints WHERE id = ?")
-        cursor.execute(query, (cid,))
-        c = cursor.fetchone()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            query = format_sql("SELECT * FROM complaints WHERE id = ?")
+            cursor.execute(query, (cid,))
+            c = cursor.fetchone()
         if c:
             return jsonify({"success": True, "complaint": dict(c)}), 200
         return jsonify({"success": False, "message": "Not found"}), 404
@@ -1197,60 +2022,70 @@ def update(cid):
         transferred_by = d.get('transferred_by', 'Official')
         transfer_reason = d.get('transfer_reason', '')
         
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        
-        curr_query = format_sql('SELECT * FROM complaints WHERE id=?', conn)
-        curr = cursor.execute(curr_query, (cid,)).fetchone()
-        
-        if not curr:
-            conn.close()
-            return jsonify({"success": False, "message": "Complaint not found"}), 404
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
         
-        upd_q_parts = ["status=?", "resolution_summary=?"]
-        upd_p = [status, summary]
+            curr = select_for_update(cursor, conn, 'SELECT * FROM complaints WHERE id=?', (cid,))
         
-        citizen_lang = curr['citizen_language'] if curr['citizen_language'] else 'en'
+            if not curr:
+                return jsonify({"success": False, "message": "Complaint not found"}), 404
         
-        if 'resolution_proof' in request.files:
-            f = request.files['resolution_proof']
-            if f and allowed_file(f.filename):
-                fn = secure_filename(f.filename)
-                proof = f"res_{int(time.time())}_{fn}"
-                f.save(os.path.join(app.config['UPLOAD_FOLDER'], proof))
-                upd_q_parts.append("resolution_proof=?")
-                upd_p.append(proof)
-
-        # Handle department transfer
-        if status == 'Forwarded' and forward_dept:
-            old_dept = curr['department']
-            upd_q_parts.extend(["department=?", "assigned_to=?", "transfer_count=?"])
-            upd_p.extend([forward_dept, f"{forward_dept}_Manager", 
-                         (curr['transfer_count'] or 0) + 1])
+            # Keep the spatial index to open complaints only; closing clears the escalation
+            esc_level, esc_next = stored_escalation(curr['escalation_level'], status, curr['sla_deadline'], curr['sla_hours'])
+            now = datetime.now().isoformat()
+            upd_q_parts = ["status=?", "resolution_summary=?", "geo_cell=?", "escalation_level=?", "next_escalation_at=?", "updated_at=?"]
+            upd_p = [status, summary, indexed_cell(curr['latitude'], curr['longitude'], status), esc_level, esc_next, now]
+        
+            citizen_lang = curr['citizen_language'] if curr['citizen_language'] else 'en'
+        
+            if 'resolution_proof' in request.files:
+                f = request.files['resolution_proof']
+                if f and allowed_file(f.filename):
+                    fn = secure_filename(f.filename)
+                    proof = f"res_{int(time.time())}_{fn}"
+                    f.save(os.path.join(app.config['UPLOAD_FOLDER'], proof))
+                    upd_q_parts.append("resolution_proof=?")
+                    upd_p.append(proof)
+
+            # Handle department transfer
+            if status == 'Forwarded' and forward_dept:
+                old_dept = curr['department']
+                upd_q_parts.extend(["department=?", "assigned_to=?", "transfer_count=?"])
+                upd_p.extend([forward_dept, f"{forward_dept}_Manager", 
+                             (curr['transfer_count'] or 0) + 1])
             
-            # Log transfer history
-            transfer_query = format_sql('''INSERT INTO complaint_transfers 
-                           (complaint_id, from_department, to_department, transferred_by, transfer_reason, transferred_at)
-                           VALUES (?,?,?,?,?,?)''', conn)
-            cursor.execute(transfer_query,
-                        (cid, old_dept, forward_dept, transferred_by, transfer_reason, 
-                         datetime.now().isoformat()))
-
-        # Handle rejection
-        if status == 'Rejected' and rejection_reason:
-            upd_q_parts.append("rejection_reason=?")
-            upd_p.append(rejection_reason)
-
-        if status == 'Resolved':
-            upd_q_parts.append("resolved_at=?")
-            upd_p.append(datetime.now().isoformat())
-
-        upd_q = format_sql(f"UPDATE complaints SET {', '.join(upd_q_parts)} WHERE id=?", conn)
-        upd_p.append(cid)
-        
-        cursor.execute(upd_q, tuple(upd_p))
-        conn.commit()
-        conn.close()
+                # Log transfer history
+                transfer_query = format_sql('''INSERT INTO complaint_transfers 
+                               (complaint_id, from_department, to_department, transferred_by, transfer_reason, transferred_at)
+                               VALUES (?,?,?,?,?,?)''', conn)
+                cursor.execute(transfer_query,
+                            (cid, old_dept, forward_dept, transferred_by, transfer_reason, now))
+
+            # Handle rejection
+            if status == 'Rejected' and rejection_reason:
+                upd_q_parts.append("rejection_reason=?")
+                upd_p.append(rejection_reason)
+
+            if status == 'Resolved':
+                upd_q_parts.append("resolved_at=?")
+                upd_p.append(now)
+
+            upd_q = format_sql(f"UPDATE complaints SET {', '.join(upd_q_parts)} WHERE id=?", conn)
+            upd_p.append(cid)
+        
+            cursor.execute(upd_q, tuple(upd_p))
+            cursor.execute(format_sql('SELECT * FROM complaints WHERE id=?', conn), (cid,))
+            after = dict(cursor.fetchone())
+            if bool(curr['geo_cell']) != bool(after['geo_cell']):
+                index_complaint(cursor, conn, after)  # closed (or reopened): leave (or rejoin) the text index
+            apply_rollup_change(cursor, conn, curr, after)
+            bump_versions(cursor, conn, complaint_scopes(dict(curr), forward_dept))
+            record_event(cursor, conn, 'transferred' if after['department'] != curr['department'] else 'updated',
+                         after, previous_department=curr['department'])
+            conn.commit()
+        event_bus.notify()
+        analytics_engine.invalidate(curr['department'], forward_dept)
+        escalation_scheduler.schedule(cid, esc_next)
         return jsonify({"success": True, "message": f"Complaint {status}"}), 200
     except Exception as e:
         print(e)
@@ -1260,13 +2095,12 @@ def update(cid):
 def get_transfer_history(cid):
     """Get transfer history for a complaint"""
     try:
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        query = format_sql('''SELECT * FROM complaint_transfers 
-                                   WHERE complaint_id=? 
-                                   ORDER BY transferred_at DESC''', conn)
-        transfers = cursor.execute(query, (cid,)).fetchall()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            query = format_sql('''SELECT * FROM complaint_transfers 
+                                       WHERE complaint_id=? 
+                                       ORDER BY transferred_at DESC''', conn)
+            transfers = cursor.execute(query, (cid,)).fetchall()
         
         res = [dict(t) for t in transfers]
         return jsonify({"success": True, "transfers": res}), 200
@@ -1278,13 +2112,18 @@ def get_transfer_history(cid):
 def feedback(cid):
     try:
         d = request.json
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        
-        q = format_sql('UPDATE complaints SET citizen_feedback_rating=?, citizen_feedback_comments=? WHERE id=?', conn)
-        cursor.execute(q, (d['rating'], d.get('comment',''), cid))
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            
+            before = select_for_update(cursor, conn, 'SELECT * FROM complaints WHERE id=?', (cid,))
+            q = format_sql('UPDATE complaints SET citizen_feedback_rating=?, citizen_feedback_comments=?, updated_at=? WHERE id=?', conn)
+            cursor.execute(q, (d['rating'], d.get('comment',''), datetime.now().isoformat(), cid))
+            if before:
+                cursor.execute(format_sql(ROLLUP_SOURCE_SQL, conn), (cid,))
+                apply_rollup_change(cursor, conn, before, cursor.fetchone())
+                bump_versions(cursor, conn, complaint_scopes(dict(before)))
+            conn.commit()
+        analytics_engine.invalidate()
         return jsonify({"success": True}), 200
     except Exception as e:
         print(f"Feedback error: {e}")
@@ -1294,15 +2133,14 @@ def feedback(cid):
 def add_official():
     try:
         d = request.json
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        query = format_sql('''INSERT INTO officials 
-                       (username, password_hash, govt_id, name, department, email, phone) 
-                       VALUES (?,?,?,?,?,?,?)''', conn)
-        cursor.execute(query, (d['username'], hash_password(d['password']), d['govt_id'], 
-                      d['name'], d['department'], d.get('email'), d.get('phone')))
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            query = format_sql('''INSERT INTO officials 
+                           (username, password_hash, govt_id, name, department, email, phone) 
+                           VALUES (?,?,?,?,?,?,?)''', conn)
+            cursor.execute(query, (d['username'], hash_password(d['password']), d['govt_id'], 
+                          d['name'], d['department'], d.get('email'), d.get('phone')))
+            conn.commit()
         return jsonify({"success": True}), 200
     except Exception as e: 
         print(e)
@@ -1312,39 +2150,18 @@ def add_official():
 def get_file(fn): 
     return send_from_directory(app.config['UPLOAD_FOLDER'], fn)
 
+# Dashboard aggregates from the rollup tables, cached per department until its change version moves (see analytics.py)
+analytics_engine = AnalyticsEngine(ttl_seconds=int(os.getenv('ANALYTICS_CACHE_SECONDS', 60)))
+
 @app.route('/api/analytics/dashboard', methods=['GET'])
 def analytics():
     try:
         dept = request.args.get('department')
-        conn = get_db()
-        cursor = get_db_cursor(conn)
-        
-        q_base = "FROM complaints WHERE 1=1"
-        p = []
-        if dept: 
-            q_base += " AND department = ?"
-            p.append(dept)
-        
-        query_count = format_sql(f"SELECT COUNT(*) {q_base}", conn)
-        cursor.execute(query_count, tuple(p))
-        tot = cursor.fetchone()
-        count = tot[0] if isinstance(tot, (list, tuple)) else tot['count'] if 'count' in tot else tot[list(tot.keys())[0]]
-        
-        query_avg = format_sql(f"SELECT AVG(citizen_feedback_rating) {q_base}", conn)
-        cursor.execute(query_avg, tuple(p))
-        avg_row = cursor.fetchone()
-        avg_r = avg_row[0] if isinstance(avg_row, (list, tuple)) else avg_row['avg'] if 'avg' in avg_row else avg_row[list(avg_row.keys())[0]]
-        avg_r = avg_r or 0
-        
-        conn.close()
-        return jsonify({"success": True, "analytics": {
-            "total_complaints": count, 
-            "avg_citizen_rating": round(float(avg_r), 1), 
-            "avg_resolution_hours": 0
-        }}), 200
+        return jsonify({"success": True, "analytics": analytics_engine.dashboard(dept)}), 200
     except Exception as e:
         print(f"Analytics Error: {e}")
         return jsonify({"success": False, "message": str(e)}), 500
+
 @app.route('/api/test_email', methods=['POST'])
 def test_email_route():
     try:
@@ -0,0 +1,355 @@
+"""
+Batch Re-analysis
+Re-scores existing complaints with Gemini, many complaints per request:
+each prompt lists up to `batch_size` descriptions with their ids and asks
+for a JSON array of results keyed by id. Batches run on a thread pool under
+a concurrency limit and a requests-per-second budget, are retried with
+backoff on 429/5xx, and each finished batch is written back in one
+transaction (app.apply_reanalysis). Progress is checkpointed to a JSON file
+so an interrupted run resumes where it stopped. Complaints Gemini did not
+answer for, even after retries, are listed in the checkpoint's failed_ids
+(the cursor moves on) and re-run with --retry-failed:
+
+    python batch_analysis.py --stale                    # keyword fallbacks and old prompt versions
+    python batch_analysis.py --department Water_Supply_Dept --status Pending \
+                             --batch-size 25 --concurrency 4 --qps 2
+    python batch_analysis.py --retry-failed
+
+GEMINI_API_URL / GEMINI_API_KEY come from the environment (or --api-url),
+so a run can be pointed at a local fake server.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+
+from db_config import db_connection, get_db_cursor, format_sql
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QPS = 2.0
+MAX_ATTEMPTS = 4
+
+class RequestBudget:
+    """Spaces request starts at least 1/qps seconds apart across all threads"""
+
+    def __init__(self, qps):
+        self.interval = 1.0 / qps if qps and qps > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def build_batch_prompt(items, guide):
+    """items: [{'id', 'description', 'category'}] -> one prompt asking for a result per id"""
+    listing = json.dumps([{'id': item['id'], 'description': item['description'], 'category': item['category']}
+                          for item in items], ensure_ascii=False, indent=1)
+    return f"""Analyze each complaint below and provide ONLY a JSON array (no markdown, no code blocks),
+with exactly one object per complaint, in this form:
+[
+    {{"id": "<the complaint's id>", "priority": 1-10 (1=highest urgency, 10=lowest),
+      "sentiment": "positive/neutral/negative", "detected_department": "department name"}}
+]
+
+{guide}
+
+Complaints:
+{listing}"""
+
+def parse_batch_response(text, ids):
+    """{id: analysis} for the requested ids found in the model's JSON; anything else is ignored"""
+    text = text.replace('```json', '').replace('```', '').strip()
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get('results') or data.get('complaints') or []
+    wanted, results = set(ids), {}
+    for entry in data:
+        if not isinstance(entry, dict) or str(entry.get('id')) not in wanted:
+            continue
+        try:
+            priority = min(max(int(entry.get('priority', 5)), 1), 10)
+        except (TypeError, ValueError):
+            priority = 5
+        results[str(entry['id'])] = {
+            'priority': priority,
+            'sentiment': entry.get('sentiment') or 'neutral',
+            'detected_department': entry.get('detected_department')
+        }
+    return results
+
+class GeminiBatchClient:
+    """One generateContent call per batch, with retries for rate limits and server errors"""
+
+    def __init__(self, api_url, api_key, guide, budget, timeout=60, max_attempts=MAX_ATTEMPTS):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.guide = guide
+        self.budget = budget
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.session = requests.Session()
+
+    def analyze(self, items):
+        """{id: analysis} for the items the model answered; raises after the last failed attempt"""
+        payload = {
+            "contents": [{"parts": [{"text": build_batch_prompt(items, self.guide)}]}],
+            "generationConfig": {"responseMimeType": "application/json"}
+        }
+        for attempt in range(1, self.max_attempts + 1):
+            self.budget.wait()
+            try:
+                response = self.session.post(f"{self.api_url}?key={self.api_key}", json=payload, timeout=self.timeout)
+                if response.status_code == 200:
+                    text = response.json()['candidates'][0]['content']['parts'][0]['text']
+                    return parse_batch_response(text, [item['id'] for item in items])
+                if response.status_code != 429 and response.status_code < 500:
+                    raise RuntimeError(f"Gemini API error {response.status_code}: {response.text[:200]}")
+                error = f"Gemini API error {response.status_code}"
+                retry_after = response.headers.get('Retry-After')
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+            except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+                error, delay = f"{type(e).__name__}: {e}", 2 ** attempt
+            if attempt == self.max_attempts:
+                raise RuntimeError(error)
+            print(f"⚠️  {error}; retrying batch in {delay:.0f}s (attempt {attempt}/{self.max_attempts})")
+            time.sleep(delay)
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_checkpoint(path, checkpoint):
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def select_complaints(after=None, department=None, statuses=None, since=None, limit=500):
+    """Next page of complaints to analyze, in (created_at, id) order after the cursor `after`"""
+    where, params = ["1=1"], []
+    if after:
+        where.append("(created_at > ? OR (created_at = ? AND id > ?))"); params += [after[0], after[0], after[1]]
+    if department:
+        where.append("department = ?"); params.append(department)
+    if statuses:
+        where.append(f"status IN ({','.join('?' * len(statuses))})"); params.extend(statuses)
+    if since:
+        where.append("created_at >= ?"); params.append(since)
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql(f'''SELECT id, category, description, description_translated, created_at, ai_analysis
+                                      FROM complaints WHERE {' AND '.join(where)}
+                                      ORDER BY created_at, id LIMIT ?''', conn), (*params, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+def prompt_version(ai_analysis):
+    """prompt_version of a stored analysis; None for keyword fallbacks and unreadable JSON"""
+    try:
+        analysis = json.loads(ai_analysis) if ai_analysis else None
+    except ValueError:
+        return None
+    return analysis.get('prompt_version') if isinstance(analysis, dict) else None
+
+def iter_batches(batch_size, after=None, page_size=500, stale_version=None, **filters):
+    """
+    Yield lists of {'id', 'description', 'category', 'key'} batch_size at a
+    time. With stale_version, only complaints whose analysis came from
+    another prompt version (or from the keyword fallback) are included.
+    """
+    batch = []
+    while True:
+        rows = select_complaints(after=after, limit=page_size, **filters)
+        for row in rows:
+            # Checked on the parsed JSON: a LIKE on the text depends on its separators and matches prefixes
+            if stale_version and prompt_version(row['ai_analysis']) == stale_version:
+                continue
+            batch.append(_batch_item(row))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if len(rows) < page_size:
+            break
+        after = (rows[-1]['created_at'], rows[-1]['id'])
+    if batch:
+        yield batch
+
+def iter_id_batches(ids, batch_size):
+    """Batches of the given complaints (e.g. a checkpoint's failed_ids), in the same form as iter_batches()"""
+    ids = list(dict.fromkeys(ids))
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql(f'''SELECT id, category, description, description_translated, created_at
+                                          FROM complaints WHERE id IN ({','.join('?' * len(chunk))})
+                                          ORDER BY created_at, id''', conn), tuple(chunk))
+            rows = cursor.fetchall()
+        if rows:
+            yield [_batch_item(row) for row in rows]
+
+def _batch_item(row):
+    return {
+        'id': row['id'],
+        'description': row['description_translated'] or row['description'] or '',
+        'category': '' if row['category'] in (None, 'Auto-Detected') else row['category'],
+        'key': [row['created_at'], row['id']]
+    }
+
+class BatchReanalyzer:
+    """Runs batches concurrently, writes each one back, and keeps the checkpoint file current"""
+
+    def __init__(self, client, apply_results, prompt_version, concurrency=DEFAULT_CONCURRENCY,
+                 checkpoint_path=None, dry_run=False):
+        self.client = client
+        self.apply_results = apply_results
+        self.prompt_version = prompt_version
+        self.concurrency = concurrency
+        self.checkpoint_path = checkpoint_path
+        self.dry_run = dry_run
+        self.checkpoint = {}
+
+    def _process(self, batch):
+        results = self.client.analyze(batch)
+        missing = [item for item in batch if item['id'] not in results]
+        if missing and len(missing) < len(batch):
+            # The model skipped some: ask again for just those, keeping what we have if that fails
+            try:
+                results.update(self.client.analyze(missing))
+            except Exception as e:
+                print(f"⚠️  Retry for {len(missing)} skipped complaint(s) failed: {e}")
+        for analysis in results.values():
+            analysis['prompt_version'] = self.prompt_version
+        rerouted = 0 if self.dry_run else self.apply_results(results)
+        return results, rerouted
+
+    def run(self, batches, filters=None, retry_failed=False):
+        """
+        Process every batch; returns the final checkpoint dict. With
+        retry_failed the batches are the checkpoint's failed_ids again: the
+        cursor and filters are left alone, and ids that succeed now leave
+        failed_ids.
+        """
+        checkpoint = self.checkpoint = dict(load_checkpoint(self.checkpoint_path) if self.checkpoint_path else {})
+        checkpoint.setdefault('processed', 0)
+        checkpoint.setdefault('updated', 0)
+        checkpoint.setdefault('rerouted', 0)
+        checkpoint.setdefault('failed_ids', [])
+        if not retry_failed:
+            checkpoint['filters'] = filters or {}
+        checkpoint['prompt_version'] = self.prompt_version
+
+        # The cursor only advances past a batch once every earlier batch has finished too
+        finished, next_to_commit = {}, 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            running = {}
+            batches = iter(enumerate(batches))
+            exhausted = False
+            while running or not exhausted:
+                while not exhausted and len(running) < self.concurrency * 2:
+                    try:
+                        seq, batch = next(batches)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    running[pool.submit(self._process, batch)] = (seq, batch)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    seq, batch = running.pop(future)
+                    try:
+                        results, rerouted = future.result()
+                    except Exception as e:
+                        print(f"❌ Batch of {len(batch)} failed: {e}")
+                        results, rerouted = {}, 0
+                    if not retry_failed:
+                        checkpoint['processed'] += len(batch)
+                    checkpoint['updated'] += len(results)
+                    checkpoint['rerouted'] += rerouted
+                    # A failed batch does not hold the cursor back: its ids wait here for --retry-failed
+                    failed = [i for i in checkpoint['failed_ids'] if i not in results]
+                    listed = set(failed)
+                    failed.extend(item['id'] for item in batch if item['id'] not in results and item['id'] not in listed)
+                    checkpoint['failed_ids'] = failed
+                    finished[seq] = batch[-1]['key']
+                while next_to_commit in finished:
+                    key = finished.pop(next_to_commit)
+                    if not retry_failed:
+                        checkpoint['cursor'] = key
+                    next_to_commit += 1
+                checkpoint['elapsed_seconds'] = round(time.monotonic() - started, 1)
+                if self.checkpoint_path:
+                    save_checkpoint(self.checkpoint_path, checkpoint)
+                print(f"📦 {checkpoint['processed']} analyzed, {checkpoint['updated']} updated, "
+                      f"{checkpoint['rerouted']} re-routed, {len(checkpoint['failed_ids'])} failed")
+        return checkpoint
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Re-analyze existing complaints with batched Gemini requests')
+    parser.add_argument('--department')
+    parser.add_argument('--status', help='comma separated')
+    parser.add_argument('--since', help='created on or after (YYYY-MM-DD)')
+    parser.add_argument('--stale', action='store_true',
+                        help='only complaints not analyzed with the current prompt version')
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('AI_BATCH_SIZE', DEFAULT_BATCH_SIZE)))
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('AI_BATCH_CONCURRENCY', DEFAULT_CONCURRENCY)))
+    parser.add_argument('--qps', type=float, default=float(os.getenv('AI_BATCH_QPS', DEFAULT_QPS)),
+                        help='max Gemini requests started per second (0 = unlimited)')
+    parser.add_argument('--timeout', type=int, default=60, help='seconds per Gemini request')
+    parser.add_argument('--checkpoint', default='reanalysis.checkpoint.json')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="re-analyze only the checkpoint's failed_ids (the cursor stays where it is)")
+    parser.add_argument('--api-url', help='override GEMINI_API_URL (e.g. a local fake server)')
+    parser.add_argument('--dry-run', action='store_true', help='call Gemini but write nothing back')
+    args = parser.parse_args()
+
+    # The write-back reuses the app's routing, SLA and rollup logic
+    from app import apply_reanalysis, AI_ANALYSIS_GUIDE, AI_PROMPT_VERSION, GEMINI_API_URL, GEMINI_API_KEY
+
+    if not GEMINI_API_KEY:
+        raise SystemExit("❌ GEMINI_API_KEY is not set")
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    filters = {
+        'department': args.department,
+        'statuses': [s.strip() for s in args.status.split(',')] if args.status else None,
+        'since': args.since,
+        'stale_version': AI_PROMPT_VERSION if args.stale else None
+    }
+    previous = load_checkpoint(args.checkpoint)
+    if args.retry_failed:
+        if not previous.get('failed_ids'):
+            raise SystemExit(f"✅ No failed complaints in {args.checkpoint}")
+    elif previous.get('cursor') and previous.get('filters') != filters:
+        raise SystemExit(f"❌ {args.checkpoint} is from a run with other filters; use --restart or another --checkpoint")
+
+    client = GeminiBatchClient(args.api_url or GEMINI_API_URL, GEMINI_API_KEY, AI_ANALYSIS_GUIDE,
+                               RequestBudget(args.qps), timeout=args.timeout)
+    reanalyzer = BatchReanalyzer(client, apply_reanalysis, AI_PROMPT_VERSION, concurrency=args.concurrency,
+                                 checkpoint_path=args.checkpoint, dry_run=args.dry_run)
+    if args.retry_failed:
+        result = reanalyzer.run(iter_id_batches(previous['failed_ids'], args.batch_size), retry_failed=True)
+    else:
+        # With --stale, updated rows drop out of the filter, but paging is by cursor so nothing is skipped
+        result = reanalyzer.run(iter_batches(args.batch_size, after=previous.get('cursor'), **filters), filters)
+    print(f"✅ Re-analysis finished: {result['updated']} of {result['processed']} complaint(s) updated, "
+          f"{result['rerouted']} re-routed ({result['elapsed_seconds']}s)")
+    if result['failed_ids']:
+        print(f"⚠️  {len(result['failed_ids'])} complaint(s) not analyzed; see failed_ids in {args.checkpoint}, "
+              f"retry them with --retry-failed")
@@ -0,0 +1,190 @@
+"""
+Two-Tier Cache
+An in-process LRU in front of the cache_entries table, which is shared by
+every gunicorn worker (and survives restarts). Entries expire after a TTL;
+the memory tier is bounded by entry count and the table by row count.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from db_config import db_connection, get_db_cursor, format_sql, is_postgres
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of free text, for cache keys"""
+    return re.sub(r'\s+', ' ', (text or '')).strip().lower()
+
+def make_key(*parts):
+    """Stable SHA-256 key from the given parts"""
+    return hashlib.sha256('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+class TieredCache:
+    """LRU (per process) + database (shared) cache for JSON-serializable values"""
+
+    def __init__(self, namespace, max_memory_entries=1000, ttl_seconds=86400,
+                 max_db_rows=50000, prune_every=500):
+        self.namespace = namespace
+        self.max_memory_entries = max_memory_entries
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_db_rows = max_db_rows
+        self.prune_every = prune_every
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'sets': 0,
+                       'evictions': 0, 'pruned_rows': 0, 'errors': 0}
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def _remember(self, key, expires_at, value):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _from_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self._stats['memory_hits'] += 1
+            return entry[1]
+
+    def get(self, key):
+        """Cached value or None"""
+        now = datetime.now()
+        value = self._from_memory(key, now)
+        if value is not None:
+            return value
+        try:
+            with db_connection() as conn:
+                cursor = get_db_cursor(conn)
+                cursor.execute(format_sql('''SELECT value, expires_at FROM cache_entries
+                                             WHERE namespace = ? AND cache_key = ? AND expires_at > ?''', conn),
+                               (self.namespace, key, now.isoformat()))
+                row = cursor.fetchone()
+        except Exception as e:
+            print(f"⚠️  Cache read error ({self.namespace}): {e}")
+            self._count('errors')
+            row = None
+        if row is None:
+            self._count('misses')
+            return None
+        value = json.loads(row['value'])
+        self._remember(key, datetime.fromisoformat(row['expires_at']), value)
+        self._count('db_hits')
+        return value
+
+    def get_many(self, keys):
+        """{key: value} for every cached key; the database is read once for all memory misses"""
+        now = datetime.now()
+        found = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            value = self._from_memory(key, now)
+            if value is not None:
+                found[key] = value
+            else:
+                missing.append(key)
+        if not missing:
+            return found
+        try:
+            with db_connection() as conn:
+                cursor = get_db_cursor(conn)
+                placeholders = ', '.join('?' * len(missing))
+                cursor.execute(format_sql(f'''SELECT cache_key, value, expires_at FROM cache_entries
+                                              WHERE namespace = ? AND expires_at > ?
+                                              AND cache_key IN ({placeholders})''', conn),
+                               (self.namespace, now.isoformat(), *missing))
+                rows = cursor.fetchall()
+        except Exception as e:
+            print(f"⚠️  Cache read error ({self.namespace}): {e}")
+            self._count('errors')
+            rows = []
+        for row in rows:
+            value = json.loads(row['value'])
+            self._remember(row['cache_key'], datetime.fromisoformat(row['expires_at']), value)
+            found[row['cache_key']] = value
+        self._count('db_hits', len(rows))
+        self._count('misses', len(missing) - len(rows))
+        return found
+
+    def set(self, key, value):
+        """Store a value in both tiers"""
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        """Store {key: value} in both tiers; the database is written in one transaction"""
+        if not items:
+            return
+        now = datetime.now()
+        expires_at = now + self.ttl
+        for key, value in items.items():
+            self._remember(key, expires_at, value)
+        self._count('sets', len(items))
+        try:
+            with db_connection() as conn:
+                cursor = get_db_cursor(conn)
+                cursor.executemany(format_sql('''INSERT INTO cache_entries (namespace, cache_key, value, created_at, expires_at)
+                                                 VALUES (?, ?, ?, ?, ?)
+                                                 ON CONFLICT (namespace, cache_key) DO UPDATE SET
+                                                     value = excluded.value,
+                                                     created_at = excluded.created_at,
+                                                     expires_at = excluded.expires_at''', conn),
+                                   [(self.namespace, key, json.dumps(value, ensure_ascii=False),
+                                     now.isoformat(), expires_at.isoformat()) for key, value in items.items()])
+                conn.commit()
+        except Exception as e:
+            print(f"⚠️  Cache write error ({self.namespace}): {e}")
+            self._count('errors')
+            return
+
+        with self._lock:
+            self._writes_since_prune += len(items)
+            due = self._writes_since_prune >= self.prune_every
+            if due:
+                self._writes_since_prune = 0
+        if due:
+            self.prune()
+
+    def prune(self):
+        """Delete expired rows, then the oldest rows beyond max_db_rows"""
+        try:
+            with db_connection() as conn:
+                cursor = get_db_cursor(conn)
+                cursor.execute(format_sql('DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?', conn),
+                               (self.namespace, datetime.now().isoformat()))
+                removed = cursor.rowcount or 0
+                # Size bound: keep only the newest max_db_rows entries
+                overflow = '''DELETE FROM cache_entries WHERE namespace = ? AND cache_key IN (
+                                  SELECT cache_key FROM cache_entries WHERE namespace = ?
+                                  ORDER BY created_at DESC {} OFFSET ?)'''.format('' if is_postgres(conn) else 'LIMIT -1')
+                cursor.execute(format_sql(overflow, conn), (self.namespace, self.namespace, self.max_db_rows))
+                removed += cursor.rowcount or 0
+                conn.commit()
+            self._count('pruned_rows', removed)
+            return removed
+        except Exception as e:
+            print(f"⚠️  Cache prune error ({self.namespace}): {e}")
+            self._count('errors')
+            return 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,90 @@
+"""
+Change Versions
+A version counter per scope ('all', 'dept:<name>', 'citizen:<phone>',
+'complaint:<id>') in the change_versions table, bumped in the same
+transaction as every complaint write. Read endpoints derive their ETag from
+the versions of the scopes they depend on, so a conditional request
+(If-None-Match / If-Modified-Since) is answered with 304 after one small
+indexed read, without running the listing query.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, make_response
+from werkzeug.http import is_resource_modified
+
+from db_config import db_connection, get_db_cursor, format_sql
+
+def complaint_scopes(complaint, *other_departments):
+    """Scopes whose responses change when this complaint row changes"""
+    scopes = ['all', f"complaint:{complaint['id']}"]
+    for dept in (complaint.get('department'), *other_departments):
+        if dept and f"dept:{dept}" not in scopes:
+            scopes.append(f"dept:{dept}")
+    if complaint.get('citizen_phone'):
+        scopes.append(f"citizen:{complaint['citizen_phone']}")
+    return scopes
+
+def bump_versions(cursor, conn, scopes):
+    """Increment each scope's version; call inside the transaction that changes the data"""
+    # UTC with offset: Last-Modified is an HTTP date, which is always GMT
+    now = datetime.now(timezone.utc).isoformat()
+    for scope in scopes:
+        cursor.execute(format_sql('''INSERT INTO change_versions (scope, version, updated_at) VALUES (?, 1, ?)
+                                     ON CONFLICT (scope) DO UPDATE SET version = change_versions.version + 1,
+                                                                       updated_at = excluded.updated_at''', conn),
+                       (scope, now))
+
+def read_versions(scopes):
+    """{scope: (version, updated_at)}; scopes never bumped are (0, None)"""
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql(f"SELECT scope, version, updated_at FROM change_versions "
+                                  f"WHERE scope IN ({','.join('?' * len(scopes))})", conn), tuple(scopes))
+        found = {row['scope']: (row['version'], row['updated_at']) for row in cursor.fetchall()}
+    return {scope: found.get(scope, (0, None)) for scope in scopes}
+
+def as_utc(stamp):
+    """Aware UTC datetime from a stored updated_at (rows written before it was UTC are local time)"""
+    return datetime.fromisoformat(stamp).astimezone(timezone.utc)
+
+def conditional(scopes_for_request):
+    """
+    Decorator for a Flask view returning (response, status): adds ETag and
+    Last-Modified to 200 responses and answers a matching conditional
+    request with 304. scopes_for_request(*view_args) names the scopes the
+    response depends on (None skips the check, e.g. for a bad request).
+    """
+    def decorate(view):
+        @wraps(view)
+        def conditional_view(*args, **kwargs):
+            scopes = scopes_for_request(*args, **kwargs)
+            if not scopes:
+                return view(*args, **kwargs)
+            try:
+                # Read before the view runs: a write in between only makes the ETag older than the body
+                versions = read_versions(scopes)
+            except Exception as e:
+                print(f"⚠️  Change version read error: {e}")
+                return view(*args, **kwargs)
+            tag = '|'.join(f"{scope}={versions[scope][0]}" for scope in scopes)
+            etag = hashlib.sha1(f"{request.full_path}|{tag}".encode('utf-8')).hexdigest()[:24]
+            stamps = [as_utc(versions[scope][1]) for scope in scopes if versions[scope][1]]
+            last_modified = max(stamps).replace(microsecond=0) if stamps else None
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            # Browsers keep the body but revalidate it on every request
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return conditional_view
+    return decorate
@@ -5,6 +5,9 @@ Supports both PostgreSQL (for deployment) and SQLite (for local development)
 
 import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from urllib.parse import urlparse
 
 # Try to import PostgreSQL driver
@@ -21,7 +24,17 @@ except ImportError:
 DATABASE_URL = os.environ.get('DATABASE_URL')  # From Render or other hosting
 SQLITE_DB = 'grievance.db'  # Fallback local database
 
-def get_db():
+# Connection pool configuration (per worker process)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))             # max open connections per worker
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))     # seconds to wait for a free connection
+DB_POOL_MAX_USES = int(os.environ.get('DB_POOL_MAX_USES', 1000))   # recycle a connection after N checkouts
+DB_POOL_MAX_AGE = int(os.environ.get('DB_POOL_MAX_AGE', 1800))     # recycle a connection after N seconds
+DB_POOL_PING_AFTER = int(os.environ.get('DB_POOL_PING_AFTER', 30)) # health-check connections idle longer than this
+
+# Apply pending schema migrations on worker boot (set to 0 and run `python migrations.py` on deploy instead)
+DB_AUTO_MIGRATE = os.environ.get('DB_AUTO_MIGRATE', '1') != '0'
+
+def get_db(check_same_thread=True):
     """
     Get database connection - PostgreSQL if available, otherwise SQLite
     """
@@ -50,10 +63,206 @@ def get_db():
     # Use SQLite (local development or fallback)
     if not DATABASE_URL:
         print(f"📁 Using SQLite database: {SQLITE_DB}")
-    conn = sqlite3.connect(SQLITE_DB)
+    conn = sqlite3.connect(SQLITE_DB, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     return conn
 
+# ============= CONNECTION POOL =============
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT"""
+
+class _PooledConnection:
+    """Bookkeeping for one physical connection owned by the pool"""
+    __slots__ = ('conn', 'created_at', 'last_used', 'uses')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of database connections for one worker process.
+    Connections are health-checked on checkout and recycled after
+    DB_POOL_MAX_USES checkouts or DB_POOL_MAX_AGE seconds.
+    """
+
+    def __init__(self, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 max_uses=DB_POOL_MAX_USES, max_age=DB_POOL_MAX_AGE, ping_after=DB_POOL_PING_AFTER):
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self._idle = []  # LIFO so hot connections are reused first
+        self._open = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0, 'waits': 0, 'wait_time_ms': 0.0, 'max_wait_ms': 0.0,
+            'timeouts': 0, 'created': 0, 'recycled': 0, 'failed_health_checks': 0
+        }
+
+    def _expired(self, entry):
+        now = time.monotonic()
+        return ((self.max_uses and entry.uses >= self.max_uses) or
+                (self.max_age and now - entry.created_at >= self.max_age))
+
+    def _healthy(self, entry):
+        """Cheap liveness check before handing a connection out"""
+        conn = entry.conn
+        if getattr(conn, 'closed', 0):
+            return False
+        if time.monotonic() - entry.last_used < self.ping_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _close(self, entry):
+        try:
+            entry.conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Check a connection out of the pool, opening a new one if below max_size"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        entry = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s "
+                                      f"(pool size {self.max_size})")
+                waited = True
+                self._cond.wait(remaining)
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            if waited:
+                wait_ms = (time.monotonic() - start) * 1000
+                self._stats['waits'] += 1
+                self._stats['wait_time_ms'] += wait_ms
+                self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+
+        try:
+            if entry is not None and (self._expired(entry) or not self._healthy(entry)):
+                with self._cond:
+                    if self._expired(entry):
+                        self._stats['recycled'] += 1
+                    else:
+                        self._stats['failed_health_checks'] += 1
+                self._close(entry)
+                entry = None
+            if entry is None:
+                entry = _PooledConnection(get_db(check_same_thread=False))
+                with self._cond:
+                    self._stats['created'] += 1
+        except Exception:
+            # Give the slot back so other threads are not starved by a failed connect
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        entry.uses += 1
+        return entry
+
+    def release(self, entry):
+        """Return a connection to the pool, discarding it if broken or due for recycling"""
+        keep = True
+        try:
+            entry.conn.rollback()  # never hand out a connection with an open transaction
+        except Exception:
+            keep = False
+        if keep and self._expired(entry):
+            keep = False
+            with self._cond:
+                self._stats['recycled'] += 1
+        if keep:
+            entry.last_used = time.monotonic()
+        else:
+            self._close(entry)
+        with self._cond:
+            self._in_use -= 1
+            if keep:
+                self._idle.append(entry)
+            else:
+                self._open -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Close idle connections (checked-out ones are closed when released)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for entry in idle:
+            self._close(entry)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'wait_time_ms': round(stats['wait_time_ms'], 2),
+                'max_wait_ms': round(stats['max_wait_ms'], 2),
+                'avg_wait_ms': round(stats['wait_time_ms'] / stats['waits'], 2) if stats['waits'] else 0.0
+            })
+        return stats
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return this worker's pool, creating a fresh one after a fork (gunicorn --preload)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool()
+                _pool_pid = pid
+    return _pool
+
+@contextmanager
+def db_connection():
+    """
+    Borrow a pooled connection for the duration of a with-block.
+    Uncommitted work is rolled back when the connection goes back to the pool.
+    """
+    pool = get_pool()
+    entry = pool.acquire()
+    try:
+        yield entry.conn
+    finally:
+        pool.release(entry)
+
+def get_pool_stats():
+    """Pool counters for monitoring (in-use, waits, wait time, recycling)"""
+    return get_pool().stats()
+
 def get_db_cursor(conn):
     """
     Get a cursor that returns rows as dictionaries for both SQLite and Postgres
@@ -79,6 +288,19 @@ def format_sql(sql, conn=None):
         return sql.replace('?', '%s')
     return sql
 
+def select_for_update(cursor, conn, sql, params=()):
+    """
+    Read one row that the caller is about to modify in the same transaction:
+    row lock on Postgres (FOR UPDATE), database write lock on SQLite (BEGIN IMMEDIATE)
+    """
+    if is_postgres(conn):
+        cursor.execute(format_sql(sql + ' FOR UPDATE', conn), params)
+    else:
+        if not conn.in_transaction:
+            cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(sql, params)
+    return cursor.fetchone()
+
 def is_postgres(conn=None):
     """Check if currently using PostgreSQL"""
     if conn:
@@ -87,144 +309,22 @@ def is_postgres(conn=None):
     return DATABASE_URL and POSTGRES_AVAILABLE
 
 def init_db():
-    """Initialize database tables"""
-    conn = get_db()
-    cursor = get_db_cursor(conn)
-    
+    """
+    Bring the database schema up to date (see migrations.py).
+    With DB_AUTO_MIGRATE=0 workers only report pending migrations, and the
+    schema is migrated once per deploy with `python migrations.py`.
+    """
+    from migrations import pending_migrations, run_migrations
+
     try:
-        # Complaints table (with new fields)
-        cursor.execute('''CREATE TABLE IF NOT EXISTS complaints (
-            id TEXT PRIMARY KEY,
-            citizen_name TEXT,
-            citizen_email TEXT,
-            citizen_phone TEXT,
-            citizen_address TEXT,
-            category TEXT,
-            description TEXT,
-            media_path TEXT,
-            latitude REAL,
-            longitude REAL,
-            location_address TEXT,
-            priority INTEGER,
-            department TEXT,
-            assigned_to TEXT,
-            status TEXT DEFAULT 'Pending',
-            created_at TEXT,
-            resolved_at TEXT,
-            sla_hours INTEGER,
-            sla_deadline TEXT,
-            resolution_summary TEXT,
-            resolution_proof TEXT,
-            citizen_feedback_rating INTEGER,
-            citizen_feedback_comments TEXT,
-            ai_analysis TEXT,
-            citizen_language TEXT DEFAULT 'en',
-            description_original TEXT,
-            description_translated TEXT,
-            rejection_reason TEXT,
-            transfer_count INTEGER DEFAULT 0
-        )''')
-        
-        # Citizens table (new)
-        cursor.execute('''CREATE TABLE IF NOT EXISTS citizens (
-            id SERIAL PRIMARY KEY,
-            phone TEXT UNIQUE NOT NULL,
-            name TEXT,
-            email TEXT,
-            address TEXT,
-            created_at TEXT,
-            last_login TEXT
-        )''' if is_postgres() else '''CREATE TABLE IF NOT EXISTS citizens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            phone TEXT UNIQUE NOT NULL,
-            name TEXT,
-            email TEXT,
-            address TEXT,
-            created_at TEXT,
-            last_login TEXT
-        )''')
-        
-        # OTPs table (new)
-        cursor.execute('''CREATE TABLE IF NOT EXISTS otps (
-            id SERIAL PRIMARY KEY,
-            phone TEXT NOT NULL,
-            otp_code TEXT NOT NULL,
-            purpose TEXT,
-            created_at TEXT NOT NULL,
-            expires_at TEXT NOT NULL,
-            used BOOLEAN DEFAULT false
-        )''' if is_postgres() else '''CREATE TABLE IF NOT EXISTS otps (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            phone TEXT NOT NULL,
-            otp_code TEXT NOT NULL,
-            purpose TEXT,
-            created_at TEXT NOT NULL,
-            expires_at TEXT NOT NULL,
-            used INTEGER DEFAULT 0
-        )''')
-        
-        # Complaint transfers table (new)
-        cursor.execute('''CREATE TABLE IF NOT EXISTS complaint_transfers (
-            id SERIAL PRIMARY KEY,
-            complaint_id TEXT NOT NULL,
-            from_department TEXT,
-            to_department TEXT NOT NULL,
-            transferred_by TEXT,
-            transfer_reason TEXT,
-            transferred_at TEXT NOT NULL
-        )''' if is_postgres() else '''CREATE TABLE IF NOT EXISTS complaint_transfers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            complaint_id TEXT NOT NULL,
-            from_department TEXT,
-            to_department TEXT NOT NULL,
-            transferred_by TEXT,
-            transfer_reason TEXT,
-            transferred_at TEXT NOT NULL
-        )''')
-        
-        # Officials table
-        cursor.execute('''CREATE TABLE IF NOT EXISTS officials (
-            id SERIAL PRIMARY KEY,
-            username TEXT UNIQUE,
-            password_hash TEXT,
-            govt_id TEXT UNIQUE,
-            name TEXT,
-            department TEXT,
-            email TEXT,
-            phone TEXT,
-            preferred_language TEXT DEFAULT 'en'
-        )''' if is_postgres() else '''CREATE TABLE IF NOT EXISTS officials (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            password_hash TEXT,
-            govt_id TEXT UNIQUE,
-            name TEXT,
-            department TEXT,
-            email TEXT,
-            phone TEXT,
-            preferred_language TEXT DEFAULT 'en'
-        )''')
-        
-        # Try to add new columns to existing complaints table (for migration)
-        try:
-            cursor.execute("ALTER TABLE complaints ADD COLUMN rejection_reason TEXT")
-        except:
-            pass  # Column already exists
-        
-        try:
-            cursor.execute("ALTER TABLE complaints ADD COLUMN transfer_count INTEGER DEFAULT 0")
-        except:
-            pass  # Column already exists
-        
-        conn.commit()
+        pending = pending_migrations()
+        if pending and DB_AUTO_MIGRATE:
+            run_migrations()
+        elif pending:
+            print(f"⚠️  {len(pending)} pending migration(s). Run: python migrations.py")
         print(f"✅ Database initialized ({'PostgreSQL' if is_postgres() else 'SQLite'})")
-        
     except Exception as e:
         print(f"❌ Database initialization error: {e}")
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
 
 def get_db_info():
     """Get current database information"""
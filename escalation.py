@@ -0,0 +1,220 @@
+"""
+SLA Escalation Scheduler
+Open complaints move through escalation levels (WARNING, URGENT, CRITICAL,
+OVERDUE) as their SLA elapses. The current level is stored in
+complaints.escalation_level together with next_escalation_at, the moment
+the next threshold is crossed, so listings read a stored value instead of
+recomputing it per row.
+
+A background thread keeps a min-heap of upcoming crossings (refilled from
+the next_escalation_at index every few minutes), sleeps until the earliest
+one is due and advances that row with a conditional UPDATE. Only the
+worker whose UPDATE wins fires the notification, so every transition is
+notified exactly once even when several workers run the scheduler.
+"""
+
+import heapq
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db_config import db_connection, get_db_cursor, format_sql
+from change_versions import bump_versions, complaint_scopes
+from events import record_event
+from geo_index import CLOSED_STATUSES
+
+# Percent of the SLA window elapsed at which each level starts
+ESCALATION_LEVELS = {
+    'WARNING': 50, 'URGENT': 75, 'CRITICAL': 90, 'OVERDUE': 100
+}
+LEVEL_RANK = {'NONE': 0, **{name: i + 1 for i, name in enumerate(sorted(ESCALATION_LEVELS, key=ESCALATION_LEVELS.get))}}
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+def escalation_state(status, sla_deadline, sla_hours, now=None):
+    """(level, next_escalation_at) at `now`; next is None once closed or OVERDUE"""
+    if status in CLOSED_STATUSES or not sla_deadline or not sla_hours:
+        return 'NONE', None
+    try:
+        deadline = _as_datetime(sla_deadline)
+    except ValueError:
+        return 'NONE', None
+    now = now or datetime.now()
+    level, next_at = 'NONE', None
+    for name, percent in sorted(ESCALATION_LEVELS.items(), key=lambda kv: kv[1]):
+        crossing = deadline - timedelta(hours=sla_hours * (1 - percent / 100))
+        if now >= crossing:
+            level = name
+        else:
+            next_at = crossing
+            break
+    return level, next_at
+
+def stored_escalation(current_level, status, sla_deadline, sla_hours, now=None):
+    """
+    (escalation_level, next_escalation_at ISO) for a write path to store.
+    A crossing the scheduler has not applied yet is left to it (due now)
+    so that its notification still fires.
+    """
+    now = now or datetime.now()
+    level, next_at = escalation_state(status, sla_deadline, sla_hours, now)
+    current_level = current_level or 'NONE'
+    if LEVEL_RANK[level] > LEVEL_RANK.get(current_level, 0) and status not in CLOSED_STATUSES:
+        return current_level, now.isoformat()
+    return level, next_at.isoformat() if next_at else None
+
+def current_escalation_level(complaint, now=None):
+    """Stored level, recomputed only for rows whose next crossing is already due (scheduler lag)"""
+    next_at = complaint.get('next_escalation_at')
+    if next_at and next_at <= (now or datetime.now()).isoformat():
+        return escalation_state(complaint.get('status'), complaint.get('sla_deadline'),
+                                complaint.get('sla_hours'), now)[0]
+    return complaint.get('escalation_level') or 'NONE'
+
+class EscalationScheduler:
+    """Heap of upcoming threshold crossings, drained by one thread per process"""
+
+    def __init__(self, on_escalate=None, lookahead_seconds=900, max_sleep_seconds=30, load_limit=5000):
+        self.on_escalate = on_escalate
+        self.lookahead = timedelta(seconds=lookahead_seconds)
+        self.max_sleep = max_sleep_seconds
+        self.load_limit = load_limit
+        self._heap = []         # (next_escalation_at, complaint id)
+        self._scheduled = {}    # complaint id -> next_escalation_at currently in the heap
+        self._cond = threading.Condition()
+        self._pid = None
+        self._next_load = 0.0
+        self._stats = {'transitions': 0, 'notifications': 0, 'lost_races': 0, 'loads': 0,
+                       'errors': 0, 'lag_ms_total': 0.0, 'lag_ms_max': 0.0}
+
+    def start(self):
+        """Start the scheduler thread in this process (no-op if already running)"""
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._heap, self._scheduled, self._next_load = [], {}, 0.0
+        threading.Thread(target=self._run, name="sla-escalation", daemon=True).start()
+        print("⏰ SLA escalation scheduler started")
+
+    def schedule(self, cid, next_at):
+        """Register a complaint's next crossing (ISO string or datetime; None cancels)"""
+        with self._cond:
+            if next_at is None:
+                self._scheduled.pop(cid, None)
+                return
+            next_at = _as_datetime(next_at)
+            if next_at > datetime.now() + self.lookahead:
+                # Far away: the periodic load picks it up when it gets close
+                self._scheduled.pop(cid, None)
+                return
+            self._scheduled[cid] = next_at
+            heapq.heappush(self._heap, (next_at, cid))
+            self._cond.notify()
+
+    def load(self):
+        """Queue every crossing due within the lookahead window from the database"""
+        horizon = (datetime.now() + self.lookahead).isoformat()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('''SELECT id, next_escalation_at FROM complaints
+                                         WHERE next_escalation_at IS NOT NULL AND next_escalation_at <= ?
+                                         ORDER BY next_escalation_at LIMIT ?''', conn), (horizon, self.load_limit))
+            rows = cursor.fetchall()
+        for row in rows:
+            self.schedule(row['id'], row['next_escalation_at'])
+        with self._cond:
+            self._stats['loads'] += 1
+        return len(rows)
+
+    def _pop_due(self):
+        now = datetime.now()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                next_at, cid = heapq.heappop(self._heap)
+                if self._scheduled.get(cid) == next_at:  # skip superseded entries
+                    del self._scheduled[cid]
+                    due.append(cid)
+        return due
+
+    def advance(self, cid, now=None):
+        """Apply a due transition to one complaint; returns the new level, or None if nothing changed"""
+        now = now or datetime.now()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('SELECT * FROM complaints WHERE id=?', conn), (cid,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            c = dict(row)
+            old_level = c.get('escalation_level') or 'NONE'
+            old_next = c.get('next_escalation_at')
+            level, next_at = escalation_state(c['status'], c['sla_deadline'], c['sla_hours'], now)
+            next_iso = next_at.isoformat() if next_at else None
+            if level == old_level and next_iso == old_next:
+                self.schedule(cid, next_at)
+                return None
+            # Only applies if nobody changed the row since we read it
+            cursor.execute(format_sql('''UPDATE complaints SET escalation_level=?, next_escalation_at=?, updated_at=?
+                                         WHERE id=? AND COALESCE(escalation_level, 'NONE')=?
+                                         AND COALESCE(next_escalation_at, '')=?''', conn),
+                           (level, next_iso, now.isoformat(), cid, old_level, old_next or ''))
+            won = cursor.rowcount == 1
+            if won:
+                bump_versions(cursor, conn, complaint_scopes(c))
+                if level != old_level:
+                    record_event(cursor, conn, 'escalated', dict(c, escalation_level=level))
+            conn.commit()
+
+        with self._cond:
+            if not won:
+                self._stats['lost_races'] += 1
+                return None
+            self._stats['transitions'] += 1
+            if old_next:
+                lag_ms = max((now - datetime.fromisoformat(old_next)).total_seconds() * 1000, 0.0)
+                self._stats['lag_ms_total'] += lag_ms
+                self._stats['lag_ms_max'] = max(self._stats['lag_ms_max'], lag_ms)
+        self.schedule(cid, next_at)
+
+        if self.on_escalate and LEVEL_RANK[level] > LEVEL_RANK.get(old_level, 0):
+            c.update(escalation_level=level, next_escalation_at=next_iso)
+            try:
+                self.on_escalate(c, old_level, level)
+                with self._cond:
+                    self._stats['notifications'] += 1
+            except Exception as e:
+                print(f"⚠️  Escalation notification failed for {cid}: {e}")
+        return level
+
+    def _run(self):
+        while True:
+            try:
+                if time.monotonic() >= self._next_load:
+                    self.load()
+                    self._next_load = time.monotonic() + self.lookahead.total_seconds() / 2
+                for cid in self._pop_due():
+                    self.advance(cid)
+            except Exception as e:
+                print(f"❌ Escalation scheduler error: {e}")
+                with self._cond:
+                    self._stats['errors'] += 1
+
+            with self._cond:
+                timeout = min(self.max_sleep, max(self._next_load - time.monotonic(), 0))
+                if self._heap:
+                    timeout = min(timeout, max((self._heap[0][0] - datetime.now()).total_seconds(), 0))
+                if timeout > 0:
+                    self._cond.wait(timeout)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['scheduled'] = len(self._scheduled)
+        transitions = stats['transitions']
+        stats['avg_lag_ms'] = round(stats.pop('lag_ms_total') / transitions, 1) if transitions else 0.0
+        stats['lag_ms_max'] = round(stats['lag_ms_max'], 1)
+        return stats
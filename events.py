@@ -0,0 +1,272 @@
+"""
+Complaint Event Feed
+Complaint writes append a row to complaint_events (created, updated,
+transferred, escalated) in the same transaction as the change. Each worker
+runs one EventBus thread that tails that table and fans new rows out to its
+Server-Sent Events subscribers; a local write wakes the thread at once, and
+writes made by other workers or instances arrive on the next poll.
+
+Event ids are the table's ids, so a reconnecting EventSource resumes after
+its Last-Event-ID from the table. If it is too far behind (or events were
+purged), it gets a 'reset' event and reloads the full list instead.
+
+Each open stream holds a server thread (gunicorn gthread), so a worker
+serves at most max_streams of them and refuses the rest (503) while
+leaving threads free for ordinary requests.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from db_config import db_connection, get_db_cursor, format_sql
+
+# Complaint columns sent with every event (what the official dashboard table shows)
+EVENT_FIELDS = ('id', 'category', 'priority', 'status', 'department', 'escalation_level',
+                'latitude', 'longitude', 'media_path', 'created_at', 'sla_deadline')
+
+def record_event(cursor, conn, event_type, complaint, previous_department=None):
+    """Append an event for this complaint; call inside the transaction that changes it"""
+    payload = {field: complaint.get(field) for field in EVENT_FIELDS}
+    payload['escalation_level'] = payload['escalation_level'] or 'NONE'
+    if previous_department and previous_department != complaint.get('department'):
+        payload['previous_department'] = previous_department
+    else:
+        previous_department = None
+    cursor.execute(format_sql('''INSERT INTO complaint_events
+                                 (complaint_id, event_type, department, previous_department, payload, created_at)
+                                 VALUES (?, ?, ?, ?, ?, ?)''', conn),
+                   (complaint['id'], event_type, complaint.get('department'), previous_department,
+                    json.dumps(payload, default=str), datetime.now().isoformat()))
+
+def events_after(last_id, department=None, limit=500):
+    """Events with id > last_id, oldest first (optionally only those touching one department)"""
+    where, params = ['id > ?'], [last_id]
+    if department:
+        where.append('(department = ? OR previous_department = ?)')
+        params += [department, department]
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql(f'''SELECT id, event_type, department, previous_department, payload
+                                      FROM complaint_events WHERE {' AND '.join(where)} ORDER BY id LIMIT ?''', conn),
+                       (*params, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+def event_ids_between(low, high):
+    """Ids of the events committed so far with low < id <= high"""
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql('SELECT id FROM complaint_events WHERE id > ? AND id <= ?', conn), (low, high))
+        return {row['id'] for row in cursor.fetchall()}
+
+def event_id_range():
+    """(oldest, latest) event id still in the table, 0 when empty"""
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute('SELECT MIN(id) AS first_id, MAX(id) AS last_id FROM complaint_events')
+        row = cursor.fetchone()
+        return (row['first_id'] or 0, row['last_id'] or 0) if row else (0, 0)
+
+def purge_events(keep_hours=72):
+    """Delete events older than keep_hours; returns how many were removed"""
+    cutoff = (datetime.now() - timedelta(hours=keep_hours)).isoformat()
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql('DELETE FROM complaint_events WHERE created_at < ?', conn), (cutoff,))
+        removed = cursor.rowcount or 0
+        conn.commit()
+    return removed
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['event_type']}\ndata: {event['payload']}\n\n"
+
+class Subscription:
+    __slots__ = ('department', 'queue', 'closed')
+
+    def __init__(self, department, queue_size):
+        self.department = department
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def wants(self, event):
+        return not self.department or self.department in (event['department'], event['previous_department'])
+
+class EventBus:
+    """Tails complaint_events and fans new rows out to this worker's SSE subscribers"""
+
+    def __init__(self, poll_seconds=1.0, queue_size=1000, batch_size=500, gap_seconds=10, max_streams=None):
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.gap_seconds = gap_seconds
+        self.max_streams = max_streams
+        self._streams = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._last_id = 0       # every event up to here has been published
+        self._delivered = set() # published ids above _last_id (beyond a gap)
+        self._gap_since = None
+        self._stats = {'events': 0, 'delivered': 0, 'dropped_subscribers': 0, 'polls': 0, 'errors': 0,
+                       'rejected_streams': 0}
+
+    def start(self):
+        """Start the tailing thread in this process (no-op if already running)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Taken before anyone can subscribe, so every later event is published
+            self._last_id = event_id_range()[1]
+            self._delivered, self._gap_since = set(), None
+            self._pid = os.getpid()
+            self._subscribers = set()
+            self._wakeup = threading.Event()
+        threading.Thread(target=self._run, name="event-bus", daemon=True).start()
+        print("📡 Event bus started")
+
+    def notify(self):
+        """A write in this process committed an event: deliver it without waiting for the next poll"""
+        self._wakeup.set()
+
+    def open_stream(self):
+        """Reserve a stream slot; False when this worker already serves max_streams"""
+        with self._lock:
+            if self.max_streams is not None and self._streams >= self.max_streams:
+                self._stats['rejected_streams'] += 1
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams = max(0, self._streams - 1)
+
+    def subscribe(self, department=None):
+        self.start()
+        sub = Subscription(department, self.queue_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def _publish(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._stats['events'] += len(events)
+        for sub in subscribers:
+            for event in events:
+                if sub.closed or not sub.wants(event):
+                    continue
+                try:
+                    sub.queue.put_nowait(event)
+                    with self._lock:
+                        self._stats['delivered'] += 1
+                except queue.Full:
+                    # Too slow: end its stream; the client reconnects and resumes from the table
+                    sub.closed = True
+                    self.unsubscribe(sub)
+                    with self._lock:
+                        self._stats['dropped_subscribers'] += 1
+
+    def _advance(self, events):
+        """
+        Move _last_id past the published events. Ids are allocated at insert
+        but become visible at commit, so a missing id may still show up
+        (Postgres); it is waited for up to gap_seconds, then treated as a
+        rolled-back insert.
+        """
+        now = time.monotonic()
+        for event in events:
+            if event['id'] != self._last_id + 1:
+                if self._gap_since is None:
+                    self._gap_since = now
+                if now - self._gap_since < self.gap_seconds:
+                    break
+            self._last_id = event['id']
+            self._gap_since = None
+        self._delivered = {i for i in self._delivered if i > self._last_id}
+
+    def poll(self):
+        """Publish events committed since the last poll; returns how many were new"""
+        published = 0
+        while True:
+            events = events_after(self._last_id, limit=self.batch_size)
+            with self._lock:
+                self._stats['polls'] += 1
+            fresh = [event for event in events if event['id'] not in self._delivered]
+            if fresh:
+                self._publish(fresh)
+                self._delivered.update(event['id'] for event in fresh)
+                published += len(fresh)
+            before = self._last_id
+            self._advance(events)
+            if len(events) < self.batch_size or self._last_id == before:
+                return published
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Event bus error: {e}")
+                with self._lock:
+                    self._stats['errors'] += 1
+
+    def stream(self, department=None, last_event_id=None, heartbeat_seconds=15,
+               max_seconds=300, backfill_limit=1000):
+        """
+        SSE body generator: backlog after last_event_id from the table, then
+        live events. Ends after max_seconds so the client reconnects (and
+        the worker thread is freed) instead of holding a connection forever.
+        """
+        self.start()
+        with self._lock:
+            settled = self._last_id  # live events reaching this stream all have higher ids
+        sub = self.subscribe(department)
+        try:
+            yield "retry: 3000\n\n"
+            # Ids the client already has: what this stream sent, and the ids up to its Last-Event-ID
+            # that were committed when it reconnected. The bus publishes nothing at or below `settled`,
+            # so only that unsettled window is looked up. An id that commits later (see _advance)
+            # is new to the client even when it is below Last-Event-ID, and is sent.
+            sent = set()
+            if last_event_id is not None:
+                sent.update(event_ids_between(settled, last_event_id))
+                backlog = events_after(last_event_id, department, limit=backfill_limit + 1)
+                first_id = event_id_range()[0]
+                if len(backlog) > backfill_limit or (first_id and last_event_id < first_id - 1):
+                    yield "event: reset\ndata: {}\n\n"
+                    backlog = []
+                for event in backlog:
+                    yield format_sse(event)
+                    sent.add(event['id'])
+            deadline = time.monotonic() + max_seconds
+            while not sub.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = sub.queue.get(timeout=min(heartbeat_seconds, remaining))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if event['id'] in sent:
+                    continue  # the client already has it (this bus can be behind the client's Last-Event-ID)
+                yield format_sse(event)
+                sent.add(event['id'])
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'subscribers': len(self._subscribers), 'streams': self._streams,
+                    'max_streams': self.max_streams, 'last_event_id': self._last_id}
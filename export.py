@@ -0,0 +1,117 @@
+"""
+Complaint Export
+Streams complaints as NDJSON or CSV straight from a database cursor, a
+batch at a time (a named server-side cursor on Postgres, fetchmany on
+SQLite), so memory use does not grow with the number of rows exported.
+Used by GET /api/export/complaints and from the command line:
+
+    python export.py --format csv --department Water_Dept --status Pending,Forwarded \
+                     --from 2024-01-01 --to 2024-03-31 --out complaints.csv
+"""
+
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from db_config import get_db, format_sql, is_postgres
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_BATCH_SIZE = 1000
+
+def _date_bound(value, end=False):
+    """'2024-03-31' -> start of that day, or of the next day for an inclusive end bound"""
+    if not value:
+        return None
+    if len(value) == 10:
+        day = datetime.fromisoformat(value)
+        return (day + timedelta(days=1) if end else day).isoformat()
+    return datetime.fromisoformat(value).isoformat()
+
+def export_query(columns=None, department=None, statuses=None, date_from=None, date_to=None):
+    """(sql with '?' placeholders, params) for the filtered export, oldest first"""
+    where, params = ["1=1"], []
+    if department:
+        where.append("department = ?"); params.append(department)
+    if statuses:
+        where.append(f"status IN ({','.join('?' * len(statuses))})"); params.extend(statuses)
+    if date_from:
+        where.append("created_at >= ?"); params.append(_date_bound(date_from))
+    if date_to:
+        where.append("created_at < ?"); params.append(_date_bound(date_to, end=True))
+    select = ', '.join(columns) if columns else '*'
+    return f"SELECT {select} FROM complaints WHERE {' AND '.join(where)} ORDER BY created_at, id", params
+
+def iter_batches(conn, sql, params=(), batch_size=EXPORT_BATCH_SIZE):
+    """Yield (column names, list of row tuples) batch by batch from a server-side cursor"""
+    if is_postgres(conn):
+        # Named cursor: Postgres keeps the result set and sends batch_size rows per fetch
+        cursor = conn.cursor(name=f"complaint_export_{id(conn)}")
+        cursor.itersize = batch_size
+    else:
+        cursor = conn.cursor()
+    try:
+        cursor.execute(format_sql(sql, conn), tuple(params))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            # (a named cursor only has a description after the first fetch)
+            columns = [d[0] for d in cursor.description] if cursor.description else []
+            yield columns, [tuple(row) for row in rows]
+            if len(rows) < batch_size:
+                break
+    finally:
+        cursor.close()
+
+def ndjson_chunks(batches):
+    for columns, rows in batches:
+        if rows:
+            yield ''.join(json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + '\n' for row in rows)
+
+def csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, rows in batches:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        chunk = buffer.getvalue()
+        if chunk:
+            yield chunk
+        buffer.seek(0)
+        buffer.truncate()
+
+def export_chunks(conn, fmt='ndjson', batch_size=EXPORT_BATCH_SIZE, **filters):
+    """Text chunks of the export in the given format ('ndjson' or 'csv')"""
+    sql, params = export_query(**filters)
+    batches = iter_batches(conn, sql, params, batch_size)
+    return csv_chunks(batches) if fmt == 'csv' else ndjson_chunks(batches)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export complaints as NDJSON or CSV')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+    parser.add_argument('--department')
+    parser.add_argument('--status', help='comma separated')
+    parser.add_argument('--from', dest='date_from', help='created on or after (YYYY-MM-DD)')
+    parser.add_argument('--to', dest='date_to', help='created on or before (YYYY-MM-DD)')
+    parser.add_argument('--fields', help='comma separated columns (default: all)')
+    parser.add_argument('--out', help='output file (default: complaints-<date>.<format>)')
+    args = parser.parse_args()
+
+    path = args.out or f"complaints-{datetime.now():%Y%m%d}.{args.format}"
+    conn = get_db()
+    out = open(path, 'w', newline='', encoding='utf-8')
+    try:
+        for chunk in export_chunks(conn, args.format,
+                                   columns=[f.strip() for f in args.fields.split(',')] if args.fields else None,
+                                   department=args.department,
+                                   statuses=[s.strip() for s in args.status.split(',')] if args.status else None,
+                                   date_from=args.date_from, date_to=args.date_to):
+            out.write(chunk)
+    finally:
+        out.close()
+        conn.close()
+    print(f"✅ Exported to {path}")
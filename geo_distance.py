@@ -0,0 +1,75 @@
+"""
+Distance Engine
+Haversine distances in meters, one pair at a time or in bulk.
+The bulk functions take coordinates as contiguous float arrays and compute
+every distance in one vectorized NumPy call, falling back to a pure-Python
+loop when NumPy is not installed.
+"""
+
+from math import radians, sin, cos, sqrt, atan2
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("⚠️  numpy not installed. Bulk distance checks use the pure-Python path.")
+    print("   For faster bulk proximity queries, run: pip install numpy")
+
+# Earth's radius in meters
+EARTH_RADIUS_M = 6371000
+
+# Rows of the points x candidates matrix computed per chunk (bounds memory)
+PAIRWISE_CHUNK_ROWS = 1024
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distance between two coordinates in meters"""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return EARTH_RADIUS_M * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+def _as_array(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+def _haversine_np(lat1, lon1, lat2, lon2):
+    """Vectorized haversine; arguments are radians and broadcast against each other"""
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def haversine_many(lat, lon, lats, lons):
+    """Distances in meters from one point to every (lats[i], lons[i]), as a list"""
+    if len(lats) == 0:
+        return []
+    if NUMPY_AVAILABLE:
+        lat_r, lon_r = radians(lat), radians(lon)
+        return _haversine_np(lat_r, lon_r, np.radians(_as_array(lats)), np.radians(_as_array(lons))).tolist()
+    return [haversine(lat, lon, la, lo) for la, lo in zip(lats, lons)]
+
+def pairs_within(point_lats, point_lons, cand_lats, cand_lons, radius_meters):
+    """
+    All (point_index, candidate_index, distance) with distance <= radius_meters.
+    The full points x candidates distance matrix is evaluated in row chunks.
+    """
+    if len(point_lats) == 0 or len(cand_lats) == 0:
+        return []
+    if not NUMPY_AVAILABLE:
+        return [(i, j, d)
+                for i, (la, lo) in enumerate(zip(point_lats, point_lons))
+                for j, d in enumerate(haversine_many(la, lo, cand_lats, cand_lons))
+                if d <= radius_meters]
+
+    p_lat = np.radians(_as_array(point_lats))[:, None]
+    p_lon = np.radians(_as_array(point_lons))[:, None]
+    c_lat = np.radians(_as_array(cand_lats))[None, :]
+    c_lon = np.radians(_as_array(cand_lons))[None, :]
+    result = []
+    for start in range(0, p_lat.shape[0], PAIRWISE_CHUNK_ROWS):
+        stop = start + PAIRWISE_CHUNK_ROWS
+        dist = _haversine_np(p_lat[start:stop], p_lon[start:stop], c_lat, c_lon)
+        rows, cols = np.nonzero(dist <= radius_meters)
+        result.extend(zip((rows + start).tolist(), cols.tolist(), dist[rows, cols].tolist()))
+    return result
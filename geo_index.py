@@ -0,0 +1,79 @@
+"""
+Spatial Index for Duplicate Detection
+Open complaints carry a grid-cell key (complaints.geo_cell) so proximity
+queries fetch only the candidates in the cells around a point, and the
+exact haversine test runs on a handful of rows instead of the whole table.
+
+geo_cell is set on submit and cleared when a complaint is resolved or
+rejected, so the (partial) index only ever holds open complaints.
+"""
+
+import math
+
+# Cell edge in degrees (~111 m of latitude, ~104 m of longitude at 20°N)
+GEO_CELL_DEGREES = 0.001
+# Beyond this many cells an IN (...) list stops paying off; use a bounding box instead
+MAX_CELLS_PER_QUERY = 49
+
+CLOSED_STATUSES = ('Resolved', 'Rejected')
+METERS_PER_DEGREE_LAT = 111320.0
+
+def _coords(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(lat) or math.isnan(lon):
+        return None
+    return lat, lon
+
+def _cell_index(value):
+    return math.floor(value / GEO_CELL_DEGREES)
+
+def geo_cell(lat, lon):
+    """Grid-cell key for a coordinate, e.g. '20593:78962'; None without coordinates"""
+    coords = _coords(lat, lon)
+    if not coords:
+        return None
+    return f"{_cell_index(coords[0])}:{_cell_index(coords[1])}"
+
+def indexed_cell(lat, lon, status):
+    """Value to store in complaints.geo_cell: the cell while open, NULL once closed"""
+    if status in CLOSED_STATUSES:
+        return None
+    return geo_cell(lat, lon)
+
+def bounding_box(lat, lon, radius_meters):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_meters"""
+    dlat = radius_meters / METERS_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = radius_meters / (METERS_PER_DEGREE_LAT * cos_lat)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+def _cell_ranges(lat, lon, radius_meters):
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_meters)
+    return (range(_cell_index(min_lat), _cell_index(max_lat) + 1),
+            range(_cell_index(min_lon), _cell_index(max_lon) + 1))
+
+def cell_count(lat, lon, radius_meters):
+    """Number of cells cells_around() would return, without building the list"""
+    rows, cols = _cell_ranges(lat, lon, radius_meters)
+    return len(rows) * len(cols)
+
+def cells_around(lat, lon, radius_meters):
+    """All cell keys intersecting the circle's bounding box"""
+    rows, cols = _cell_ranges(lat, lon, radius_meters)
+    return [f"{i}:{j}" for i in rows for j in cols]
+
+def candidate_filter_sql(lat, lon, radius_meters):
+    """
+    WHERE-clause fragment (with '?' placeholders) selecting open complaints
+    that may lie within radius_meters of (lat, lon).
+    """
+    lat, lon = float(lat), float(lon)
+    if cell_count(lat, lon, radius_meters) <= MAX_CELLS_PER_QUERY:
+        cells = cells_around(lat, lon, radius_meters)
+        return f"geo_cell IN ({','.join('?' * len(cells))})", cells
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_meters)
+    return ("geo_cell IS NOT NULL AND latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?",
+            [min_lat, max_lat, min_lon, max_lon])
@@ -0,0 +1,227 @@
+"""
+Hotspot Clustering
+Groups open complaints of the same department and category that lie close
+together: complaints within eps_meters of each other are linked, and every
+linked group of at least min_complaints is a hotspot (density clusters in
+the DBSCAN style, with a grid for the neighbour search).
+
+The clustering job is incremental. complaint_clusters holds every open
+complaint it has seen (with its cluster, or none); each run picks up the
+complaints submitted, closed or re-routed since the previous run and
+re-clusters only what they can affect: the groups they are linked into and
+the clusters they left. hotspot_clusters keeps each cluster's centroid and
+size, so /api/hotspots is a single indexed read.
+"""
+
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from db_config import db_connection, get_db_cursor, format_sql, is_postgres
+from geo_distance import haversine
+from geo_index import METERS_PER_DEGREE_LAT
+
+HOTSPOT_EPS_M = 150
+HOTSPOT_MIN_COMPLAINTS = 3
+
+def link_components(points, seeds, eps_meters):
+    """
+    Lists of point ids reachable from the seeds in steps of at most
+    eps_meters (each point in one list). points: {id: (lat, lon)}
+    """
+    if not points:
+        return []
+    # Cells at least eps wide everywhere in the set, so neighbours are in the 3x3 block around a point
+    max_abs_lat = min(max(abs(lat) for lat, _ in points.values()), 89.0)
+    cell_lat = eps_meters / METERS_PER_DEGREE_LAT
+    cell_lon = eps_meters / (METERS_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat)))
+
+    def cell(lat, lon):
+        return math.floor(lat / cell_lat), math.floor(lon / cell_lon)
+
+    grid = defaultdict(set)
+    for pid, (lat, lon) in points.items():
+        grid[cell(lat, lon)].add(pid)
+
+    components = []
+    for seed in seeds:
+        if seed not in points or seed not in grid[cell(*points[seed])]:
+            continue  # unknown, or already part of an earlier component
+        grid[cell(*points[seed])].discard(seed)
+        component, stack = [seed], [seed]
+        while stack:
+            lat, lon = points[stack.pop()]
+            ci, cj = cell(lat, lon)
+            for di in (-1, 0, 1):
+                for dj in (-1, 0, 1):
+                    bucket = grid.get((ci + di, cj + dj))
+                    if not bucket:
+                        continue
+                    near = [other for other in bucket if haversine(lat, lon, *points[other]) <= eps_meters]
+                    bucket.difference_update(near)
+                    component.extend(near)
+                    stack.extend(near)
+        components.append(component)
+    return components
+
+def _group_filter(department, category):
+    where, params = [], []
+    for column, value in (('department', department), ('category', category)):
+        if value is None:
+            where.append(f"{column} IS NULL")
+        else:
+            where.append(f"{column} = ?"); params.append(value)
+    return ' AND '.join(where), params
+
+class HotspotEngine:
+    """Maintains hotspot_clusters / complaint_clusters; run() is called by the clustering job"""
+
+    def __init__(self, eps_meters=HOTSPOT_EPS_M, min_complaints=HOTSPOT_MIN_COMPLAINTS):
+        self.eps_meters = eps_meters
+        self.min_complaints = min_complaints
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'added': 0, 'removed': 0, 'groups_reclustered': 0,
+                       'last_run_ms': None, 'last_run_at': None}
+
+    def run(self, full=False):
+        """Bring the clusters up to date (from scratch with full=True); returns this run's counts"""
+        started = time.perf_counter()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            if full:
+                cursor.execute('DELETE FROM complaint_clusters')
+                cursor.execute('DELETE FROM hotspot_clusters')
+
+            # Leaving: closed, deleted, or moved to another department/category since they were clustered
+            cursor.execute('''SELECT cc.complaint_id, cc.cluster_id, cc.department, cc.category
+                              FROM complaint_clusters cc LEFT JOIN complaints c ON c.id = cc.complaint_id
+                              WHERE c.id IS NULL OR c.geo_cell IS NULL
+                                 OR COALESCE(c.department, '') <> COALESCE(cc.department, '')
+                                 OR COALESCE(c.category, '') <> COALESCE(cc.category, '')''')
+            removed = [dict(row) for row in cursor.fetchall()]
+            if removed:
+                cursor.executemany(format_sql('DELETE FROM complaint_clusters WHERE complaint_id = ?', conn),
+                                   [(row['complaint_id'],) for row in removed])
+
+            # Joining: open complaints (geo_cell implies coordinates) not clustered yet, including the moved ones
+            cursor.execute('''SELECT c.id, c.department, c.category, c.latitude, c.longitude, c.created_at
+                              FROM complaints c LEFT JOIN complaint_clusters cc ON cc.complaint_id = c.id
+                              WHERE c.geo_cell IS NOT NULL AND cc.complaint_id IS NULL''')
+            added = [dict(row) for row in cursor.fetchall()]
+            if added:
+                cursor.executemany(format_sql('''INSERT INTO complaint_clusters
+                                                 (complaint_id, cluster_id, department, category, latitude, longitude, created_at)
+                                                 VALUES (?, NULL, ?, ?, ?, ?, ?)''', conn),
+                                   [(row['id'], row['department'], row['category'], float(row['latitude']),
+                                     float(row['longitude']), row['created_at']) for row in added])
+
+            groups = defaultdict(lambda: (set(), set()))  # (department, category) -> (seed ids, clusters left)
+            for row in removed:
+                if row['cluster_id'] is not None:
+                    groups[(row['department'], row['category'])][1].add(row['cluster_id'])
+            for row in added:
+                groups[(row['department'], row['category'])][0].add(row['id'])
+            for (department, category), (seeds, left) in groups.items():
+                self._recluster(cursor, conn, department, category, seeds, left)
+            conn.commit()
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['added'] += len(added)
+            self._stats['removed'] += len(removed)
+            self._stats['groups_reclustered'] += len(groups)
+            self._stats['last_run_ms'] = elapsed_ms
+            self._stats['last_run_at'] = datetime.now().isoformat()
+        return {'added': len(added), 'removed': len(removed), 'groups': len(groups), 'ms': elapsed_ms}
+
+    def _recluster(self, cursor, conn, department, category, seeds, left_clusters):
+        """Recompute the components reachable from seeds and from the members of the clusters that lost complaints"""
+        where, params = _group_filter(department, category)
+        cursor.execute(format_sql(f'''SELECT complaint_id, cluster_id, latitude, longitude, created_at
+                                      FROM complaint_clusters WHERE {where}''', conn), tuple(params))
+        members = {row['complaint_id']: dict(row) for row in cursor.fetchall()}
+        seeds = set(seeds) | {cid for cid, m in members.items() if m['cluster_id'] in left_clusters}
+        components = link_components({cid: (m['latitude'], m['longitude']) for cid, m in members.items()},
+                                     sorted(seeds), self.eps_meters)
+
+        affected = set(left_clusters) | {members[cid]['cluster_id'] for comp in components for cid in comp
+                                         if members[cid]['cluster_id'] is not None}
+        kept, assignments = set(), []
+        now = datetime.now().isoformat()
+        for comp in components:
+            cluster_id = None
+            if len(comp) >= self.min_complaints:
+                # Keep the id of the old cluster most of these complaints were in, so ids stay stable on the map
+                previous = Counter(members[cid]['cluster_id'] for cid in comp
+                                   if members[cid]['cluster_id'] in affected and members[cid]['cluster_id'] not in kept)
+                cluster_id = previous.most_common(1)[0][0] if previous else None
+                cluster_id = self._save_cluster(cursor, conn, cluster_id, department, category,
+                                                [members[cid] for cid in comp], now)
+                kept.add(cluster_id)
+            assignments.extend((cluster_id, cid) for cid in comp if members[cid]['cluster_id'] != cluster_id)
+
+        if assignments:
+            cursor.executemany(format_sql('UPDATE complaint_clusters SET cluster_id = ? WHERE complaint_id = ?', conn),
+                               assignments)
+        dissolved = [(cluster_id,) for cluster_id in affected - kept]
+        if dissolved:
+            cursor.executemany(format_sql('DELETE FROM hotspot_clusters WHERE id = ?', conn), dissolved)
+
+    def _save_cluster(self, cursor, conn, cluster_id, department, category, members, now):
+        """Insert or update one cluster row; returns its id"""
+        lat = sum(m['latitude'] for m in members) / len(members)
+        lon = sum(m['longitude'] for m in members) / len(members)
+        radius = max(haversine(lat, lon, m['latitude'], m['longitude']) for m in members)
+        last_reported = max((m['created_at'] for m in members if m['created_at']), default=None)
+        values = (department, category, lat, lon, len(members), round(radius, 1), last_reported, now)
+        if cluster_id is not None:
+            cursor.execute(format_sql('''UPDATE hotspot_clusters SET department = ?, category = ?, centroid_lat = ?,
+                                         centroid_lon = ?, complaint_count = ?, radius_m = ?, last_reported_at = ?,
+                                         updated_at = ? WHERE id = ?''', conn), (*values, cluster_id))
+            return cluster_id
+        sql = format_sql('''INSERT INTO hotspot_clusters (department, category, centroid_lat, centroid_lon,
+                            complaint_count, radius_m, last_reported_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', conn)
+        if is_postgres(conn):
+            cursor.execute(sql + ' RETURNING id', values)
+            return cursor.fetchone()['id']
+        cursor.execute(sql, values)
+        return cursor.lastrowid
+
+    def hotspots(self, department=None, category=None, bbox=None, min_count=None, limit=500):
+        """Precomputed clusters, largest first; bbox = (min_lat, min_lon, max_lat, max_lon)"""
+        where, params = ["1=1"], []
+        if department:
+            where.append("department = ?"); params.append(department)
+        if category:
+            where.append("category = ?"); params.append(category)
+        if bbox:
+            where.append("centroid_lat BETWEEN ? AND ? AND centroid_lon BETWEEN ? AND ?")
+            params += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        if min_count:
+            where.append("complaint_count >= ?"); params.append(min_count)
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql(f'''SELECT * FROM hotspot_clusters WHERE {' AND '.join(where)}
+                                          ORDER BY complaint_count DESC, id LIMIT ?''', conn), (*params, limit))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def members(self, cluster_ids):
+        """{cluster id: [complaint ids]}"""
+        if not cluster_ids:
+            return {}
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql(f'''SELECT cluster_id, complaint_id FROM complaint_clusters
+                                          WHERE cluster_id IN ({','.join('?' * len(cluster_ids))})
+                                          ORDER BY created_at''', conn), tuple(cluster_ids))
+            grouped = defaultdict(list)
+            for row in cursor.fetchall():
+                grouped[row['cluster_id']].append(row['complaint_id'])
+        return dict(grouped)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, eps_meters=self.eps_meters, min_complaints=self.min_complaints)
@@ -0,0 +1,283 @@
+"""
+Background Job Runner
+Periodic and one-off maintenance jobs (purges, sweeps, rebuilds) that must
+run on exactly one worker across every gunicorn process and instance.
+
+Each job has a row in job_leases holding its schedule (next_run_at) and a
+lease. A worker runs a due job only after claiming the row with a
+conditional UPDATE (lease-with-expiry, so a crashed worker's claim lapses);
+on Postgres it also holds a session advisory lock for the job while it
+runs, which is released by the server if the worker dies. Duration, start
+lag and failures of every run are recorded on the same row.
+
+While a job runs, its worker renews the lease every lease_seconds / 3, so
+a run slower than its lease is not claimed a second time (SQLite has no
+advisory lock to stop that). The lease only lapses, and the job can start
+on another worker, once renewals stop for two thirds of lease_seconds:
+the worker died, or could not reach the database for that long.
+
+Trigger a one-off job from a shell with:
+
+    python jobs.py --trigger rollup_rebuild
+    python jobs.py --status
+"""
+
+import hashlib
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from db_config import db_connection, get_db_cursor, format_sql, is_postgres
+
+def advisory_key(name):
+    """Stable signed 64-bit Postgres advisory lock key for a job name"""
+    return int.from_bytes(hashlib.sha256(f"job:{name}".encode()).digest()[:8], 'big', signed=True)
+
+def trigger_job(name, when=None):
+    """Ask the cluster to run a registered job at `when` (default: now); False if unknown"""
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute(format_sql('UPDATE job_leases SET next_run_at=? WHERE name=?', conn),
+                       ((when or datetime.now()).isoformat(), name))
+        found = cursor.rowcount == 1
+        conn.commit()
+    return found
+
+def job_status():
+    """Every job_leases row (cluster-wide schedule and last-run stats)"""
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute('SELECT * FROM job_leases ORDER BY name')
+        return [dict(row) for row in cursor.fetchall()]
+
+class Job:
+    __slots__ = ('name', 'fn', 'interval', 'lease_seconds', 'runs', 'failures', 'last_duration_ms', 'last_lag_ms')
+
+    def __init__(self, name, fn, interval, lease_seconds):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.runs = 0
+        self.failures = 0
+        self.last_duration_ms = None
+        self.last_lag_ms = None
+
+class JobRunner:
+    """Registry of jobs plus one polling thread per process"""
+
+    def __init__(self, tick_seconds=5):
+        self.tick_seconds = tick_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._registered = False
+
+    # ----- registration -----
+
+    def periodic(self, name, every_seconds, lease_seconds=300):
+        """Decorator: run fn() every `every_seconds` on one worker in the cluster"""
+        def register(fn):
+            self._jobs[name] = Job(name, fn, every_seconds, lease_seconds)
+            return fn
+        return register
+
+    def one_off(self, name, lease_seconds=900):
+        """Decorator: run fn() once on one worker each time the job is triggered"""
+        def register(fn):
+            self._jobs[name] = Job(name, fn, None, lease_seconds)
+            return fn
+        return register
+
+    def _register_rows(self):
+        now = datetime.now().isoformat()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            for job in self._jobs.values():
+                # New periodic jobs are due at once; existing rows keep their schedule
+                cursor.execute(format_sql('''INSERT INTO job_leases (name, interval_seconds, next_run_at, run_count, failure_count)
+                                             VALUES (?, ?, ?, 0, 0)
+                                             ON CONFLICT (name) DO UPDATE SET interval_seconds = excluded.interval_seconds,
+                                                 next_run_at = COALESCE(job_leases.next_run_at, excluded.next_run_at)''', conn),
+                               (job.name, job.interval, now if job.interval else None))
+            conn.commit()
+        self._registered = True
+
+    # ----- running -----
+
+    def start(self):
+        """Start the polling thread in this process (no-op if already running)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        threading.Thread(target=self._run, name="job-runner", daemon=True).start()
+        print(f"🗓️  Job runner started with {len(self._jobs)} job(s)")
+
+    def _due_jobs(self):
+        now = datetime.now().isoformat()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('''SELECT name, next_run_at FROM job_leases
+                                         WHERE next_run_at IS NOT NULL AND next_run_at <= ?
+                                         AND (lease_until IS NULL OR lease_until < ?)''', conn), (now, now))
+            return [(row['name'], row['next_run_at']) for row in cursor.fetchall() if row['name'] in self._jobs]
+
+    @contextmanager
+    def _advisory_lock(self, name):
+        """Postgres: hold a session advisory lock while the job runs (always True on SQLite)"""
+        if not is_postgres():
+            yield True
+            return
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            key = advisory_key(name)
+            cursor.execute('SELECT pg_try_advisory_lock(%s) AS locked', (key,))
+            locked = cursor.fetchone()['locked']
+            conn.commit()
+            try:
+                yield locked
+            finally:
+                if locked:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', (key,))
+                    conn.commit()
+
+    def _claim(self, job, scheduled_at):
+        now = datetime.now()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('''UPDATE job_leases SET lease_owner=?, lease_until=?, last_started_at=?
+                                         WHERE name=? AND next_run_at=? AND (lease_until IS NULL OR lease_until < ?)''', conn),
+                           (self.owner, (now + timedelta(seconds=job.lease_seconds)).isoformat(), now.isoformat(),
+                            job.name, scheduled_at, now.isoformat()))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+        return claimed
+
+    def _renew(self, job):
+        """Extend our lease; False if it is no longer ours"""
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('UPDATE job_leases SET lease_until=? WHERE name=? AND lease_owner=?', conn),
+                           ((datetime.now() + timedelta(seconds=job.lease_seconds)).isoformat(), job.name, self.owner))
+            renewed = cursor.rowcount == 1
+            conn.commit()
+        return renewed
+
+    @contextmanager
+    def _heartbeat(self, job):
+        """Keep renewing the lease until the block exits"""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(job.lease_seconds / 3):
+                try:
+                    if not self._renew(job):
+                        print(f"⚠️  Job '{job.name}' lost its lease")
+                        return
+                except Exception as e:
+                    print(f"⚠️  Job '{job.name}' lease renewal failed: {e}")
+
+        thread = threading.Thread(target=renew, name=f"job-heartbeat-{job.name}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _finish(self, job, scheduled_at, duration_ms, lag_ms, error):
+        now = datetime.now()
+        if job.interval:
+            next_run = datetime.fromisoformat(scheduled_at) + timedelta(seconds=job.interval)
+            if next_run <= now:
+                next_run = now + timedelta(seconds=job.interval)
+            next_run = next_run.isoformat()
+        else:
+            next_run = None
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            # Only the lease holder records the run (an expired lease may have been taken over)
+            cursor.execute(format_sql('''UPDATE job_leases SET lease_owner=NULL, lease_until=NULL,
+                                             next_run_at=CASE WHEN next_run_at=? THEN ? ELSE next_run_at END,
+                                             last_finished_at=?, last_duration_ms=?, last_lag_ms=?,
+                                             last_status=?, last_error=?,
+                                             run_count=run_count + 1, failure_count=failure_count + ?
+                                         WHERE name=? AND lease_owner=?''', conn),
+                           (scheduled_at, next_run, now.isoformat(), duration_ms, lag_ms,
+                            'failed' if error else 'ok', str(error)[:500] if error else None,
+                            1 if error else 0, job.name, self.owner))
+            conn.commit()
+
+    def run_job(self, job, scheduled_at):
+        """Claim and run one due job; returns True if this worker ran it"""
+        with self._advisory_lock(job.name) as locked:
+            if not locked or not self._claim(job, scheduled_at):
+                return False
+            started = datetime.now()
+            lag_ms = round(max((started - datetime.fromisoformat(scheduled_at)).total_seconds() * 1000, 0.0), 1)
+            start = time.monotonic()
+            error = None
+            try:
+                with self._heartbeat(job):
+                    job.fn()
+            except Exception as e:
+                error = e
+                print(f"❌ Job '{job.name}' failed: {e}")
+            duration_ms = round((time.monotonic() - start) * 1000, 1)
+            self._finish(job, scheduled_at, duration_ms, lag_ms, error)
+        with self._lock:
+            job.runs += 1
+            job.failures += 1 if error else 0
+            job.last_duration_ms = duration_ms
+            job.last_lag_ms = lag_ms
+        return True
+
+    def run_pending(self):
+        """Run every job that is due and not leased elsewhere; returns the names run here"""
+        if not self._registered:
+            self._register_rows()
+        ran = []
+        for name, scheduled_at in self._due_jobs():
+            if self.run_job(self._jobs[name], scheduled_at):
+                ran.append(name)
+        return ran
+
+    def _run(self):
+        while True:
+            try:
+                self.run_pending()
+            except Exception as e:
+                print(f"❌ Job runner error: {e}")
+            time.sleep(self.tick_seconds)
+
+    def stats(self):
+        with self._lock:
+            local = {job.name: {'interval_seconds': job.interval, 'runs': job.runs, 'failures': job.failures,
+                                'last_duration_ms': job.last_duration_ms, 'last_lag_ms': job.last_lag_ms}
+                     for job in self._jobs.values()}
+        try:
+            cluster = job_status()
+        except Exception:
+            cluster = []
+        return {'owner': self.owner, 'local': local, 'cluster': cluster}
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("🗓️  Background Jobs")
+    print("=" * 60)
+    if '--trigger' in sys.argv and sys.argv.index('--trigger') + 1 < len(sys.argv):
+        name = sys.argv[sys.argv.index('--trigger') + 1]
+        print(f"✅ '{name}' will run on the next worker tick" if trigger_job(name) else f"❌ Unknown job '{name}'")
+    else:
+        for row in job_status():
+            print(f"   {row['name']:<24} next={row['next_run_at'] or '-':<28} runs={row['run_count']} "
+                  f"failures={row['failure_count']} last={row['last_status'] or '-'} ({row['last_duration_ms'] or 0} ms)")
+    print("=" * 60)
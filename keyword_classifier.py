@@ -0,0 +1,145 @@
+"""
+Keyword Classifier
+Rule-based department and priority for a complaint description, used at
+submission and whenever Gemini is unavailable. All keywords of the tables
+below are compiled once into an Aho-Corasick automaton, so one pass over
+the text finds every keyword (overlapping ones included) however many
+rules there are. Matching is on substrings of the NFC-normalized,
+lowercased text, which works the same in every script; the matched
+keywords are returned as evidence for auditing the decision.
+
+To add a rule, add keywords to a table; the order of the tables decides
+which department or priority wins when several match.
+"""
+
+import unicodedata
+from collections import deque
+
+# First department with a matching keyword wins
+DEPARTMENT_KEYWORDS = [
+    ('Power_Dept', ['electricity', 'power', 'transformer', 'current', 'voltage', 'बिजली', 'विद्युत', 'वीज',
+                    'மின்சாரம்', 'విద్యుత్', 'కరెంట్', 'বিদ্যুৎ', 'વીજળી', 'ವಿದ್ಯುತ್', 'വൈദ്യുതി', 'ਬਿਜਲੀ',
+                    'ବିଦ୍ୟୁତ', 'بجلی']),
+    ('Water_Supply_Dept', ['water', 'pipe', 'leak', 'sewage', 'drainage', 'पानी', 'नाली', 'पाणी', 'தண்ணீர்',
+                           'నీరు', 'পানি', 'પાણી', 'ನೀರು', 'വെള്ളം', 'ਪਾਣੀ', 'ପାଣି', 'পানী', 'پانی']),
+    ('Public_Works_Dept', ['road', 'pothole', 'bridge', 'footpath', 'सड़क', 'रस्ता', 'சாலை', 'రోడ్డు', 'রাস্তা',
+                           'રસ્તો', 'ರಸ್ತೆ', 'റോഡ്', 'ਸੜਕ', 'ରାସ୍ତା', 'ৰাস্তা', 'سڑک']),
+    ('Sanitation_Dept', ['garbage', 'trash', 'waste', 'cleaning', 'sanitation', 'कचरा', 'குப்பை', 'చెత్త',
+                         'আবর্জনা', 'કચરો', 'മാലിന്യം', 'ਕੂੜਾ', 'ଆବର୍ଜନା', 'আৱৰ্জনা', 'کچرا']),
+    ('Health_Dept', ['hospital', 'doctor', 'medical', 'health', 'clinic', 'अस्पताल', 'रुग्णालय', 'மருத்துவமனை',
+                     'ఆసుపత్రి', 'হাসপাতাল', 'હોસ્પિટલ', 'ಆಸ್ಪತ್ರೆ', 'ആശുപത്രി', 'ਹਸਪਤਾਲ', 'ଡାକ୍ତରଖାନା',
+                     'চিকিৎসালয়', 'ہسپتال']),
+]
+
+# First (most urgent) level with a matching keyword wins; none -> DEFAULT_PRIORITY
+PRIORITY_KEYWORDS = [
+    (1, ['emergency', 'danger', 'hazard', 'death', 'killed', 'safety', 'shock', 'blast', 'live wire',
+         'transformer', 'manhole', 'gas leak', 'मृत्यु', 'खतरा', 'ख़तरा', 'मृत्यू', 'धोका', 'அபாயம்', 'மரணம்',
+         'ప్రమాదకర', 'మరణం', 'అత్యవసర', 'বিপদ', 'মৃত্যু', 'મૃત્યુ', 'જોખમ', 'ಅಪಾಯ', 'ಸಾವು', 'ತುರ್ತು',
+         'അപകടകര', 'മരണം', 'അടിയന്തര', 'ਖਤਰਾ', 'ਖ਼ਤਰਾ', 'ਮੌਤ', 'ବିପଦ', 'ମୃତ୍ୟୁ', 'خطرہ', 'خطرناک', 'ہلاک']),
+    (2, ['burst', 'overflow', 'pothole', 'accident', 'injury', 'fallen tree', 'flickering', 'dark', 'चोट',
+         'दुर्घटना', 'अपघात', 'जखमी', 'விபத்து', 'காயம்', 'ప్రమాదం', 'గాయం', 'দুর্ঘটনা', 'আহত', 'দুৰ্ঘটনা',
+         'আঘাত', 'અકસ્માત', 'ઈજા', 'ಅಪಘಾತ', 'ಗಾಯ', 'അപകടം', 'പരിക്ക്', 'ਹਾਦਸਾ', 'ਜ਼ਖ਼ਮੀ', 'ଦୁର୍ଘଟଣା',
+         'ଆହତ', 'حادثہ', 'زخمی']),
+    (3, ['urgent', 'immediately', 'night', 'hospital', 'medical', 'dog bite', 'stray dog', 'तुरंत',
+         'तातडीने', 'உடனடியாக', 'వెంటనే', 'জরুরি', 'অবিলম্বে', 'জৰুৰী', 'તાત્કાલિક', 'ತಕ್ಷಣ', 'ഉടൻ', 'ਤੁਰੰਤ',
+         'ତୁରନ୍ତ', 'فوری']),
+    (4, ['block', 'smell', 'dead animal', 'गंध', 'दुर्गंध']),
+    (9, ['planning', 'beautification', 'future', 'suggestion', 'योजना', 'सौंदर्यीकरण']),
+]
+
+DEFAULT_PRIORITY = 7
+EMERGENCY_CATEGORIES = ('Power_Emergency', 'Water_Emergency', 'Safety_Emergency')
+
+def normalize(text):
+    """NFC (one encoding for e.g. ड़ / ड + nukta) and lowercase"""
+    return unicodedata.normalize('NFC', text or '').lower()
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over {keyword: labels}; find() reports every occurrence in one pass"""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for keyword, labels in keywords.items():
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._out[state].append((keyword, labels))
+        # Failure links breadth-first: the longest proper suffix that is also a prefix of some keyword
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, nxt in self._goto[state].items():
+                pending.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Yield (start, keyword, labels) for every keyword occurrence in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword, labels in out[state]:
+                yield i - len(keyword) + 1, keyword, labels
+
+def build_automaton():
+    labels = {}
+    for dept, words in DEPARTMENT_KEYWORDS:
+        for word in words:
+            labels.setdefault(normalize(word), []).append(('department', dept))
+    for level, words in PRIORITY_KEYWORDS:
+        for word in words:
+            labels.setdefault(normalize(word), []).append(('priority', level))
+    return KeywordAutomaton(labels)
+
+_automaton = build_automaton()
+_DEPARTMENT_ORDER = {dept: i for i, (dept, _) in enumerate(DEPARTMENT_KEYWORDS)}
+_PRIORITY_ORDER = {level: i for i, (level, _) in enumerate(PRIORITY_KEYWORDS)}
+
+def classify(desc, cat=None):
+    """
+    {'priority', 'sentiment', 'urgency', 'detected_department', 'evidence'}
+    for a description; evidence lists the keywords (or category) behind the
+    chosen department and priority.
+    """
+    hits = {'department': {}, 'priority': {}}  # value -> matched keywords, in order of appearance
+    for _, keyword, labels in _automaton.find(normalize(desc)):
+        for kind, value in labels:
+            matched = hits[kind].setdefault(value, [])
+            if keyword not in matched:
+                matched.append(keyword)
+
+    detected_dept = min(hits['department'], key=_DEPARTMENT_ORDER.get, default=None)
+    if cat in EMERGENCY_CATEGORIES:
+        priority, priority_evidence = 1, [f"category:{cat}"]
+    elif hits['priority']:
+        priority = min(hits['priority'], key=_PRIORITY_ORDER.get)
+        priority_evidence = hits['priority'][priority]
+    else:
+        priority, priority_evidence = DEFAULT_PRIORITY, []
+
+    return {
+        'priority': priority,
+        'sentiment': 'neutral',
+        'urgency': 'medium',
+        'detected_department': detected_dept,
+        'evidence': {
+            'department': hits['department'].get(detected_dept, []),
+            'priority': priority_evidence
+        }
+    }
@@ -0,0 +1,637 @@
+"""
+Database Migrations
+Versioned schema changes for both PostgreSQL and SQLite.
+
+Applied versions are recorded in the schema_migrations table, so each
+migration runs exactly once per database. Run out-of-band on deploy with:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --status   # list applied / pending versions
+
+Workers only apply migrations on boot when DB_AUTO_MIGRATE is enabled.
+
+Data migrations must give the same result on a fresh database however the
+application evolves, so they never import application code: the logic and
+constants a backfill needs are copied next to the migration and frozen.
+When the live logic changes (a new cell size, new SLA thresholds), add a
+new migration that recomputes the stored values.
+"""
+
+import math
+import random
+import sys
+import unicodedata
+import zlib
+from datetime import datetime, timedelta
+
+from db_config import get_db, get_db_cursor, format_sql, is_postgres
+
+# Arbitrary constant used as the Postgres advisory lock key for migrations
+MIGRATION_LOCK_ID = 720_150_001
+
+MIGRATIONS = []
+
+def migration(version, description):
+    """Register a migration function fn(cursor, pg)"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+# ============= HELPERS =============
+
+def column_exists(cursor, pg, table, column):
+    """Check whether a column is already present on a table"""
+    if pg:
+        cursor.execute('''SELECT 1 FROM information_schema.columns
+                          WHERE table_name = %s AND column_name = %s''', (table, column))
+        return cursor.fetchone() is not None
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row['name'] == column for row in cursor.fetchall())
+
+def add_column(cursor, pg, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN, skipped when the column already exists"""
+    if not column_exists(cursor, pg, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+def serial_pk(pg):
+    """Auto-increment primary key column definition for the active database"""
+    return 'id SERIAL PRIMARY KEY' if pg else 'id INTEGER PRIMARY KEY AUTOINCREMENT'
+
+# ============= MIGRATIONS =============
+
+@migration(1, 'base schema')
+def _base_schema(cursor, pg):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS complaints (
+        id TEXT PRIMARY KEY,
+        citizen_name TEXT,
+        citizen_email TEXT,
+        citizen_phone TEXT,
+        citizen_address TEXT,
+        category TEXT,
+        description TEXT,
+        media_path TEXT,
+        latitude REAL,
+        longitude REAL,
+        location_address TEXT,
+        priority INTEGER,
+        department TEXT,
+        assigned_to TEXT,
+        status TEXT DEFAULT 'Pending',
+        created_at TEXT,
+        resolved_at TEXT,
+        sla_hours INTEGER,
+        sla_deadline TEXT,
+        resolution_summary TEXT,
+        resolution_proof TEXT,
+        citizen_feedback_rating INTEGER,
+        citizen_feedback_comments TEXT,
+        ai_analysis TEXT,
+        citizen_language TEXT DEFAULT 'en',
+        description_original TEXT,
+        description_translated TEXT,
+        rejection_reason TEXT,
+        transfer_count INTEGER DEFAULT 0
+    )''')
+
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS citizens (
+        {serial_pk(pg)},
+        phone TEXT UNIQUE NOT NULL,
+        name TEXT,
+        email TEXT,
+        address TEXT,
+        created_at TEXT,
+        last_login TEXT
+    )''')
+
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS otps (
+        {serial_pk(pg)},
+        phone TEXT NOT NULL,
+        otp_code TEXT NOT NULL,
+        purpose TEXT,
+        created_at TEXT NOT NULL,
+        expires_at TEXT NOT NULL,
+        used {'BOOLEAN DEFAULT false' if pg else 'INTEGER DEFAULT 0'}
+    )''')
+
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS complaint_transfers (
+        {serial_pk(pg)},
+        complaint_id TEXT NOT NULL,
+        from_department TEXT,
+        to_department TEXT NOT NULL,
+        transferred_by TEXT,
+        transfer_reason TEXT,
+        transferred_at TEXT NOT NULL
+    )''')
+
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS officials (
+        {serial_pk(pg)},
+        username TEXT UNIQUE,
+        password_hash TEXT,
+        govt_id TEXT UNIQUE,
+        name TEXT,
+        department TEXT,
+        email TEXT,
+        phone TEXT,
+        preferred_language TEXT DEFAULT 'en'
+    )''')
+
+@migration(2, 'complaints rejection_reason and transfer_count columns')
+def _complaint_workflow_columns(cursor, pg):
+    # Databases created before these columns existed
+    add_column(cursor, pg, 'complaints', 'rejection_reason', 'TEXT')
+    add_column(cursor, pg, 'complaints', 'transfer_count', 'INTEGER DEFAULT 0')
+
+@migration(3, 'indexes for complaint listing and OTP lookups')
+def _hot_query_indexes(cursor, pg):
+    # Department dashboard: WHERE department = ? ORDER BY created_at DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_department_created ON complaints (department, created_at)')
+    # Citizen history: WHERE citizen_phone = ? ORDER BY created_at DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_citizen_phone_created ON complaints (citizen_phone, created_at)')
+    # Admin listing (no department filter) and status filters
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_created_at ON complaints (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_status ON complaints (status)')
+    # validate_otp: WHERE phone = ? AND otp_code = ? AND used = ? AND expires_at > ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_otps_lookup ON otps (phone, otp_code, used, expires_at)')
+    # Transfer history: WHERE complaint_id = ? ORDER BY transferred_at DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaint_transfers_complaint ON complaint_transfers (complaint_id, transferred_at)')
+    # get_department_email and official login
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_officials_department ON officials (department)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_officials_username_lower ON officials (LOWER(username))')
+
+# Frozen copy of geo_index.geo_cell() as of migration 4
+M4_GEO_CELL_DEGREES = 0.001
+
+def _m4_geo_cell(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(lat) or math.isnan(lon):
+        return None
+    return f"{math.floor(lat / M4_GEO_CELL_DEGREES)}:{math.floor(lon / M4_GEO_CELL_DEGREES)}"
+
+@migration(4, 'grid-cell spatial index for open complaints')
+def _geo_cell_index(cursor, pg):
+    add_column(cursor, pg, 'complaints', 'geo_cell', 'TEXT')
+    # Backfill open complaints that have coordinates
+    cursor.execute('''SELECT id, latitude, longitude, status FROM complaints
+                      WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                      AND status NOT IN ('Resolved', 'Rejected')''')
+    rows = [(_m4_geo_cell(r['latitude'], r['longitude']), r['id']) for r in cursor.fetchall()]
+    if rows:
+        cursor.executemany('UPDATE complaints SET geo_cell = %s WHERE id = %s' if pg else
+                           'UPDATE complaints SET geo_cell = ? WHERE id = ?', rows)
+    # Partial indexes: only open complaints with a cell are indexed
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_geo_cell ON complaints (geo_cell) WHERE geo_cell IS NOT NULL')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_complaints_open_latlon ON complaints (latitude, longitude)
+                      WHERE geo_cell IS NOT NULL''')
+
+@migration(5, 'shared cache table for AI analysis and translations')
+def _cache_entries(cursor, pg):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace TEXT NOT NULL,
+        cache_key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        expires_at TEXT NOT NULL,
+        PRIMARY KEY (namespace, cache_key)
+    )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_expiry ON cache_entries (namespace, expires_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_created ON cache_entries (namespace, created_at)')
+
+@migration(6, 'post-submission enrichment status and stage timings')
+def _enrichment_columns(cursor, pg):
+    add_column(cursor, pg, 'complaints', 'enrichment_status', 'TEXT')
+    add_column(cursor, pg, 'complaints', 'enrichment_updated_at', 'TEXT')
+    add_column(cursor, pg, 'complaints', 'pipeline_timings', 'TEXT')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_complaints_enrichment ON complaints (enrichment_status, created_at)
+                      WHERE enrichment_status IN ('pending', 'processing')''')
+
+@migration(7, 'durable email outbox')
+def _email_outbox(cursor, pg):
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS email_outbox (
+        {serial_pk(pg)},
+        to_email TEXT NOT NULL,
+        subject TEXT,
+        html_content TEXT,
+        attachments TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at TEXT NOT NULL,
+        claim_token TEXT,
+        claimed_at TEXT,
+        last_error TEXT,
+        created_at TEXT NOT NULL,
+        sent_at TEXT
+    )''')
+    # Sender claim query: WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_claim ON email_outbox (claim_token) WHERE claim_token IS NOT NULL')
+
+# Frozen copy of analytics.rebuild_rollups() as of migration 8
+M8_HISTOGRAM_MAX_HOURS = 24 * 90
+
+def _m8_backfill_rollups(cursor, pg):
+    cursor.execute('DELETE FROM complaint_rollups')
+    cursor.execute('DELETE FROM complaint_resolution_histogram')
+    cursor.execute('''SELECT department, created_at, status, priority, citizen_feedback_rating, resolved_at, sla_deadline
+                      FROM complaints''')
+    # (department, day, status, priority) -> [complaints, rated, rating_sum, resolved, resolution_hours_sum,
+    #                                         sla_tracked, resolved_late]
+    rollups, histogram = {}, {}
+    for row in cursor.fetchall():
+        created = row['created_at'] or ''
+        status = row['status'] or 'Pending'
+        key = (row['department'] or '', created[:10], status, int(row['priority'] or 0))
+        acc = rollups.setdefault(key, [0, 0, 0.0, 0, 0.0, 0, 0])
+        rating, sla_deadline, resolved_at = row['citizen_feedback_rating'], row['sla_deadline'], row['resolved_at']
+        acc[0] += 1
+        acc[1] += int(rating is not None)
+        acc[2] += float(rating or 0)
+        acc[5] += int(bool(sla_deadline) and status != 'Rejected')
+        if status == 'Resolved' and resolved_at and created:
+            hours = max((datetime.fromisoformat(resolved_at) - datetime.fromisoformat(created)).total_seconds() / 3600, 0.0)
+            acc[3] += 1
+            acc[4] += hours
+            acc[6] += int(bool(sla_deadline) and resolved_at > sla_deadline)
+            hkey = (key[0], key[1], min(int(hours), M8_HISTOGRAM_MAX_HOURS))
+            histogram[hkey] = histogram.get(hkey, 0) + 1
+    placeholder = '%s' if pg else '?'
+    if rollups:
+        cursor.executemany(f'''INSERT INTO complaint_rollups (department, day, status, priority, complaints, rated,
+                                 rating_sum, resolved, resolution_hours_sum, sla_tracked, resolved_late)
+                              VALUES ({', '.join([placeholder] * 11)})''',
+                           [(*key, *acc) for key, acc in rollups.items()])
+    if histogram:
+        cursor.executemany(f'''INSERT INTO complaint_resolution_histogram (department, day, hour_bucket, complaints)
+                              VALUES ({', '.join([placeholder] * 4)})''',
+                           [(*key, n) for key, n in histogram.items()])
+
+@migration(8, 'per-department analytics rollup tables')
+def _analytics_rollups(cursor, pg):
+    real = 'DOUBLE PRECISION' if pg else 'REAL'
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS complaint_rollups (
+        department TEXT NOT NULL,
+        day TEXT NOT NULL,
+        status TEXT NOT NULL,
+        priority INTEGER NOT NULL,
+        complaints INTEGER NOT NULL DEFAULT 0,
+        rated INTEGER NOT NULL DEFAULT 0,
+        rating_sum {real} NOT NULL DEFAULT 0,
+        resolved INTEGER NOT NULL DEFAULT 0,
+        resolution_hours_sum {real} NOT NULL DEFAULT 0,
+        sla_tracked INTEGER NOT NULL DEFAULT 0,
+        resolved_late INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (department, day, status, priority)
+    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS complaint_resolution_histogram (
+        department TEXT NOT NULL,
+        day TEXT NOT NULL,
+        hour_bucket INTEGER NOT NULL,
+        complaints INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (department, day, hour_bucket)
+    )''')
+    # Live "open and past SLA" count on the dashboard only touches open complaints
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_complaints_open_sla ON complaints (department, sla_deadline)
+                      WHERE status NOT IN ('Resolved', 'Rejected')''')
+    _m8_backfill_rollups(cursor, pg)
+
+# Frozen copy of escalation.escalation_state() as of migration 9: percent of the SLA window elapsed
+M9_ESCALATION_LEVELS = (('WARNING', 50), ('URGENT', 75), ('CRITICAL', 90), ('OVERDUE', 100))
+
+def _m9_escalation_state(sla_deadline, sla_hours, now):
+    if not sla_deadline or not sla_hours:
+        return 'NONE', None
+    try:
+        deadline = sla_deadline if isinstance(sla_deadline, datetime) else datetime.fromisoformat(sla_deadline)
+    except ValueError:
+        return 'NONE', None
+    level, next_at = 'NONE', None
+    for name, percent in M9_ESCALATION_LEVELS:
+        crossing = deadline - timedelta(hours=sla_hours * (1 - percent / 100))
+        if now >= crossing:
+            level = name
+        else:
+            next_at = crossing
+            break
+    return level, next_at
+
+@migration(9, 'stored SLA escalation level and next threshold crossing')
+def _escalation_columns(cursor, pg):
+    add_column(cursor, pg, 'complaints', 'escalation_level', "TEXT DEFAULT 'NONE'")
+    add_column(cursor, pg, 'complaints', 'next_escalation_at', 'TEXT')
+    # Backfill open complaints with their current level (no notifications for these)
+    cursor.execute('''SELECT id, status, sla_deadline, sla_hours FROM complaints
+                      WHERE status NOT IN ('Resolved', 'Rejected')''')
+    rows = []
+    now = datetime.now()
+    for r in cursor.fetchall():
+        level, next_at = _m9_escalation_state(r['sla_deadline'], r['sla_hours'], now)
+        rows.append((level, next_at.isoformat() if next_at else None, r['id']))
+    if rows:
+        cursor.executemany('UPDATE complaints SET escalation_level = %s, next_escalation_at = %s WHERE id = %s' if pg else
+                           'UPDATE complaints SET escalation_level = ?, next_escalation_at = ? WHERE id = ?', rows)
+    cursor.execute("UPDATE complaints SET escalation_level = 'NONE' WHERE escalation_level IS NULL")
+    # Scheduler: WHERE next_escalation_at <= ? ORDER BY next_escalation_at
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_complaints_next_escalation ON complaints (next_escalation_at)
+                      WHERE next_escalation_at IS NOT NULL''')
+    # Listing filter ?escalation=
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_complaints_escalation ON complaints (escalation_level, created_at)
+                      WHERE escalation_level <> 'NONE'""")
+
+@migration(10, 'background job schedule and leases')
+def _job_leases(cursor, pg):
+    real = 'DOUBLE PRECISION' if pg else 'REAL'
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS job_leases (
+        name TEXT PRIMARY KEY,
+        interval_seconds INTEGER,
+        next_run_at TEXT,
+        lease_owner TEXT,
+        lease_until TEXT,
+        last_started_at TEXT,
+        last_finished_at TEXT,
+        last_duration_ms {real},
+        last_lag_ms {real},
+        last_status TEXT,
+        last_error TEXT,
+        run_count INTEGER NOT NULL DEFAULT 0,
+        failure_count INTEGER NOT NULL DEFAULT 0
+    )''')
+
+@migration(11, 'otps consumed by delete; purge used rows and index expiry')
+def _otp_store(cursor, pg):
+    # Codes are now deleted when consumed, so used rows are dead weight
+    cursor.execute('DELETE FROM otps WHERE used = true OR expires_at <= %s' if pg else
+                   'DELETE FROM otps WHERE used = 1 OR expires_at <= ?', (datetime.now().isoformat(),))
+    cursor.execute('DROP INDEX IF EXISTS idx_otps_lookup')
+    # consume: WHERE phone = ? AND otp_code = ? AND expires_at > ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_otps_phone_code ON otps (phone, otp_code, expires_at)')
+    # purge: WHERE expires_at <= ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_otps_expires ON otps (expires_at)')
+
+@migration(12, 'token buckets for rate limiting')
+def _rate_limit_buckets(cursor, pg):
+    real = 'DOUBLE PRECISION' if pg else 'REAL'
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+        bucket_key TEXT PRIMARY KEY,
+        tokens {real} NOT NULL,
+        updated_at {real} NOT NULL
+    )''')
+    # prune: WHERE updated_at < ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_updated ON rate_limit_buckets (updated_at)')
+
+@migration(13, 'change version counters for conditional GETs')
+def _change_versions(cursor, pg):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS change_versions (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at TEXT
+    )''')
+
+@migration(14, 'complaint event log for the live dashboard feed')
+def _complaint_events(cursor, pg):
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS complaint_events (
+        {serial_pk(pg)},
+        complaint_id TEXT NOT NULL,
+        event_type TEXT NOT NULL,
+        department TEXT,
+        previous_department TEXT,
+        payload TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )''')
+    # purge: WHERE created_at < ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaint_events_created ON complaint_events (created_at)')
+
+@migration(15, 'complaints.updated_at for delta sync')
+def _complaints_updated_at(cursor, pg):
+    add_column(cursor, pg, 'complaints', 'updated_at', 'TEXT')
+    cursor.execute('UPDATE complaints SET updated_at = COALESCE(resolved_at, created_at) WHERE updated_at IS NULL')
+    # sync: WHERE department = ? AND (updated_at, id) > cursor ORDER BY updated_at, id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_dept_updated ON complaints (department, updated_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_updated ON complaints (updated_at, id)')
+    # sync tombstones: complaints transferred out of a department
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaint_transfers_from ON complaint_transfers (from_department, complaint_id)')
+    # sync transfer history: WHERE transferred_at > ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaint_transfers_at ON complaint_transfers (transferred_at)')
+
+@migration(16, 'full-text search over complaint text')
+def _complaint_search(cursor, pg):
+    if pg:
+        # 'simple' keeps Devanagari and other scripts as-is; the English translation is also stemmed
+        cursor.execute("""CREATE OR REPLACE FUNCTION complaint_search_document(
+                              translated TEXT, original TEXT, address TEXT, name TEXT)
+                          RETURNS tsvector LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+                              SELECT setweight(to_tsvector('english', COALESCE(translated, '')), 'A') ||
+                                     setweight(to_tsvector('simple', COALESCE(translated, '')), 'A') ||
+                                     setweight(to_tsvector('simple', COALESCE(original, '')), 'A') ||
+                                     setweight(to_tsvector('simple', COALESCE(address, '')), 'B') ||
+                                     setweight(to_tsvector('simple', COALESCE(name, '')), 'C')
+                          $$""")
+        # search: WHERE complaint_search_document(...) @@ query (an expression index, so SELECT * is unchanged)
+        cursor.execute("""CREATE INDEX IF NOT EXISTS idx_complaints_search ON complaints USING GIN
+                          (complaint_search_document(description_translated, description_original,
+                                                     location_address, citizen_name))""")
+        return
+    # External-content FTS5 table over complaints, kept in step by triggers
+    cursor.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS complaints_fts USING fts5(
+                          description_translated, description_original, location_address, citizen_name,
+                          content='complaints', content_rowid='rowid',
+                          tokenize='unicode61 remove_diacritics 2')""")
+    columns = 'description_translated, description_original, location_address, citizen_name'
+    new_values = 'new.description_translated, new.description_original, new.location_address, new.citizen_name'
+    old_values = 'old.description_translated, old.description_original, old.location_address, old.citizen_name'
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS complaints_fts_insert AFTER INSERT ON complaints BEGIN
+                           INSERT INTO complaints_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+                       END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS complaints_fts_delete AFTER DELETE ON complaints BEGIN
+                           INSERT INTO complaints_fts (complaints_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                       END""")
+    cursor.execute(f"""CREATE TRIGGER IF NOT EXISTS complaints_fts_update AFTER UPDATE OF {columns} ON complaints BEGIN
+                           INSERT INTO complaints_fts (complaints_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+                           INSERT INTO complaints_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+                       END""")
+    cursor.execute("INSERT INTO complaints_fts (complaints_fts) VALUES ('rebuild')")
+
+# Frozen copy of text_index.index_entries() as of migration 17. Signatures are only comparable
+# when computed with identical parameters; if text_index changes them, re-index in a new migration.
+M17_SHINGLE_SIZE = 4
+M17_NUM_PERM = 64
+M17_LSH_BANDS = 16
+M17_REGION_DEGREES = 0.01
+M17_HASH_PRIME = 2147483647
+_m17_rng = random.Random(20240601)
+M17_HASH_A = [_m17_rng.randrange(1, M17_HASH_PRIME) for _ in range(M17_NUM_PERM)]
+M17_HASH_B = [_m17_rng.randrange(0, M17_HASH_PRIME) for _ in range(M17_NUM_PERM)]
+
+def _m17_index_entries(row):
+    text = row['description_original'] or row['description']
+    kept = ''.join(ch if unicodedata.category(ch)[0] in 'LMN' else ' ' for ch in (text or '').lower())
+    text = ' '.join(kept.split())
+    if len(text) <= M17_SHINGLE_SIZE:
+        shingles = {text} if text else set()
+    else:
+        shingles = {text[i:i + M17_SHINGLE_SIZE] for i in range(len(text) - M17_SHINGLE_SIZE + 1)}
+    hashed = [zlib.crc32(sh.encode('utf-8')) % M17_HASH_PRIME for sh in shingles]
+    if not hashed:
+        return None
+    sig = [min((a * x + b) % M17_HASH_PRIME for x in hashed) for a, b in zip(M17_HASH_A, M17_HASH_B)]
+
+    def encode(values):
+        return ''.join(f"{v:08x}" for v in values)
+
+    region = (f"{math.floor(float(row['latitude']) / M17_REGION_DEGREES)}:"
+              f"{math.floor(float(row['longitude']) / M17_REGION_DEGREES)}")
+    rows_per_band = M17_NUM_PERM // M17_LSH_BANDS
+    keys = [f"{region}|{band}:{zlib.crc32(encode(sig[band * rows_per_band:(band + 1) * rows_per_band]).encode()):08x}"
+            for band in range(M17_LSH_BANDS)]
+    return encode(sig), keys
+
+@migration(17, 'MinHash/LSH text index of open complaints for duplicate detection')
+def _complaint_text_index(cursor, pg):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS complaint_text_signatures (
+        complaint_id TEXT PRIMARY KEY,
+        signature TEXT NOT NULL
+    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS complaint_lsh_buckets (
+        bucket TEXT NOT NULL,
+        complaint_id TEXT NOT NULL,
+        PRIMARY KEY (bucket, complaint_id)
+    )''')
+    # re-index / close: DELETE ... WHERE complaint_id = ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaint_lsh_buckets_complaint ON complaint_lsh_buckets (complaint_id)')
+    # Backfill open complaints that have a cell
+    cursor.execute('''SELECT id, description, description_original, latitude, longitude, geo_cell
+                      FROM complaints WHERE geo_cell IS NOT NULL''')
+    signatures, buckets = [], []
+    for row in cursor.fetchall():
+        entries = _m17_index_entries(row)
+        if entries:
+            signatures.append((row['id'], entries[0]))
+            buckets.extend((key, row['id']) for key in entries[1])
+    if signatures:
+        cursor.executemany('INSERT INTO complaint_text_signatures (complaint_id, signature) VALUES (%s, %s)' if pg else
+                           'INSERT INTO complaint_text_signatures (complaint_id, signature) VALUES (?, ?)', signatures)
+        cursor.executemany('INSERT INTO complaint_lsh_buckets (bucket, complaint_id) VALUES (%s, %s)' if pg else
+                           'INSERT INTO complaint_lsh_buckets (bucket, complaint_id) VALUES (?, ?)', buckets)
+
+@migration(18, 'hotspot clusters of open complaints')
+def _hotspot_clusters(cursor, pg):
+    real = 'DOUBLE PRECISION' if pg else 'REAL'
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS hotspot_clusters (
+        {serial_pk(pg)},
+        department TEXT,
+        category TEXT,
+        centroid_lat {real} NOT NULL,
+        centroid_lon {real} NOT NULL,
+        complaint_count INTEGER NOT NULL,
+        radius_m {real},
+        last_reported_at TEXT,
+        updated_at TEXT NOT NULL
+    )''')
+    # /api/hotspots: WHERE department = ? ORDER BY complaint_count DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_hotspot_clusters_dept_count ON hotspot_clusters (department, complaint_count)')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS complaint_clusters (
+        complaint_id TEXT PRIMARY KEY,
+        cluster_id INTEGER,
+        department TEXT,
+        category TEXT,
+        latitude {real} NOT NULL,
+        longitude {real} NOT NULL,
+        created_at TEXT
+    )''')
+    # re-clustering reads one department/category group at a time
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaint_clusters_group ON complaint_clusters (department, category)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaint_clusters_cluster ON complaint_clusters (cluster_id)')
+
+@migration(19, 'retry failed enrichments with backoff')
+def _enrichment_attempts(cursor, pg):
+    add_column(cursor, pg, 'complaints', 'enrichment_attempts', 'INTEGER DEFAULT 0')
+    # Failed rows are picked up again by the retry job, so they join the partial index
+    cursor.execute('DROP INDEX IF EXISTS idx_complaints_enrichment')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_complaints_enrichment ON complaints (enrichment_status, created_at)
+                      WHERE enrichment_status IN ('pending', 'processing', 'failed')''')
+
+# ============= RUNNER =============
+
+def _ensure_migrations_table(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT NOT NULL
+    )''')
+
+def _applied_versions(cursor):
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row['version'] for row in cursor.fetchall()}
+
+def pending_migrations():
+    """Return [(version, description)] of migrations not yet applied"""
+    conn = get_db()
+    cursor = get_db_cursor(conn)
+    try:
+        _ensure_migrations_table(cursor)
+        conn.commit()
+        applied = _applied_versions(cursor)
+        return [(v, desc) for v, desc, _ in sorted(MIGRATIONS) if v not in applied]
+    finally:
+        conn.close()
+
+def run_migrations():
+    """
+    Apply every pending migration, each in its own transaction.
+    Concurrent runners (several workers booting at once) are serialized with
+    a Postgres advisory lock or SQLite's write lock, and re-check the
+    applied versions once they hold it.
+    """
+    conn = get_db()
+    cursor = get_db_cursor(conn)
+    pg = is_postgres(conn)
+    applied_now = []
+    try:
+        _ensure_migrations_table(cursor)
+        conn.commit()
+        if pg:
+            cursor.execute('SELECT pg_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+
+        for version, description, fn in sorted(MIGRATIONS):
+            if not pg:
+                cursor.execute('BEGIN IMMEDIATE')
+            if version in _applied_versions(cursor):
+                conn.rollback()
+                continue
+            try:
+                fn(cursor, pg)
+                cursor.execute(format_sql('INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)', conn),
+                               (version, description, datetime.now().isoformat()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"❌ Migration {version:03d} failed: {description}")
+                raise
+            applied_now.append(version)
+            print(f"   ✅ Migration {version:03d}: {description}")
+    finally:
+        if pg:
+            try:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+                conn.commit()
+            except Exception:
+                pass
+        cursor.close()
+        conn.close()
+    return applied_now
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print(f"🗄️  Database Migrations ({'PostgreSQL' if is_postgres() else 'SQLite'})")
+    print("=" * 60)
+    if '--status' in sys.argv:
+        pending = {v for v, _ in pending_migrations()}
+        for version, description, _ in sorted(MIGRATIONS):
+            state = "⏳ pending" if version in pending else "✅ applied"
+            print(f"   {version:03d}  {state}  {description}")
+    else:
+        applied = run_migrations()
+        print(f"\n✅ {len(applied)} migration(s) applied" if applied else "\n✅ Schema is up to date")
+    print("=" * 60)
@@ -0,0 +1,109 @@
+"""
+OTP Store
+One-time passwords live in either an in-process TTL map (single worker /
+local development) or the otps table (every gunicorn worker and instance
+sees the same codes). Both backends consume a code atomically on
+validation by deleting it, so a code works exactly once, and expired
+codes are purged in bulk instead of accumulating.
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from db_config import db_connection, get_db_cursor, format_sql
+
+class MemoryOTPStore:
+    """(phone, code) -> expiry map for a single process"""
+
+    def __init__(self, ttl_seconds=300, purge_every_seconds=60):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.purge_every = timedelta(seconds=purge_every_seconds)
+        self._codes = {}  # (phone, code) -> (expires_at, purpose)
+        self._lock = threading.Lock()
+        self._next_purge = datetime.now() + self.purge_every
+        self._stats = {'stored': 0, 'consumed': 0, 'rejected': 0, 'purged': 0}
+
+    def put(self, phone, otp_code, purpose='signin'):
+        now = datetime.now()
+        with self._lock:
+            self._codes[(phone, str(otp_code))] = (now + self.ttl, purpose)
+            self._stats['stored'] += 1
+            purge_due = now >= self._next_purge
+        if purge_due:
+            self.purge()
+
+    def consume(self, phone, otp_code):
+        """True if the code was valid; it cannot be used again afterwards"""
+        with self._lock:
+            entry = self._codes.pop((phone, str(otp_code)), None)
+            ok = entry is not None and entry[0] > datetime.now()
+            self._stats['consumed' if ok else 'rejected'] += 1
+        return ok
+
+    def purge(self):
+        """Drop expired codes; returns how many were removed"""
+        now = datetime.now()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._codes.items() if expires_at <= now]
+            for key in expired:
+                del self._codes[key]
+            self._next_purge = now + self.purge_every
+            self._stats['purged'] += len(expired)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'live': len(self._codes), **self._stats}
+
+class DatabaseOTPStore:
+    """The otps table, shared by every worker; a code is deleted when consumed"""
+
+    def __init__(self, ttl_seconds=300):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._stats = {'stored': 0, 'consumed': 0, 'rejected': 0, 'purged': 0}
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def put(self, phone, otp_code, purpose='signin'):
+        now = datetime.now()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('''INSERT INTO otps (phone, otp_code, purpose, created_at, expires_at)
+                                         VALUES (?, ?, ?, ?, ?)''', conn),
+                           (phone, str(otp_code), purpose, now.isoformat(), (now + self.ttl).isoformat()))
+            conn.commit()
+        self._count('stored')
+
+    def consume(self, phone, otp_code):
+        """True if the code was valid; the DELETE makes check-and-use a single atomic step"""
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('DELETE FROM otps WHERE phone=? AND otp_code=? AND expires_at > ?', conn),
+                           (phone, str(otp_code), datetime.now().isoformat()))
+            ok = (cursor.rowcount or 0) > 0
+            conn.commit()
+        self._count('consumed' if ok else 'rejected')
+        return ok
+
+    def purge(self):
+        """Bulk-delete expired codes; returns how many were removed"""
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('DELETE FROM otps WHERE expires_at <= ?', conn), (datetime.now().isoformat(),))
+            removed = cursor.rowcount or 0
+            conn.commit()
+        self._count('purged', removed)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'database', **self._stats}
+
+def make_otp_store(backend='database', ttl_seconds=300):
+    """OTP_STORE=memory is only correct when a single process serves every request"""
+    if backend == 'memory':
+        return MemoryOTPStore(ttl_seconds)
+    return DatabaseOTPStore(ttl_seconds)
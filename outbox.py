@@ -0,0 +1,297 @@
+"""
+Email Outbox
+Durable email delivery. send_email_async() writes messages to the
+email_outbox table; a small pool of sender threads claims them in batches
+and delivers each batch over a persistent, already-authenticated SMTP
+session. Failures are retried with exponential backoff, and messages
+survive worker restarts because they live in the database until sent.
+
+For local testing run a debugging SMTP server and point the app at it:
+    python -m aiosmtpd -n -l localhost:1025
+    SMTP_SERVER=localhost SMTP_PORT=1025 SMTP_USE_TLS=0 SENDER_EMAIL=dev@localhost
+
+test_outbox.py checks batching, session reuse and retries against an
+in-process debugging SMTP server: python test_outbox.py
+"""
+
+import json
+import os
+import smtplib
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from db_config import db_connection, get_db_cursor, format_sql
+
+def email_configured(config):
+    """False for the placeholder/empty sender address (emails are skipped)"""
+    sender = config.get('SENDER_EMAIL') or ''
+    return bool(sender) and 'your.email' not in sender
+
+def build_message(config, to_email, subject, html_content, attachments=None):
+    """MIME message with HTML body and optional file attachments"""
+    msg = MIMEMultipart('alternative')
+    msg['From'] = f"{config['SENDER_NAME']} <{config['SENDER_EMAIL']}>"
+    msg['To'] = to_email
+    msg['Subject'] = subject
+
+    msg.attach(MIMEText(html_content, 'html', 'utf-8'))
+
+    for file_path in attachments or []:
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(f.read())
+                encoders.encode_base64(part)
+                part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(file_path)}')
+                msg.attach(part)
+    return msg
+
+class SMTPSession:
+    """One reusable SMTP connection: connects and logs in lazily, reconnects when dropped"""
+
+    IDLE_CHECK_SECONDS = 30   # NOOP before reuse after this much idle time
+    MAX_IDLE_SECONDS = 240    # close instead of holding a connection the server will drop
+
+    def __init__(self, config, timeout=30):
+        self.config = config
+        self.timeout = timeout
+        self.server = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def _connect(self):
+        server = smtplib.SMTP(self.config['SMTP_SERVER'], self.config['SMTP_PORT'], timeout=self.timeout)
+        if self.config.get('SMTP_USE_TLS', True):
+            server.starttls()
+        if self.config.get('SENDER_PASSWORD'):
+            server.login(self.config['SENDER_EMAIL'], self.config['SENDER_PASSWORD'])
+        self.server = server
+        self.connects += 1
+
+    def _alive(self):
+        if self.server is None:
+            return False
+        idle = time.monotonic() - self.last_used
+        if idle > self.MAX_IDLE_SECONDS:
+            return False
+        if idle > self.IDLE_CHECK_SECONDS:
+            try:
+                return self.server.noop()[0] == 250
+            except smtplib.SMTPException:
+                return False
+        return True
+
+    def send(self, msg):
+        """Send over the open session, reconnecting once if the server dropped it"""
+        if not self._alive():
+            self.close()
+            self._connect()
+        try:
+            self.server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self.close()
+            self._connect()
+            self.server.send_message(msg)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+        self.server = None
+
+class EmailOutbox:
+    """Database-backed outbox drained by a bounded pool of sender threads"""
+
+    def __init__(self, config, senders=2, batch_size=20, max_attempts=6,
+                 base_backoff_seconds=30, lease_seconds=300, poll_seconds=5):
+        self.config = config
+        self.senders = max(1, senders)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._sent_times = deque(maxlen=10000)
+        self._stats = {'enqueued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0,
+                       'batches': 0, 'smtp_connects': 0}
+
+    def start(self):
+        """Start sender threads in this process (no-op if already running)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._wakeup = threading.Event()
+        for i in range(self.senders):
+            threading.Thread(target=self._sender_loop, name=f"email-sender-{i}", daemon=True).start()
+
+    def enqueue(self, to_email, subject, html_content, attachments=None):
+        """Persist a message for delivery; True when queued, None when email is not configured"""
+        now = datetime.now().isoformat()
+        status = 'pending' if email_configured(self.config) else 'skipped'
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('''INSERT INTO email_outbox
+                                         (to_email, subject, html_content, attachments, status, attempts,
+                                          next_attempt_at, created_at)
+                                         VALUES (?, ?, ?, ?, ?, 0, ?, ?)''', conn),
+                           (to_email, subject, html_content, json.dumps(attachments or []), status, now, now))
+            conn.commit()
+        with self._lock:
+            self._stats['enqueued' if status == 'pending' else 'skipped'] += 1
+        if status == 'skipped':
+            print(f"⚠️  Email skipped: Config not set. (To: {to_email})")
+            return None
+        self.start()
+        self._wakeup.set()
+        return True
+
+    def _claim_batch(self):
+        """Atomically mark up to batch_size due messages as ours"""
+        now = datetime.now()
+        token = uuid.uuid4().hex
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            # Messages stuck in 'sending' by a worker that died go back to the queue
+            cursor.execute(format_sql('''UPDATE email_outbox SET status='pending', claim_token=NULL
+                                         WHERE status='sending' AND claimed_at < ?''', conn),
+                           ((now - self.lease).isoformat(),))
+            cursor.execute(format_sql('''UPDATE email_outbox SET status='sending', claim_token=?, claimed_at=?
+                                         WHERE status='pending' AND id IN (
+                                             SELECT id FROM email_outbox
+                                             WHERE status='pending' AND next_attempt_at <= ?
+                                             ORDER BY id LIMIT ?)''', conn),
+                           (token, now.isoformat(), now.isoformat(), self.batch_size))
+            conn.commit()
+            cursor.execute(format_sql('SELECT * FROM email_outbox WHERE claim_token=? ORDER BY id', conn), (token,))
+            return [dict(r) for r in cursor.fetchall()]
+
+    def _finish(self, row, error=None, permanent=False):
+        now = datetime.now()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            if error is None:
+                cursor.execute(format_sql('''UPDATE email_outbox SET status='sent', sent_at=?, claim_token=NULL,
+                                             attempts=attempts + 1, last_error=NULL WHERE id=?''', conn),
+                               (now.isoformat(), row['id']))
+            else:
+                attempts = (row['attempts'] or 0) + 1
+                give_up = permanent or attempts >= self.max_attempts
+                retry_at = now + timedelta(seconds=min(self.base_backoff * 2 ** (attempts - 1), 6 * 3600))
+                cursor.execute(format_sql('''UPDATE email_outbox SET status=?, attempts=?, next_attempt_at=?,
+                                             claim_token=NULL, last_error=? WHERE id=?''', conn),
+                               ('failed' if give_up else 'pending', attempts, retry_at.isoformat(),
+                                str(error)[:500], row['id']))
+            conn.commit()
+        with self._lock:
+            if error is None:
+                self._stats['sent'] += 1
+                self._sent_times.append(time.monotonic())
+            elif permanent or (row['attempts'] or 0) + 1 >= self.max_attempts:
+                self._stats['failed'] += 1
+            else:
+                self._stats['retried'] += 1
+
+    def _sender_loop(self):
+        session = SMTPSession(self.config)
+        unrecorded = []  # sent, but marking them 'sent' failed; retried before the lease hands them out again
+        while True:
+            try:
+                unrecorded = [row for row in unrecorded if not self._record_sent(row)]
+                self._send_batch(session, unrecorded)
+            except Exception as e:
+                # Never let the thread die: this worker would stop sending until it restarts
+                print(f"❌ Outbox sender error: {e}")
+                session.close()
+                time.sleep(self.poll_seconds)
+
+    def _send_batch(self, session, unrecorded):
+        batch = self._claim_batch()
+        if not batch:
+            if session.server is not None and time.monotonic() - session.last_used > session.MAX_IDLE_SECONDS:
+                session.close()
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            return
+
+        connects_before = session.connects
+        for row in batch:
+            try:
+                msg = build_message(self.config, row['to_email'], row['subject'], row['html_content'],
+                                    json.loads(row['attachments'] or '[]'))
+                session.send(msg)
+            except smtplib.SMTPRecipientsRefused as e:
+                self._record_failure(row, e, permanent=True)
+                print(f"❌ Email Error: recipient refused ({row['to_email']})")
+                continue
+            except Exception as e:
+                session.close()
+                self._record_failure(row, e)
+                print(f"❌ Email Error: {str(e)}")
+                continue
+            # Delivered: from here on a bookkeeping error must not turn into a retry (a second email)
+            print(f"✅ Email sent successfully to {row['to_email']}")
+            if not self._record_sent(row):
+                unrecorded.append(row)
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['smtp_connects'] += session.connects - connects_before
+
+    def _record_sent(self, row):
+        try:
+            self._finish(row)
+            return True
+        except Exception as e:
+            print(f"❌ Outbox error: email {row['id']} was sent but could not be marked sent: {e}")
+            return False
+
+    def _record_failure(self, row, error, permanent=False):
+        # Left in 'sending' if this fails too; the lease puts it back in the queue
+        try:
+            self._finish(row, error, permanent=permanent)
+        except Exception as e:
+            print(f"❌ Outbox error: could not record failure of email {row['id']}: {e}")
+
+    def purge(self, keep_days=30):
+        """Delete sent/skipped messages older than keep_days (failed ones are kept for inspection)"""
+        cutoff = (datetime.now() - timedelta(days=keep_days)).isoformat()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql("DELETE FROM email_outbox WHERE status IN ('sent', 'skipped') AND created_at < ?", conn),
+                           (cutoff,))
+            removed = cursor.rowcount or 0
+            conn.commit()
+        return removed
+
+    def queue_depth(self):
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute("SELECT status, COUNT(*) AS n FROM email_outbox WHERE status IN ('pending', 'sending') GROUP BY status")
+            return {row['status']: row['n'] for row in cursor.fetchall()}
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['sent_last_minute'] = sum(1 for t in self._sent_times if now - t <= 60)
+        try:
+            depth = self.queue_depth()
+        except Exception:
+            depth = {}
+        stats['queue_depth'] = depth.get('pending', 0)
+        stats['in_flight'] = depth.get('sending', 0)
+        stats['senders'] = self.senders
+        return stats
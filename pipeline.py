@@ -0,0 +1,123 @@
+"""
+Background Pipeline
+A bounded queue drained by a few worker threads, used to run slow
+post-submission work (translation, AI scoring, notifications) off the
+request path. Handlers time their stages with StageTimer, and the
+pipeline keeps aggregate counters for monitoring.
+
+Workers start lazily in each process (safe with gunicorn --preload) and
+call the optional `recover` hook once on start to re-queue work that a
+previous worker process left unfinished.
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+class StageTimer:
+    """Collects wall-clock milliseconds per named stage"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[f"{name}_ms"] = round((time.monotonic() - start) * 1000, 1)
+
+    def finish(self):
+        self.timings['total_ms'] = round((time.monotonic() - self.started) * 1000, 1)
+        return self.timings
+
+class BackgroundPipeline:
+    """Runs handler(item) for each submitted item on background worker threads"""
+
+    def __init__(self, name, handler, workers=2, max_queue=1000, recover=None):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.recover = recover
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stats = {'submitted': 0, 'processed': 0, 'failed': 0, 'rejected': 0,
+                       'recovered': 0, 'busy_ms': 0.0}
+        self._stage_totals = {}
+
+    def start(self):
+        """Start worker threads in this process (no-op if already running)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)  # a forked queue is not ours
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True).start()
+        if self.recover:
+            threading.Thread(target=self._recover, name=f"{self.name}-recover", daemon=True).start()
+        print(f"⚙️  Pipeline '{self.name}' started with {self.workers} worker(s)")
+
+    def submit(self, item):
+        """Queue an item; False when the queue is full (caller should fall back)"""
+        self.start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+        with self._lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def record_timings(self, timings):
+        """Fold one job's StageTimer results into the aggregate counters"""
+        with self._lock:
+            for stage, ms in timings.items():
+                total, count = self._stage_totals.get(stage, (0.0, 0))
+                self._stage_totals[stage] = (total + ms, count + 1)
+
+    def _recover(self):
+        try:
+            items = self.recover() or []
+        except Exception as e:
+            print(f"⚠️  Pipeline '{self.name}' recovery failed: {e}")
+            return
+        for item in items:
+            if self.submit(item):
+                with self._lock:
+                    self._stats['recovered'] += 1
+        if items:
+            print(f"♻️  Pipeline '{self.name}' re-queued {len(items)} unfinished item(s)")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            start = time.monotonic()
+            try:
+                self.handler(item)
+                outcome = 'processed'
+            except Exception as e:
+                print(f"❌ Pipeline '{self.name}' failed on {item}: {e}")
+                outcome = 'failed'
+            finally:
+                self._queue.task_done()
+            with self._lock:
+                self._stats[outcome] += 1
+                self._stats['busy_ms'] += (time.monotonic() - start) * 1000
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['busy_ms'] = round(stats['busy_ms'], 1)
+            stats['avg_stage_ms'] = {stage: round(total / count, 1)
+                                     for stage, (total, count) in self._stage_totals.items()}
+        stats['queue_depth'] = self._queue.qsize()
+        stats['workers'] = self.workers
+        return stats
@@ -0,0 +1,202 @@
+"""
+Rate Limiting
+Token buckets keyed by route and client (IP address, phone number). A
+bucket holds up to `capacity` tokens and refills continuously at
+capacity / period; each request takes one token, and an empty bucket
+answers 429 with a Retry-After header saying when the next token arrives.
+A request limited per IP and per phone takes a token from both buckets or
+from neither, so requests refused for one phone number do not use up the
+allowance of everyone behind the same (NAT) address.
+
+Buckets live in an in-process map (per worker) or in the
+rate_limit_buckets table, which every gunicorn worker and instance shares.
+Limits are written as "count/period", e.g. "5/10m", "100/1h", "3/60".
+"""
+
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import request, jsonify
+
+from db_config import db_connection, get_db_cursor, format_sql, select_for_update
+
+PERIOD_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_limit(spec):
+    """'5/10m' -> (5, 600.0); None/'' or '0/...' disables the limit"""
+    if not spec:
+        return None
+    count, _, period = str(spec).partition('/')
+    period = period.strip().lower() or '60'
+    unit = PERIOD_UNITS.get(period[-1])
+    seconds = float(period[:-1] or 1) * unit if unit else float(period)
+    count = int(count)
+    return (count, seconds) if count > 0 and seconds > 0 else None
+
+def refill(tokens, updated_at, now, capacity, period):
+    """Tokens in a bucket at `now`; a bucket never seen before is full"""
+    if tokens is None:
+        return float(capacity)
+    return min(float(capacity), tokens + max(now - updated_at, 0.0) * capacity / period)
+
+def take_tokens(states, now):
+    """
+    Take one token from every bucket or from none, so a request refused by
+    one limit costs nothing against the others. states: [(tokens,
+    updated_at, capacity, period)]; returns (tokens left, seconds until each
+    bucket has a token), the waits all 0 when the request is allowed.
+    """
+    levels = [refill(tokens, updated_at, now, capacity, period) for tokens, updated_at, capacity, period in states]
+    waits = [0.0 if level >= 1 else (1 - level) * period / capacity
+             for level, (_, _, capacity, period) in zip(levels, states)]
+    if any(waits):
+        return levels, waits
+    return [level - 1 for level in levels], waits
+
+class MemoryBuckets:
+    """Buckets for this process only (each worker enforces the limit separately)"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, updated_at monotonic, capacity, period)
+        self._lock = threading.Lock()
+
+    def take(self, requests):
+        """requests: [(key, capacity, period)]; seconds to wait per bucket (all 0: allowed, tokens taken)"""
+        now = time.monotonic()
+        with self._lock:
+            states = [(*self._buckets.get(key, (None, now))[:2], capacity, period) for key, capacity, period in requests]
+            tokens, waits = take_tokens(states, now)
+            for (key, capacity, period), left in zip(requests, tokens):
+                self._buckets[key] = (left, now, capacity, period)
+            if len(self._buckets) > self.max_keys:
+                self._drop_full(now)
+        return waits
+
+    def _drop_full(self, now):
+        # A bucket that has refilled completely is the same as no bucket
+        full = [key for key, (tokens, updated_at, capacity, period) in self._buckets.items()
+                if tokens + (now - updated_at) * capacity / period >= capacity]
+        for key in full:
+            del self._buckets[key]
+
+    def prune(self):
+        with self._lock:
+            before = len(self._buckets)
+            self._drop_full(time.monotonic())
+            return before - len(self._buckets)
+
+class DatabaseBuckets:
+    """Buckets in rate_limit_buckets, read and written under a row/database lock"""
+
+    def take(self, requests):
+        """requests: [(key, capacity, period)]; seconds to wait per bucket (all 0: allowed, tokens taken)"""
+        now = time.time()
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            rows = {}
+            for key in sorted({key for key, _, _ in requests}):  # one lock order for every request
+                rows[key] = select_for_update(cursor, conn, 'SELECT tokens, updated_at FROM rate_limit_buckets WHERE bucket_key = ?',
+                                              (key,))
+            states = [(rows[key]['tokens'] if rows[key] else None, rows[key]['updated_at'] if rows[key] else now,
+                       capacity, period) for key, capacity, period in requests]
+            tokens, waits = take_tokens(states, now)
+            # A brand-new key has no row to lock; two racing first requests can both see a full bucket
+            cursor.executemany(format_sql('''INSERT INTO rate_limit_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?)
+                                             ON CONFLICT (bucket_key) DO UPDATE SET tokens = excluded.tokens,
+                                                                                    updated_at = excluded.updated_at''', conn),
+                               [(key, left, now) for (key, _, _), left in zip(requests, tokens)])
+            conn.commit()
+        return waits
+
+    def prune(self, idle_seconds=86400):
+        """Delete buckets untouched for idle_seconds (refilled by then for any period up to that)"""
+        with db_connection() as conn:
+            cursor = get_db_cursor(conn)
+            cursor.execute(format_sql('DELETE FROM rate_limit_buckets WHERE updated_at < ?', conn),
+                           (time.time() - idle_seconds,))
+            removed = cursor.rowcount or 0
+            conn.commit()
+        return removed
+
+class RateLimiter:
+    """Per-route token-bucket limits applied with the @limit decorator"""
+
+    def __init__(self, buckets, enabled=True, proxy_hops=1):
+        self.buckets = buckets
+        self.enabled = enabled
+        self.proxy_hops = proxy_hops
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, scope, stat):
+        with self._lock:
+            counters = self._stats.setdefault(scope, {'allowed': 0, 'limited': 0, 'errors': 0})
+            counters[stat] += 1
+
+    def client_ip(self):
+        """Address of the client as seen by the last `proxy_hops` trusted proxies (X-Forwarded-For)"""
+        # Entries left of the ones our proxies appended are client-supplied and can be forged
+        forwarded = request.access_route if request.headers.get('X-Forwarded-For') else []
+        if self.proxy_hops and len(forwarded) >= self.proxy_hops:
+            return forwarded[-self.proxy_hops]
+        return request.remote_addr or 'unknown'
+
+    def check(self, checks):
+        """
+        checks: [(scope, key, limit)]. Seconds to wait before retrying, or 0
+        if the request may proceed; a token is taken from every bucket only
+        when all of them have one (fails open on errors).
+        """
+        try:
+            waits = self.buckets.take([(f"{scope}:{key}", *limit) for scope, key, limit in checks])
+        except Exception as e:
+            print(f"⚠️  Rate limiter error ({', '.join(scope for scope, _, _ in checks)}): {e}")
+            for scope, _, _ in checks:
+                self._count(scope, 'errors')
+            return 0
+        if not any(waits):
+            for scope, _, _ in checks:
+                self._count(scope, 'allowed')
+            return 0
+        for (scope, _, _), wait in zip(checks, waits):
+            if wait:
+                self._count(scope, 'limited')
+        return max(1, math.ceil(max(waits)))
+
+    def limit(self, scope, per_ip=None, per_phone=None, phone_field='phone'):
+        """Decorator for a Flask view: per-IP and/or per-phone limits ("count/period")"""
+        ip_limit, phone_limit = parse_limit(per_ip), parse_limit(per_phone)
+
+        def decorate(view):
+            @wraps(view)
+            def limited_view(*args, **kwargs):
+                if self.enabled:
+                    checks = []
+                    if ip_limit:
+                        checks.append((f"{scope}:ip", self.client_ip(), ip_limit))
+                    if phone_limit:
+                        data = request.get_json(silent=True) or {}
+                        phone = data.get(phone_field) if isinstance(data, dict) else None
+                        phone = phone or request.form.get(phone_field)
+                        if phone:
+                            checks.append((f"{scope}:phone", str(phone).strip(), phone_limit))
+                    retry_after = self.check(checks) if checks else 0
+                    if retry_after:
+                        response = jsonify({"success": False, "retry_after": retry_after,
+                                            "message": f"Too many requests. Please try again in {retry_after} seconds."})
+                        response.headers['Retry-After'] = str(retry_after)
+                        return response, 429
+                return view(*args, **kwargs)
+            return limited_view
+        return decorate
+
+    def stats(self):
+        with self._lock:
+            return {scope: dict(counters) for scope, counters in self._stats.items()}
+
+def make_rate_limiter(backend='database', enabled=True, proxy_hops=1):
+    return RateLimiter(MemoryBuckets() if backend == 'memory' else DatabaseBuckets(),
+                       enabled=enabled, proxy_hops=proxy_hops)
@@ -0,0 +1,66 @@
+"""
+Complaint Search
+Ranked full-text search over description_translated, description_original,
+location_address and citizen_name (weighted in that order). SQLite uses
+the complaints_fts FTS5 table, Postgres a GIN index on
+complaint_search_document(...); both are kept current by the database
+itself (see migration 16), so every insert and update is searchable at once.
+
+Queries are split into words on whitespace and punctuation only, so
+Devanagari and other Indic-script words (whose vowel signs are combining
+marks) stay whole. All words must match; the last one also matches as a
+prefix, which suits search-as-you-type.
+"""
+
+import unicodedata
+
+from db_config import format_sql, is_postgres
+
+SEARCH_MAX_TERMS = 8
+
+# bm25 weights per FTS5 column, in table order
+FTS_WEIGHTS = (4.0, 4.0, 2.0, 1.0)
+
+def search_terms(text):
+    """Words of a search box query (letters, marks and digits), at most SEARCH_MAX_TERMS"""
+    cleaned = ''.join(ch if unicodedata.category(ch)[0] in 'LMN' else ' ' for ch in text or '')
+    return cleaned.lower().split()[:SEARCH_MAX_TERMS]
+
+def fts5_query(terms):
+    """FTS5 MATCH expression: every term, the last as a prefix"""
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+def tsquery_text(terms):
+    """to_tsquery() input: every term, the last as a prefix"""
+    return ' & '.join(f"'{term}'" for term in terms) + ':*'
+
+def search_complaints(cursor, conn, text, columns, department=None, statuses=None, limit=20, offset=0):
+    """Best matches first (newest first among equals); rows carry the selected columns plus 'rank'"""
+    terms = search_terms(text)
+    if not terms:
+        return []
+    select = ', '.join(f"c.{column}" for column in columns)
+    where, params = [], []
+    if is_postgres(conn):
+        document = ("complaint_search_document(c.description_translated, c.description_original, "
+                    "c.location_address, c.citizen_name)")
+        query = "(to_tsquery('english', ?) || to_tsquery('simple', ?))"
+        rank = f"ts_rank_cd({document}, {query})"
+        where.append(f"{document} @@ {query}")
+        params += [tsquery_text(terms)] * 4  # twice for the rank, twice for the match
+        source = "complaints c"
+    else:
+        where.append("complaints_fts MATCH ?")
+        params.append(fts5_query(terms))
+        # bm25() is lower for better matches; negated so both databases sort rank descending
+        rank = f"-bm25(complaints_fts, {', '.join(str(w) for w in FTS_WEIGHTS)})"
+        source = "complaints_fts JOIN complaints c ON c.rowid = complaints_fts.rowid"
+    if department:
+        where.append("c.department = ?"); params.append(department)
+    if statuses:
+        where.append(f"c.status IN ({','.join('?' * len(statuses))})"); params.extend(statuses)
+
+    sql = (f"SELECT {select}, {rank} AS rank FROM {source} WHERE {' AND '.join(where)} "
+           f"ORDER BY rank DESC, c.created_at DESC, c.id DESC LIMIT ? OFFSET ?")
+    cursor.execute(format_sql(sql, conn), (*params, limit, offset))
+    return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,232 @@
+"""
+Analytics Snapshot
+Writes complaints and complaint_transfers to columnar files (Parquet, or
+Arrow IPC) for offline analysis, partitioned Hive-style by month and
+department:
+
+    <out>/complaints/month=2024-03/dept=Water_Dept/part-0.parquet
+    <out>/complaint_transfers/month=2024-03/dept=Roads_Dept/part-0.parquet
+
+manifest.json keeps a fingerprint of every partition (row count plus the
+latest updated_at, or the latest id for the append-only transfer log).
+Later runs rewrite only the partitions whose fingerprint changed and delete
+the ones that emptied, so a daily run reads a few partitions instead of the
+whole table. Needs pyarrow, which the web app itself does not:
+
+    pip install pyarrow
+    python snapshot.py --out snapshots [--format arrow] [--full]
+"""
+
+import json
+import os
+from datetime import datetime
+from urllib.parse import quote
+
+from db_config import get_db, get_db_cursor, format_sql, is_postgres
+from export import iter_batches, EXPORT_BATCH_SIZE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+SNAPSHOT_FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}  # format -> file extension
+
+# table -> (partition time column, partition department column, change marker)
+SNAPSHOT_TABLES = {
+    'complaints': ('created_at', 'department', 'COALESCE(updated_at, created_at)'),
+    'complaint_transfers': ('transferred_at', 'to_department', 'id'),
+}
+
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+MANIFEST_FILE = 'manifest.json'
+
+def column_types(conn, table):
+    """[(column, arrow type)] in table order, from the declared column types"""
+    cursor = get_db_cursor(conn)
+    if is_postgres(conn):
+        cursor.execute(format_sql('''SELECT column_name AS name, data_type AS type FROM information_schema.columns
+                                     WHERE table_name = ? ORDER BY ordinal_position''', conn), (table,))
+    else:
+        cursor.execute(f'PRAGMA table_info({table})')
+    columns = []
+    for row in cursor.fetchall():
+        declared = (row['type'] or '').upper()
+        if 'INT' in declared or 'SERIAL' in declared:
+            arrow_type = pa.int64()
+        elif any(t in declared for t in ('REAL', 'DOUBLE', 'FLOAT', 'NUMERIC')):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        columns.append((row['name'], arrow_type))
+    return columns
+
+def _coerce(value, arrow_type):
+    # SQLite does not enforce declared types; an unparseable value becomes null
+    if value is None:
+        return None
+    try:
+        if arrow_type == pa.int64():
+            return int(value)
+        if arrow_type == pa.float64():
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    return str(value)
+
+def partition_fingerprints(conn, table):
+    """{(month, department): {'rows': n, 'version': marker}} for every non-empty partition"""
+    time_column, dept_column, marker = SNAPSHOT_TABLES[table]
+    cursor = get_db_cursor(conn)
+    # '' and NULL share one partition directory, so they are grouped (and queried) as one partition
+    month, department = f"NULLIF(SUBSTR({time_column}, 1, 7), '')", f"NULLIF({dept_column}, '')"
+    cursor.execute(f'''SELECT {month} AS month, {department} AS department,
+                              COUNT(*) AS row_count, MAX({marker}) AS version
+                       FROM {table} GROUP BY {month}, {department}''')
+    return {(row['month'], row['department']): {'rows': row['row_count'], 'version': str(row['version'])}
+            for row in cursor.fetchall()}
+
+def partition_path(table, month, department, fmt):
+    """Relative file path of one partition"""
+    month_key = month or NULL_PARTITION
+    dept_key = quote(department, safe='') if department else NULL_PARTITION
+    return os.path.join(table, f"month={month_key}", f"dept={dept_key}", f"part-0.{SNAPSHOT_FORMATS[fmt]}")
+
+def _partition_query(table, month, department):
+    time_column, dept_column, _ = SNAPSHOT_TABLES[table]
+    where, params = [], []
+    if month:
+        year, mon = int(month[:4]), int(month[5:7])
+        next_month = f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+        # A range on the raw column (not SUBSTR) so the created_at/transferred_at indexes apply
+        where.append(f"{time_column} >= ? AND {time_column} < ?"); params += [month, next_month]
+    else:
+        where.append(f"({time_column} IS NULL OR {time_column} = '')")
+    if not department:
+        where.append(f"({dept_column} IS NULL OR {dept_column} = '')")
+    else:
+        where.append(f"{dept_column} = ?"); params.append(department)
+    return f"SELECT * FROM {table} WHERE {' AND '.join(where)} ORDER BY {time_column}, id", params
+
+def write_partition(conn, table, month, department, path, schema, fmt='parquet', batch_size=EXPORT_BATCH_SIZE):
+    """Stream one partition into path (written to a temp file, then renamed); returns rows written"""
+    sql, params = _partition_query(table, month, department)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(tmp_path, schema, compression='snappy')
+    else:
+        writer = pa.ipc.new_file(tmp_path, schema)
+    written = 0
+    try:
+        for columns, rows in iter_batches(conn, sql, params, batch_size):
+            if not rows:
+                continue
+            index = {name: i for i, name in enumerate(columns)}
+            arrays = [pa.array([_coerce(row[index[field.name]], field.type) for row in rows], type=field.type)
+                      for field in schema]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            written += len(rows)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    return written
+
+def _remove(out_dir, relative_path):
+    path = os.path.join(out_dir, relative_path)
+    if os.path.exists(path):
+        os.remove(path)
+    # Drop the partition directories left empty
+    directory = os.path.dirname(path)
+    while directory != out_dir and os.path.isdir(directory) and not os.listdir(directory):
+        os.rmdir(directory)
+        directory = os.path.dirname(directory)
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+def write_snapshot(conn, out_dir, fmt='parquet', full=False, tables=tuple(SNAPSHOT_TABLES)):
+    """
+    Bring the snapshot in out_dir up to date with the database; returns
+    {table: {'written': partitions, 'unchanged': partitions, 'removed': partitions, 'rows': rows written}}
+    """
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed. Run: pip install pyarrow")
+    if fmt not in SNAPSHOT_FORMATS:
+        raise ValueError(f"Unknown snapshot format: {fmt}")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    if manifest.get('format') != fmt:
+        full = True  # files in another format cannot be reused
+    previous_tables = manifest.get('tables', {})
+    manifest = {'format': fmt, 'tables': dict(previous_tables)}
+    summary = {}
+
+    for table in tables:
+        schema = pa.schema(column_types(conn, table))
+        schema_key = [[field.name, str(field.type)] for field in schema]
+        previous = previous_tables.get(table, {})
+        if previous.get('schema') != schema_key:
+            full_table = True  # a new column: every file needs it
+        else:
+            full_table = full
+        old_partitions = previous.get('partitions', {})
+        partitions = {}
+        stats = {'written': 0, 'unchanged': 0, 'removed': 0, 'rows': 0}
+
+        # Fingerprints are read before the data: a write in between only makes the next run redo the partition
+        for (month, department), fingerprint in sorted(partition_fingerprints(conn, table).items(),
+                                                         key=lambda item: (item[0][0] or '', item[0][1] or '')):
+            path = partition_path(table, month, department, fmt)
+            old = old_partitions.get(path)
+            entry = {'month': month, 'department': department, **fingerprint}
+            if (not full_table and old and old['rows'] == fingerprint['rows'] and old['version'] == fingerprint['version']
+                    and os.path.exists(os.path.join(out_dir, path))):
+                stats['unchanged'] += 1
+            else:
+                stats['rows'] += write_partition(conn, table, month, department, os.path.join(out_dir, path), schema, fmt)
+                stats['written'] += 1
+            partitions[path] = entry
+
+        for path in old_partitions:
+            if path not in partitions:
+                _remove(out_dir, path)
+                stats['removed'] += 1
+        manifest['tables'][table] = {'schema': schema_key, 'partitions': partitions}
+        summary[table] = stats
+
+    manifest['generated_at'] = datetime.now().isoformat()
+    save_manifest(out_dir, manifest)
+    return summary
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write complaints and transfers as partitioned columnar files')
+    parser.add_argument('--out', default='snapshots', help='snapshot directory (default: snapshots)')
+    parser.add_argument('--format', choices=sorted(SNAPSHOT_FORMATS), default='parquet')
+    parser.add_argument('--full', action='store_true', help='rewrite every partition')
+    args = parser.parse_args()
+
+    if not PYARROW_AVAILABLE:
+        raise SystemExit("❌ pyarrow is not installed. Run: pip install pyarrow")
+    conn = get_db()
+    try:
+        summary = write_snapshot(conn, args.out, args.format, full=args.full)
+    finally:
+        conn.close()
+    for table, stats in summary.items():
+        print(f"✅ {table}: {stats['written']} partition(s) written ({stats['rows']} rows), "
+              f"{stats['unchanged']} unchanged, {stats['removed']} removed")
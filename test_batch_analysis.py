@@ -0,0 +1,222 @@
+"""
+Batched Gemini re-analysis against a local fake generateContent server:
+
+    python test_batch_analysis.py        (or: python -m pytest test_batch_analysis.py)
+
+The fake answers each request from a script (partial results, 429 with
+Retry-After, 500s, a non-retryable 400) and records the ids it was asked
+about. A throwaway SQLite database holds the complaints; results are
+collected in memory, except in the write-back check, which runs the app's
+apply_reanalysis against that database.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import db_config
+from db_config import db_connection, get_db_cursor
+from migrations import run_migrations
+from batch_analysis import (BatchReanalyzer, GeminiBatchClient, RequestBudget, iter_batches, iter_id_batches,
+                            load_checkpoint, parse_batch_response)
+
+class FakeGemini(ThreadingHTTPServer):
+    """
+    POST /generateContent. Each request takes the next entry of `script`
+    ('ok' once it is empty): 'ok', ('skip', n) to leave out the last n ids,
+    ('status', code) or ('status', code, retry_after).
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeGeminiHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}/generateContent"
+        self.script = []
+        self.requests = []   # ids asked about, per request
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['contents'][0]['parts'][0]['text']
+        ids = [item['id'] for item in json.loads(prompt.split('Complaints:\n', 1)[1])]
+        with self.server.lock:
+            self.server.requests.append(ids)
+            action = self.server.script.pop(0) if self.server.script else 'ok'
+        if action != 'ok' and action[0] == 'status':
+            self.send_response(action[1])
+            if len(action) > 2:
+                self.send_header('Retry-After', str(action[2]))
+            self.end_headers()
+            self.wfile.write(b'{"error": "fake"}')
+            return
+        answered = ids[:-action[1]] if action != 'ok' else ids
+        text = json.dumps([{'id': cid, 'priority': 2, 'sentiment': 'negative',
+                            'detected_department': 'Water_Supply_Dept'} for cid in answered])
+        payload = json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def use_temp_database(complaints=0):
+    db_config.SQLITE_DB = os.path.join(tempfile.mkdtemp(), 'batch_test.db')
+    db_config._pool = None
+    run_migrations()
+    with db_connection() as conn:
+        conn.executemany('INSERT INTO complaints (id, category, description, created_at) VALUES (?, ?, ?, ?)',
+                         [(f"C{i:03d}", 'Water_Supply', f"water leak number {i}", f"2024-03-01T10:{i // 60:02d}:{i % 60:02d}")
+                          for i in range(complaints)])
+        conn.commit()
+
+def complaint_rows():
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute('SELECT * FROM complaints ORDER BY id')
+        return {row['id']: dict(row) for row in cursor.fetchall()}
+
+def make_reanalyzer(server, checkpoint_path=None):
+    applied = []
+
+    def apply_results(results):
+        applied.extend(results)
+        return 0
+
+    client = GeminiBatchClient(server.url, 'test-key', 'guide', RequestBudget(0), timeout=5, max_attempts=3)
+    return BatchReanalyzer(client, apply_results, 'test-v1', concurrency=1, checkpoint_path=checkpoint_path), applied
+
+def test_parse_batch_response():
+    text = '```json\n[{"id": "A", "priority": "3"}, {"id": "B", "priority": 42}, {"id": "X"}, "junk"]\n```'
+    results = parse_batch_response(text, ['A', 'B', 'C'])
+    assert set(results) == {'A', 'B'}
+    assert results['A']['priority'] == 3 and results['B']['priority'] == 10
+    assert results['A']['sentiment'] == 'neutral'
+    assert parse_batch_response('{"results": [{"id": 7}]}', ['7']) == {
+        '7': {'priority': 5, 'sentiment': 'neutral', 'detected_department': None}}
+
+def test_retries_429_and_500_then_succeeds():
+    use_temp_database(3)
+    server = FakeGemini()
+    server.script = [('status', 429, 1), ('status', 500)]
+    reanalyzer, applied = make_reanalyzer(server)
+    result = reanalyzer.run(iter_batches(10))
+    assert len(server.requests) == 3
+    assert sorted(applied) == ['C000', 'C001', 'C002']
+    assert result['failed_ids'] == []
+
+def test_skipped_ids_are_asked_again():
+    use_temp_database(5)
+    server = FakeGemini()
+    server.script = [('skip', 2)]
+    reanalyzer, applied = make_reanalyzer(server)
+    result = reanalyzer.run(iter_batches(5))
+    assert server.requests == [['C000', 'C001', 'C002', 'C003', 'C004'], ['C003', 'C004']]
+    assert sorted(applied) == ['C000', 'C001', 'C002', 'C003', 'C004']
+    assert result['updated'] == 5 and result['failed_ids'] == []
+
+def test_failed_retry_keeps_the_first_results():
+    use_temp_database(4)
+    server = FakeGemini()
+    server.script = [('skip', 1), ('status', 400)]
+    reanalyzer, applied = make_reanalyzer(server)
+    result = reanalyzer.run(iter_batches(4))
+    assert sorted(applied) == ['C000', 'C001', 'C002']
+    assert result['failed_ids'] == ['C003']
+
+def test_interrupted_run_resumes_from_checkpoint():
+    use_temp_database(10)
+    server = FakeGemini()
+    checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+
+    def interrupted(batches, after):
+        for n, batch in enumerate(batches):
+            if n == after:
+                raise KeyboardInterrupt
+            yield batch
+
+    reanalyzer, applied = make_reanalyzer(server, checkpoint_path)
+    try:
+        reanalyzer.run(interrupted(iter_batches(3), after=2))
+    except KeyboardInterrupt:
+        pass
+    checkpoint = load_checkpoint(checkpoint_path)
+    done = checkpoint['processed']
+    assert 0 < done < 10 and checkpoint['cursor'][1] == f"C{done - 1:03d}"
+
+    # The resumed run starts right after the cursor (a batch in flight at the interruption is redone)
+    reanalyzer, applied_after = make_reanalyzer(server, checkpoint_path)
+    asked_before = len(server.requests)
+    result = reanalyzer.run(iter_batches(3, after=checkpoint['cursor']))
+    resumed = [cid for ids in server.requests[asked_before:] for cid in ids]
+    assert resumed == [f"C{i:03d}" for i in range(done, 10)]
+    assert sorted(set(applied) | set(applied_after)) == [f"C{i:03d}" for i in range(10)]
+    assert result['processed'] == 10 and result['failed_ids'] == []
+
+def test_failed_batch_is_retried_with_retry_failed():
+    use_temp_database(6)
+    server = FakeGemini()
+    server.script = [('status', 400)]
+    checkpoint_path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+    reanalyzer, applied = make_reanalyzer(server, checkpoint_path)
+    result = reanalyzer.run(iter_batches(3))
+    assert result['failed_ids'] == ['C000', 'C001', 'C002']
+    assert result['cursor'] == ['2024-03-01T10:00:05', 'C005']
+
+    reanalyzer, applied = make_reanalyzer(server, checkpoint_path)
+    result = reanalyzer.run(iter_id_batches(result['failed_ids'], 3), retry_failed=True)
+    assert sorted(applied) == ['C000', 'C001', 'C002']
+    assert result['failed_ids'] == [] and result['updated'] == 6 and result['processed'] == 6
+    assert result['cursor'] == ['2024-03-01T10:00:05', 'C005']
+
+def test_stale_version_compares_the_parsed_analysis():
+    use_temp_database(5)
+    stored = [None, '{"prompt_version":"test-v1"}', '{"priority": 3, "prompt_version": "test-v1"}',
+              '{"prompt_version": "test-v10"}', 'not json']
+    with db_connection() as conn:
+        conn.executemany('UPDATE complaints SET ai_analysis=? WHERE id=?',
+                         [(analysis, f"C{i:03d}") for i, analysis in enumerate(stored)])
+        conn.commit()
+    stale = [item['id'] for batch in iter_batches(10, stale_version='test-v1') for item in batch]
+    assert stale == ['C000', 'C003', 'C004']
+
+def test_results_are_written_back_by_apply_reanalysis():
+    use_temp_database(3)
+    with db_connection() as conn:
+        conn.execute("UPDATE complaints SET priority=7, department='General_Admin_Dept', status='Pending'")
+        conn.execute("UPDATE complaints SET status='In Progress' WHERE id='C002'")  # an official has acted on it
+        conn.commit()
+    os.environ.setdefault('ENRICHMENT_WORKERS', '0')
+    from app import apply_reanalysis
+
+    server = FakeGemini()
+    client = GeminiBatchClient(server.url, 'test-key', 'guide', RequestBudget(0), timeout=5, max_attempts=3)
+    result = BatchReanalyzer(client, apply_reanalysis, 'test-v1', concurrency=1).run(iter_batches(10))
+    assert result['updated'] == 3 and result['rerouted'] == 2 and result['failed_ids'] == []
+
+    rows = complaint_rows()
+    for cid in ('C000', 'C001'):
+        c = rows[cid]
+        assert c['priority'] == 2 and c['department'] == 'Water_Supply_Dept'
+        assert c['assigned_to'] == 'Water_Supply_Dept_Manager' and c['sla_hours'] == 4
+        assert c['sla_deadline'] == (datetime.fromisoformat(c['created_at']) + timedelta(hours=4)).isoformat()
+    assert rows['C002']['priority'] == 7 and rows['C002']['department'] == 'General_Admin_Dept'
+    for c in rows.values():
+        analysis = json.loads(c['ai_analysis'])
+        assert analysis['prompt_version'] == 'test-v1' and analysis['priority'] == 2
+        assert analysis['detected_department'] == 'Water_Supply_Dept'
+
+if __name__ == "__main__":
+    for check in (test_parse_batch_response, test_retries_429_and_500_then_succeeds, test_skipped_ids_are_asked_again,
+                  test_failed_retry_keeps_the_first_results, test_interrupted_run_resumes_from_checkpoint,
+                  test_failed_batch_is_retried_with_retry_failed, test_stale_version_compares_the_parsed_analysis,
+                  test_results_are_written_back_by_apply_reanalysis):
+        check()
+        print(f"✅ {check.__name__}")
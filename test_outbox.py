@@ -0,0 +1,202 @@
+"""
+Email outbox against a local debugging SMTP server (nothing leaves the machine):
+
+    python test_outbox.py        (or: python -m pytest test_outbox.py)
+
+Runs a minimal SMTP server in-process and a throwaway SQLite database, and
+checks that a batch goes out over one SMTP session, that failed sends are
+retried with exponential backoff, and that a message is never sent twice.
+"""
+
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import db_config
+from db_config import db_connection, get_db_cursor
+from migrations import run_migrations
+from outbox import EmailOutbox, SMTPSession
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """Accepts mail like a debugging SMTP server; can refuse recipients or fail DATA on demand"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.port = self.server_address[1]
+        self.connections = 0
+        self.messages = []           # (recipients, raw message)
+        self.fail_data = 0           # answer the next N DATA commands with 451
+        self.refused = set()         # recipients answered with 550
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        recipients = []
+        self.reply('220 localhost debugging SMTP')
+        for raw in self.rfile:
+            command = raw.decode(errors='replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply('250-localhost'); self.reply('250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                body = []
+                for line in self.rfile:
+                    if line in (b'.\r\n', b'.\n'):
+                        break
+                    body.append(line)
+                if server.fail_data:
+                    server.fail_data -= 1
+                    self.reply('451 Temporary failure, try again later')
+                else:
+                    server.messages.append((recipients, b''.join(body)))
+                    self.reply('250 Queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+class ManualOutbox(EmailOutbox):
+    """No sender threads: the checks drive one batch at a time"""
+    def start(self):
+        pass
+
+def use_temp_database():
+    db_config.SQLITE_DB = os.path.join(tempfile.mkdtemp(), 'outbox_test.db')
+    db_config._pool = None
+    run_migrations()
+
+def make_outbox(server, **kwargs):
+    config = {'SMTP_SERVER': '127.0.0.1', 'SMTP_PORT': server.port, 'SMTP_USE_TLS': False,
+              'SENDER_EMAIL': 'dev@localhost', 'SENDER_PASSWORD': '', 'SENDER_NAME': 'Outbox Test'}
+    options = dict(senders=1, batch_size=10, base_backoff_seconds=1, poll_seconds=0.1)
+    options.update(kwargs)
+    return ManualOutbox(config, **options), SMTPSession(config)
+
+def outbox_rows():
+    with db_connection() as conn:
+        cursor = get_db_cursor(conn)
+        cursor.execute('SELECT * FROM email_outbox ORDER BY id')
+        return [dict(row) for row in cursor.fetchall()]
+
+def seconds_until(timestamp):
+    return (datetime.fromisoformat(timestamp) - datetime.now()).total_seconds()
+
+def test_batch_reuses_one_smtp_session():
+    use_temp_database()
+    server = DebugSMTPServer()
+    outbox, session = make_outbox(server)
+    for i in range(5):
+        outbox.enqueue(f"citizen{i}@example.com", f"Complaint {i}", "<p>Registered</p>")
+    outbox._send_batch(session, [])
+    assert len(server.messages) == 5
+    assert outbox.stats()['batches'] == 1
+    assert outbox.stats()['smtp_connects'] == 1
+
+    # The next batch goes over the same, still open session
+    for i in range(3):
+        outbox.enqueue(f"citizen{i}@example.com", "Status update", "<p>Resolved</p>")
+    outbox._send_batch(session, [])
+    assert len(server.messages) == 8
+    assert server.connections == 1 and outbox.stats()['smtp_connects'] == 1
+    assert all(row['status'] == 'sent' and row['attempts'] == 1 for row in outbox_rows())
+    session.close()
+
+def test_failed_send_is_retried_with_backoff():
+    use_temp_database()
+    server = DebugSMTPServer()
+    outbox, session = make_outbox(server)
+    server.fail_data = 2
+    outbox.enqueue('citizen@example.com', 'Complaint', '<p>Registered</p>')
+
+    outbox._send_batch(session, [])
+    row = outbox_rows()[0]
+    assert row['status'] == 'pending' and row['attempts'] == 1 and '451' in row['last_error']
+    assert 0 < seconds_until(row['next_attempt_at']) <= 1
+
+    outbox._send_batch(session, [])  # not due yet: nothing is claimed
+    assert outbox_rows()[0]['attempts'] == 1
+
+    time.sleep(1.1)
+    outbox._send_batch(session, [])
+    row = outbox_rows()[0]
+    assert row['status'] == 'pending' and row['attempts'] == 2
+    assert 1 < seconds_until(row['next_attempt_at']) <= 2  # doubled
+
+    time.sleep(2.1)
+    outbox._send_batch(session, [])
+    row = outbox_rows()[0]
+    assert row['status'] == 'sent' and row['attempts'] == 3
+    assert len(server.messages) == 1
+    assert outbox.stats()['retried'] == 2
+    session.close()
+
+def test_refused_recipient_is_not_retried():
+    use_temp_database()
+    server = DebugSMTPServer()
+    server.refused.add('nobody@example.com')
+    outbox, session = make_outbox(server)
+    outbox.enqueue('nobody@example.com', 'Complaint', '<p>Registered</p>')
+    outbox.enqueue('citizen@example.com', 'Complaint', '<p>Registered</p>')
+    outbox._send_batch(session, [])
+    refused, delivered = outbox_rows()
+    assert refused['status'] == 'failed' and refused['attempts'] == 1
+    assert delivered['status'] == 'sent'
+    assert [recipients for recipients, _ in server.messages] == [['citizen@example.com']]
+    session.close()
+
+def test_sent_message_is_not_resent_when_bookkeeping_fails():
+    use_temp_database()
+    server = DebugSMTPServer()
+    outbox, session = make_outbox(server)
+    outbox.enqueue('citizen@example.com', 'Complaint', '<p>Registered</p>')
+
+    finish = outbox._finish
+    def finish_fails_once(row, error=None, permanent=False):
+        outbox._finish = finish
+        raise RuntimeError('database is locked')
+    outbox._finish = finish_fails_once
+
+    unrecorded = []
+    outbox._send_batch(session, unrecorded)
+    assert len(server.messages) == 1
+    assert [row['id'] for row in unrecorded] == [outbox_rows()[0]['id']]
+    assert outbox_rows()[0]['status'] == 'sending'  # not put back for retry
+
+    # The sender loop records it on its next pass; it is not sent again
+    assert outbox._record_sent(unrecorded[0])
+    outbox._send_batch(session, [])
+    assert outbox_rows()[0]['status'] == 'sent'
+    assert len(server.messages) == 1
+    session.close()
+
+if __name__ == "__main__":
+    for check in (test_batch_reuses_one_smtp_session, test_failed_send_is_retried_with_backoff,
+                  test_refused_recipient_is_not_retried, test_sent_message_is_not_resent_when_bookkeeping_fails):
+        check()
+        print(f"✅ {check.__name__}")
@@ -0,0 +1,138 @@
+"""
+Text Similarity Index for Duplicate Detection
+Each open complaint with a location gets a MinHash signature of its
+description (character shingles, so it works the same for every script)
+and is filed under LSH band buckets in complaint_lsh_buckets. Bucket keys
+are prefixed with a coarse region (~1 km), so a query reads only the
+buckets of complaints that are both textually and geographically close,
+and the estimated Jaccard similarity is computed for that handful alone.
+
+With 16 bands of 4 rows, descriptions ~70% similar almost always share a
+bucket, while those under ~30% rarely do. Like geo_cell, the rows exist
+only while a complaint is open.
+"""
+
+import math
+import random
+import unicodedata
+import zlib
+
+from db_config import format_sql
+from geo_index import bounding_box
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+SHINGLE_SIZE = 4
+NUM_PERM = 64
+LSH_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // LSH_BANDS
+REGION_DEGREES = 0.01
+
+# Universal hashing (a*x + b) mod p; p < 2**31 keeps a*x below 2**63 (exact in uint64)
+HASH_PRIME = 2147483647
+_rng = random.Random(20240601)  # fixed: stored signatures must stay comparable across processes
+HASH_A = [_rng.randrange(1, HASH_PRIME) for _ in range(NUM_PERM)]
+HASH_B = [_rng.randrange(0, HASH_PRIME) for _ in range(NUM_PERM)]
+if NUMPY_AVAILABLE:
+    _A = np.array(HASH_A, dtype=np.uint64)[:, None]
+    _B = np.array(HASH_B, dtype=np.uint64)[:, None]
+
+def normalize(text):
+    """Lowercase letters, marks and digits with single spaces; punctuation dropped"""
+    kept = ''.join(ch if unicodedata.category(ch)[0] in 'LMN' else ' ' for ch in (text or '').lower())
+    return ' '.join(kept.split())
+
+def shingles(text):
+    """Set of SHINGLE_SIZE-character substrings of the normalized text"""
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+def signature(text):
+    """MinHash signature (NUM_PERM ints), or None for empty text"""
+    hashed = [zlib.crc32(s.encode('utf-8')) % HASH_PRIME for s in shingles(text)]
+    if not hashed:
+        return None
+    if NUMPY_AVAILABLE:
+        x = np.array(hashed, dtype=np.uint64)[None, :]
+        return [int(v) for v in ((_A * x + _B) % HASH_PRIME).min(axis=1)]
+    return [min((a * x + b) % HASH_PRIME for x in hashed) for a, b in zip(HASH_A, HASH_B)]
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the two texts' shingle sets"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+def encode_signature(sig):
+    return ''.join(f"{v:08x}" for v in sig)
+
+def decode_signature(encoded):
+    return [int(encoded[i:i + 8], 16) for i in range(0, len(encoded), 8)]
+
+def _region(lat, lon):
+    return f"{math.floor(lat / REGION_DEGREES)}:{math.floor(lon / REGION_DEGREES)}"
+
+def _band_keys(sig, region):
+    return [f"{region}|{band}:{zlib.crc32(encode_signature(sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]).encode()):08x}"
+            for band in range(LSH_BANDS)]
+
+def bucket_keys(sig, lat, lon):
+    """The buckets a complaint at (lat, lon) is filed under"""
+    return _band_keys(sig, _region(float(lat), float(lon)))
+
+def query_keys(sig, lat, lon, radius_meters):
+    """Buckets to look up for complaints within radius_meters of (lat, lon)"""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(float(lat), float(lon), radius_meters)
+    regions = [f"{i}:{j}"
+               for i in range(math.floor(min_lat / REGION_DEGREES), math.floor(max_lat / REGION_DEGREES) + 1)
+               for j in range(math.floor(min_lon / REGION_DEGREES), math.floor(max_lon / REGION_DEGREES) + 1)]
+    return [key for region in regions for key in _band_keys(sig, region)]
+
+def index_entries(complaint):
+    """(encoded signature, bucket keys) to store for an open complaint, or None if it has no text or cell"""
+    if not complaint.get('geo_cell'):
+        return None
+    sig = signature(complaint.get('description_original') or complaint.get('description'))
+    if not sig:
+        return None
+    return encode_signature(sig), bucket_keys(sig, complaint['latitude'], complaint['longitude'])
+
+def index_complaint(cursor, conn, complaint):
+    """
+    (Re)file a complaint in the text index: added while it is open (has a
+    geo_cell), removed once closed. Call inside the transaction that changes it.
+    """
+    cursor.execute(format_sql('DELETE FROM complaint_lsh_buckets WHERE complaint_id = ?', conn), (complaint['id'],))
+    cursor.execute(format_sql('DELETE FROM complaint_text_signatures WHERE complaint_id = ?', conn), (complaint['id'],))
+    entries = index_entries(complaint)
+    if not entries:
+        return
+    encoded, keys = entries
+    cursor.execute(format_sql('INSERT INTO complaint_text_signatures (complaint_id, signature) VALUES (?, ?)', conn),
+                   (complaint['id'], encoded))
+    cursor.executemany(format_sql('INSERT INTO complaint_lsh_buckets (bucket, complaint_id) VALUES (?, ?)', conn),
+                       [(key, complaint['id']) for key in keys])
+
+def text_candidates(cursor, conn, sig, lat, lon, radius_meters, columns):
+    """Open complaints sharing an LSH bucket with sig near (lat, lon); rows carry 'signature'"""
+    keys = query_keys(sig, lat, lon, radius_meters)
+    select = ', '.join(f"c.{column}" for column in columns)
+    cursor.execute(format_sql(f'''SELECT DISTINCT {select}, s.signature FROM complaint_lsh_buckets b
+                                  JOIN complaints c ON c.id = b.complaint_id
+                                  JOIN complaint_text_signatures s ON s.complaint_id = b.complaint_id
+                                  WHERE b.bucket IN ({','.join('?' * len(keys))}) AND c.geo_cell IS NOT NULL''', conn),
+                   tuple(keys))
+    return [dict(row) for row in cursor.fetchall()]
+
+def signatures_for(cursor, conn, complaint_ids):
+    """{complaint_id: signature} for the given ids that are in the index"""
+    if not complaint_ids:
+        return {}
+    cursor.execute(format_sql(f'''SELECT complaint_id, signature FROM complaint_text_signatures
+                                  WHERE complaint_id IN ({','.join('?' * len(complaint_ids))})''', conn),
+                   tuple(complaint_ids))
+    return {row['complaint_id']: decode_signature(row['signature']) for row in cursor.fetchall()}
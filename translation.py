@@ -0,0 +1,141 @@
+"""
+Translation Service
+Cached, batched wrapper around deep-translator's GoogleTranslator.
+
+Results are cached per (source, target, text) in a TieredCache, one
+translator object is kept per language pair (per thread, since the
+translator is not thread-safe), and cache misses are packed into
+newline-joined requests so many short strings cost a single round-trip.
+"""
+
+import threading
+
+from cache import make_key
+
+try:
+    from deep_translator import GoogleTranslator
+    TRANSLATION_AVAILABLE = True
+except ImportError:
+    print("⚠️  deep-translator not installed. Run: pip install deep-translator")
+    TRANSLATION_AVAILABLE = False
+
+# Google's web endpoint rejects queries over 5000 characters
+MAX_BATCH_CHARS = 4500
+MAX_BATCH_STRINGS = 50
+BATCH_SEPARATOR = '\n'
+
+class TranslationService:
+    """translate() / translate_many() with an LRU + database cache in front of Google"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'batched_requests': 0, 'strings_translated': 0,
+                       'batch_fallbacks': 0, 'errors': 0}
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def _translator(self, from_lang, to_lang):
+        translators = getattr(self._local, 'translators', None)
+        if translators is None:
+            translators = self._local.translators = {}
+        pair = (from_lang, to_lang)
+        if pair not in translators:
+            translators[pair] = GoogleTranslator(source=from_lang, target=to_lang)
+        return translators[pair]
+
+    @staticmethod
+    def cache_key(text, from_lang, to_lang):
+        return make_key(from_lang, to_lang, text)
+
+    def translate(self, text, from_lang='auto', to_lang='en'):
+        return self.translate_many([text], from_lang, to_lang)[0]
+
+    def translate_many(self, texts, from_lang='auto', to_lang='en'):
+        """Translations in input order; strings that cannot be translated are returned unchanged"""
+        results = list(texts)
+        if not TRANSLATION_AVAILABLE or from_lang == to_lang:
+            return results
+
+        wanted = {}  # stripped text -> input positions
+        for i, text in enumerate(texts):
+            if text and text.strip():
+                wanted.setdefault(text.strip(), []).append(i)
+        if not wanted:
+            return results
+
+        keys = {text: self.cache_key(text, from_lang, to_lang) for text in wanted}
+        cached = self.cache.get_many(keys.values())
+        misses = [text for text in wanted if keys[text] not in cached]
+
+        translated = {text: cached[keys[text]] for text in wanted if keys[text] in cached}
+        for batch in self._batches(misses):
+            batch_translations = self._translate_batch(batch, from_lang, to_lang)
+            translated.update(batch_translations)
+            self.cache.set_many({keys[text]: result for text, result in batch_translations.items()})
+
+        for text, positions in wanted.items():
+            if text in translated:
+                for i in positions:
+                    results[i] = translated[text]
+        return results
+
+    @staticmethod
+    def _batches(texts):
+        """Group newline-free strings into requests under the size limit; others go alone"""
+        batch, size = [], 0
+        for text in texts:
+            if BATCH_SEPARATOR in text:
+                yield [text]
+                continue
+            if batch and (size + len(text) + 1 > MAX_BATCH_CHARS or len(batch) >= MAX_BATCH_STRINGS):
+                yield batch
+                batch, size = [], 0
+            batch.append(text)
+            size += len(text) + 1
+        if batch:
+            yield batch
+
+    def _translate_one(self, text, from_lang, to_lang):
+        self._count('requests')
+        try:
+            result = self._translator(from_lang, to_lang).translate(text)
+        except Exception as e:
+            print(f"Translation error: {e}")
+            self._count('errors')
+            return None
+        self._count('strings_translated')
+        return result or None
+
+    def _translate_batch(self, batch, from_lang, to_lang):
+        """{text: translation} for the strings that translated successfully"""
+        if len(batch) > 1:
+            self._count('requests')
+            self._count('batched_requests')
+            try:
+                joined = self._translator(from_lang, to_lang).translate(BATCH_SEPARATOR.join(batch))
+                parts = [p.strip() for p in (joined or '').split(BATCH_SEPARATOR)]
+                if len(parts) == len(batch) and all(parts):
+                    self._count('strings_translated', len(batch))
+                    return dict(zip(batch, parts))
+            except Exception as e:
+                print(f"Translation error: {e}")
+                self._count('errors')
+            # Lines were merged or split by the translator: fall back to one request per string
+            self._count('batch_fallbacks')
+
+        results = {}
+        for text in batch:
+            result = self._translate_one(text, from_lang, to_lang)
+            if result is not None:
+                results[text] = result
+        return results
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['cache'] = self.cache.stats()
+        return stats